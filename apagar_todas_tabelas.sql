@@ -8,6 +8,11 @@
 -- Remove as tabelas na ordem correta (respeitando dependências de foreign keys)
 -- Começando pelas tabelas de relacionamento many-to-many
 
+DROP TABLE IF EXISTS finance_daily CASCADE;
+DROP TABLE IF EXISTS finance_monthly CASCADE;
+DROP TABLE IF EXISTS dashboard_snapshot CASCADE;
+DROP TABLE IF EXISTS counters CASCADE;
+DROP TABLE IF EXISTS stock_checkpoints CASCADE;
 DROP TABLE IF EXISTS service_sale_history CASCADE;
 DROP TABLE IF EXISTS service_order_services CASCADE;
 DROP TABLE IF EXISTS service_order_parts CASCADE;
@@ -44,6 +49,7 @@ DROP SEQUENCE IF EXISTS service_orders_id_seq CASCADE;
 DROP SEQUENCE IF EXISTS purchases_id_seq CASCADE;
 DROP SEQUENCE IF EXISTS purchase_items_id_seq CASCADE;
 DROP SEQUENCE IF EXISTS service_sale_history_id_seq CASCADE;
+DROP SEQUENCE IF EXISTS stock_checkpoints_id_seq CASCADE;
 
 -- Mensagem de confirmação
 DO $$ 
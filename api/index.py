@@ -15,6 +15,11 @@ if root_dir not in sys.path:
 if os.getcwd() != root_dir:
     os.chdir(root_dir)
 
+# Na Vercel cada instância é uma função serverless: sem create_all na
+# importação e engine criado só na primeira requisição (ver database.py).
+# O esquema é criado/atualizado com: python migrate.py
+os.environ.setdefault("SERVERLESS", "true")
+
 # Importa a aplicação FastAPI
 from main import app
 
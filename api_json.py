@@ -0,0 +1,195 @@
+"""
+Camada de resposta JSON das listagens grandes (/api/ordens-servico e
+/api/compras).
+
+Antes cada rota carregava objetos ORM, montava os dicionários à mão (float()
+em cada Numeric, isoformat() em cada data) e o FastAPI ainda percorria o
+resultado com o jsonable_encoder. Aqui:
+
+- as consultas projetam só as colunas usadas, sem objetos ORM nem identity
+  map; nulos monetários viram 0 no próprio SQL (coalesce)
+- o formato da resposta é um TypedDict de schemas.py, e o serializador do
+  pydantic-core (Rust) é compilado uma vez, na importação; ele converte
+  Decimal e datetime sozinho
+- a rota devolve o Response com os bytes prontos, sem reprocessamento
+
+Mede com benchmarks/bench_json.py.
+"""
+from typing import List
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import desc, func, select
+
+import models
+from schemas import CompraResumo, OrdemServicoResumo
+
+
+class Serializador:
+    """Serializador de um tipo de resposta, montado uma vez"""
+
+    def __init__(self, tipo):
+        self._adaptador = TypeAdapter(tipo)
+
+    def json(self, dados):
+        return self._adaptador.dump_json(dados)
+
+    def resposta(self, dados, status_code=200, headers=None):
+        return Response(
+            content=self.json(dados),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+        )
+
+
+serializador_ordens = Serializador(List[OrdemServicoResumo])
+serializador_compras = Serializador(List[CompraResumo])
+
+
+# =========================================
+# ORDENS DE SERVIÇO
+# =========================================
+
+def ler_ordens_servico(db, status=None):
+    """Ordens (mais recentes primeiro) com peças e serviços: três consultas de colunas"""
+    ordem = models.ServiceOrder
+    peca = models.RepairPart
+    servico = models.Service
+    op = models.service_order_parts
+    os_ = models.service_order_services
+    filtro = [ordem.status == status] if status else []
+
+    resultado = []
+    por_id = {}
+    for linha in db.execute(
+        select(
+            ordem.id, ordem.order_number, ordem.client_name, ordem.client_phone, ordem.client_email,
+            ordem.device_model, ordem.service_description, ordem.status, ordem.total_value, ordem.notes,
+            ordem.created_at, ordem.completed_at,
+        )
+        .where(*filtro)
+        .order_by(desc(ordem.created_at))
+    ):
+        item = dict(linha._mapping, parts=[], services=[])
+        resultado.append(item)
+        por_id[linha.id] = item
+    if not resultado:
+        return resultado
+
+    pecas = (
+        select(
+            op.c.service_order_id, peca.id, peca.device_model, peca.part_name,
+            func.coalesce(peca.price, 0).label("price"), func.coalesce(op.c.quantity, 1).label("quantity"),
+        )
+        .join(peca, peca.id == op.c.repair_part_id)
+    )
+    servicos = (
+        select(
+            os_.c.service_order_id, servico.id, servico.name, servico.description,
+            func.coalesce(servico.price, 0).label("price"), func.coalesce(os_.c.quantity, 1).label("quantity"),
+        )
+        .join(servico, servico.id == os_.c.service_id)
+    )
+    if filtro:
+        pecas = pecas.join(ordem, ordem.id == op.c.service_order_id).where(*filtro)
+        servicos = servicos.join(ordem, ordem.id == os_.c.service_order_id).where(*filtro)
+
+    # Uma ordem gravada depois da primeira consulta fica de fora (por_id.get)
+    for linha in db.execute(pecas):
+        destino = por_id.get(linha.service_order_id)
+        if destino is None:
+            continue
+        destino["parts"].append({
+            "id": linha.id,
+            "device_model": linha.device_model,
+            "part_name": linha.part_name or "N/A",
+            "price": linha.price,
+            "quantity": linha.quantity,
+        })
+    for linha in db.execute(servicos):
+        destino = por_id.get(linha.service_order_id)
+        if destino is None:
+            continue
+        destino["services"].append({
+            "id": linha.id,
+            "name": linha.name,
+            "description": linha.description,
+            "price": linha.price,
+            "quantity": linha.quantity,
+        })
+
+    # Ordens sem valor gravado: soma das peças e serviços
+    for item in resultado:
+        if not item["total_value"]:
+            item["total_value"] = sum(p["price"] * p["quantity"] for p in item["parts"]) + \
+                sum(s["price"] * s["quantity"] for s in item["services"])
+    return resultado
+
+
+# =========================================
+# COMPRAS
+# =========================================
+
+def ler_compras(db, filtro=(), limite=None, deslocamento=0):
+    """
+    Compras (mais recentes primeiro) com os itens: duas consultas de colunas.
+    Com limite, só uma página (a página de finanças) e só os itens dela.
+    """
+    compra = models.Purchase
+    item_t = models.PurchaseItem
+    peca = models.RepairPart
+
+    consulta = (
+        select(
+            compra.id, compra.purchase_number, compra.supplier_name,
+            func.coalesce(compra.shipping_cost, 0).label("shipping_cost"),
+            func.coalesce(compra.total_value, 0).label("total_value"),
+            compra.notes, compra.created_at,
+        )
+        .where(*filtro)
+        .order_by(desc(compra.created_at), desc(compra.id))
+    )
+    if limite is not None:
+        consulta = consulta.limit(limite).offset(deslocamento)
+
+    resultado = []
+    por_id = {}
+    for linha in db.execute(consulta):
+        item = dict(linha._mapping, items=[])
+        resultado.append(item)
+        por_id[linha.id] = item
+    if not resultado:
+        return resultado
+
+    itens = (
+        select(
+            item_t.id, item_t.purchase_id, item_t.repair_part_id, item_t.quantity,
+            func.coalesce(item_t.unit_cost, 0).label("unit_cost"),
+            func.coalesce(item_t.total_cost, 0).label("total_cost"),
+            peca.id.label("peca_id"), peca.device_model, peca.part_name,
+        )
+        .outerjoin(peca, peca.id == item_t.repair_part_id)
+        .where(item_t.purchase_id.isnot(None))
+    )
+    if limite is not None:
+        itens = itens.where(item_t.purchase_id.in_(list(por_id)))
+
+    for linha in db.execute(itens):
+        compra_item = por_id.get(linha.purchase_id)
+        if compra_item is None:
+            continue
+        tem_peca = linha.peca_id is not None
+        compra_item["items"].append({
+            "id": linha.id,
+            "repair_part_id": linha.repair_part_id,
+            "repair_part": {
+                "id": linha.peca_id,
+                "device_model": linha.device_model if tem_peca else "N/A",
+                "part_name": (linha.part_name or "N/A") if tem_peca else "N/A",
+            },
+            "quantity": linha.quantity,
+            "unit_cost": linha.unit_cost,
+            "total_cost": linha.total_cost,
+        })
+    return resultado
@@ -0,0 +1,97 @@
+"""
+Benchmark: vazão de requisições concorrentes com sessão síncrona vs assíncrona.
+
+Simula N requisições concorrentes no mesmo event loop (como um worker do
+uvicorn) executando a consulta de GET /api/produtos:
+
+- antes:  Session síncrona chamada dentro de uma corrotina (bloqueia o loop)
+- depois: AsyncSession com await (o loop atende outras requisições enquanto espera)
+
+Uso:
+    python benchmarks/bench_async_db.py --requisicoes 200 --concorrencia 50
+    python benchmarks/bench_async_db.py --atraso-ms 20   # simula consulta lenta (pg_sleep, só Postgres)
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+
+import database
+import models
+
+
+def consulta_produtos():
+    return select(models.Product).options(joinedload(models.Product.variations))
+
+
+def consulta_atraso(atraso_ms):
+    return text("SELECT pg_sleep(:s)").bindparams(s=atraso_ms / 1000)
+
+
+async def requisicao_sync(atraso_ms):
+    db = database.SessionLocal()
+    try:
+        if atraso_ms:
+            db.execute(consulta_atraso(atraso_ms))
+        db.execute(consulta_produtos()).unique().scalars().all()
+    finally:
+        db.close()
+
+
+async def requisicao_async(atraso_ms):
+    async with database.AsyncSessionLocal() as db:
+        if atraso_ms:
+            await db.execute(consulta_atraso(atraso_ms))
+        result = await db.execute(consulta_produtos())
+        result.unique().scalars().all()
+
+
+async def rodar(nome, funcao, requisicoes, concorrencia, atraso_ms):
+    semaforo = asyncio.Semaphore(concorrencia)
+    latencias = []
+
+    async def uma():
+        async with semaforo:
+            inicio = time.perf_counter()
+            await funcao(atraso_ms)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    # Aquecimento (abre as conexões do pool)
+    await asyncio.gather(*(funcao(atraso_ms) for _ in range(min(concorrencia, 5))))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(requisicoes)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(f"{nome:<8} {requisicoes / total:>10.1f} req/s   "
+          f"p50 {statistics.median(latencias):>8.1f} ms   p95 {p95:>8.1f} ms   total {total:.2f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--atraso-ms", type=float, default=0, help="pg_sleep extra por requisição (Postgres)")
+    args = parser.parse_args()
+
+    if not database.DATABASE_AVAILABLE or not database.ASYNC_DATABASE_AVAILABLE:
+        print("[ERRO] Configure DATABASE_URL e instale o driver assincrono (asyncpg)")
+        sys.exit(1)
+
+    print(f"{args.requisicoes} requisicoes, concorrencia {args.concorrencia}, atraso {args.atraso_ms} ms")
+    await rodar("antes", requisicao_sync, args.requisicoes, args.concorrencia, args.atraso_ms)
+    await rodar("depois", requisicao_async, args.requisicoes, args.concorrencia, args.atraso_ms)
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Benchmark: cold start do ponto de entrada da Vercel (api/index.py).
+
+Cada amostra roda em um processo Python novo (como uma instância fria) e mede:
+
+- importacao:        tempo para importar api/index.py (FastAPI, modelos, rotas...)
+- primeira_resposta: tempo da importação até a primeira resposta completa
+
+Compara o modo normal (create_all e engine na importação) com o modo
+serverless (sem create_all, engine criado na primeira requisição, jinja2 e
+drivers carregados sob demanda). A requisição é enviada direto para o app
+ASGI, sem servidor HTTP no meio.
+
+Uso:
+    python benchmarks/bench_cold_start.py --amostras 10
+    python benchmarks/bench_cold_start.py --rota /api/produtos --rota /
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir_no_processo(rota):
+    """Executado no processo filho: importa o app e faz uma requisição"""
+    inicio = time.perf_counter()
+    sys.path.insert(0, os.path.join(RAIZ, "api"))
+    from index import app
+    importado = time.perf_counter()
+
+    caminho, _, query = rota.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": caminho,
+        "raw_path": caminho.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 80),
+    }
+    resposta = {"status": None, "bytes": 0}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensagem):
+        if mensagem["type"] == "http.response.start":
+            resposta["status"] = mensagem["status"]
+        elif mensagem["type"] == "http.response.body":
+            resposta["bytes"] += len(mensagem.get("body", b""))
+
+    asyncio.run(app(scope, receive, send))
+    fim = time.perf_counter()
+
+    print(json.dumps({
+        "importacao_ms": (importado - inicio) * 1000,
+        "primeira_resposta_ms": (fim - inicio) * 1000,
+        "status": resposta["status"],
+        "bytes": resposta["bytes"],
+    }))
+
+
+def amostra(serverless, rota):
+    """Roda um processo novo e retorna as medidas do filho"""
+    env = dict(os.environ, SERVERLESS="true" if serverless else "false", PYTHONDONTWRITEBYTECODE="1")
+    saida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--filho", "--rota", rota],
+        cwd=RAIZ, env=env, capture_output=True, text=True, timeout=120,
+    )
+    linhas = [l for l in saida.stdout.splitlines() if l.startswith("{")]
+    if saida.returncode != 0 or not linhas:
+        raise RuntimeError(f"Processo filho falhou:\n{saida.stdout}\n{saida.stderr}")
+    return json.loads(linhas[-1])
+
+
+def resumir(valores):
+    return f"mediana {statistics.median(valores):7.1f} ms  min {min(valores):7.1f}  max {max(valores):7.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--amostras", type=int, default=5)
+    parser.add_argument("--rota", action="append", help="rota GET a medir (padrão /api/produtos)")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    rotas = args.rota or ["/api/produtos"]
+
+    if args.filho:
+        medir_no_processo(rotas[0])
+        return
+
+    for rota in rotas:
+        print(f"\nRota: {rota}  ({args.amostras} processos por modo)")
+        for serverless in (False, True):
+            resultados = [amostra(serverless, rota) for _ in range(args.amostras)]
+            nome = "serverless" if serverless else "normal"
+            status = sorted({r["status"] for r in resultados})
+            print(f"  {nome:<10} importacao        {resumir([r['importacao_ms'] for r in resultados])}")
+            print(f"  {'':<10} primeira resposta {resumir([r['primeira_resposta_ms'] for r in resultados])}  status {status}")
+
+
+if __name__ == "__main__":
+    main()
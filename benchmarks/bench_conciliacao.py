@@ -0,0 +1,157 @@
+"""
+Benchmark: conciliação de saldos sobre um histórico grande.
+
+Gera (só Postgres, com generate_series) um produto de teste com N variações e
+M movimentações com a cadeia previous_stock/new_stock correta, injeta
+divergências conhecidas e roda reconciliation.conciliar(), conferindo:
+
+- tempo total (meta: poucos segundos para 1M de movimentações)
+- todas as divergências injetadas foram encontradas, e só elas
+
+Divergências injetadas: saldo editado sem movimentação (saldo_divergente e
+soma_divergente) e previous_stock adulterado no meio da cadeia
+(quebra_cadeia e conta_errada).
+
+Rode contra um banco de TESTE. As variações são inseridas direto por SQL
+(fora do snapshot do dashboard); use --limpar para apagá-las ao final.
+
+Uso:
+    python benchmarks/bench_conciliacao.py --variacoes 2000 --movimentos 1000000 --limpar
+    python benchmarks/bench_conciliacao.py --processos 1 --limpar   # sem paralelismo, para comparar
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+import database
+import reconciliation
+
+PREFIXO = "BENCH-CONC-"
+
+
+def gerar_dados(conexao, variacoes, movimentos, divergencias):
+    por_variacao = max(1, movimentos // variacoes)
+    produto_id = conexao.execute(text(
+        "INSERT INTO products (name, category) VALUES ('Bench Conciliacao', 'Bench') RETURNING id"
+    )).scalar()
+    conexao.execute(text("""
+        INSERT INTO color_variations (product_id, color_name, full_sku, variation_price, cost_price, available_stock, min_stock_alert)
+        SELECT :produto, 'Cor ' || n, :prefixo || lpad(n::text, 7, '0'), 10, 5, 0, 0
+        FROM generate_series(1, :variacoes) n
+    """), {"produto": produto_id, "prefixo": PREFIXO, "variacoes": variacoes})
+
+    # Cadeia correta: new_stock = saldo inicial + soma acumulada dos deltas
+    conexao.execute(text("""
+        WITH sorteio AS (
+            SELECT cv.id AS variation_id, n,
+                   CASE WHEN random() < 0.5 THEN 'entrada' ELSE 'saida' END AS tipo,
+                   (1 + floor(random() * 5))::int AS quantidade
+            FROM color_variations cv CROSS JOIN generate_series(1, :por_variacao) n
+            WHERE cv.product_id = :produto
+        ), acumulado AS (
+            SELECT *, 100000 + sum(CASE WHEN tipo = 'entrada' THEN quantidade ELSE -quantidade END)
+                      OVER (PARTITION BY variation_id ORDER BY n) AS novo
+            FROM sorteio
+        )
+        INSERT INTO stock_movements (variation_id, movement_type, quantity, previous_stock, new_stock, reason, created_at)
+        SELECT variation_id, tipo, quantidade,
+               novo - CASE WHEN tipo = 'entrada' THEN quantidade ELSE -quantidade END, novo,
+               'bench', now() - make_interval(secs => :por_variacao - n)
+        FROM acumulado ORDER BY variation_id, n
+    """), {"produto": produto_id, "por_variacao": por_variacao})
+    conexao.execute(text("""
+        UPDATE color_variations cv SET available_stock = ultimo.new_stock
+        FROM (SELECT DISTINCT ON (variation_id) variation_id, new_stock
+              FROM stock_movements sm JOIN color_variations v ON v.id = sm.variation_id
+              WHERE v.product_id = :produto ORDER BY variation_id, sm.id DESC) ultimo
+        WHERE cv.id = ultimo.variation_id
+    """), {"produto": produto_id})
+
+    # Divergências conhecidas: metade saldo editado, metade cadeia adulterada
+    editados = conexao.execute(text("""
+        UPDATE color_variations SET available_stock = available_stock + 1
+        WHERE id IN (SELECT id FROM color_variations WHERE product_id = :produto ORDER BY id LIMIT :k)
+        RETURNING id
+    """), {"produto": produto_id, "k": divergencias // 2}).scalars().all()
+    adulterados = conexao.execute(text("""
+        UPDATE stock_movements SET previous_stock = previous_stock + 7
+        WHERE id IN (
+            SELECT DISTINCT ON (sm.variation_id) sm.id FROM stock_movements sm
+            JOIN color_variations cv ON cv.id = sm.variation_id
+            WHERE cv.product_id = :produto ORDER BY sm.variation_id DESC, sm.id DESC
+            LIMIT :k
+        ) RETURNING id
+    """), {"produto": produto_id, "k": divergencias - divergencias // 2}).scalars().all()
+    conexao.execute(text("ANALYZE stock_movements"))
+    conexao.execute(text("ANALYZE color_variations"))
+    return produto_id, set(editados), set(adulterados), por_variacao * variacoes
+
+
+def limpar(conexao, produto_id):
+    conexao.execute(text(
+        "DELETE FROM stock_movements WHERE variation_id IN (SELECT id FROM color_variations WHERE product_id = :p)"
+    ), {"p": produto_id})
+    conexao.execute(text("DELETE FROM color_variations WHERE product_id = :p"), {"p": produto_id})
+    conexao.execute(text("DELETE FROM products WHERE id = :p"), {"p": produto_id})
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variacoes", type=int, default=2000)
+    parser.add_argument("--movimentos", type=int, default=1_000_000)
+    parser.add_argument("--divergencias", type=int, default=20)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    engine = database.get_engine()
+    if engine is None or engine.dialect.name != "postgresql":
+        print("[ERRO] Este benchmark precisa de um banco Postgres configurado")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    with engine.begin() as conexao:
+        produto_id, editados, adulterados, total = gerar_dados(
+            conexao, args.variacoes, args.movimentos, args.divergencias
+        )
+    print(f"Gerados {args.variacoes} variacoes e {total} movimentacoes em {time.perf_counter() - inicio:.1f}s")
+    engine.dispose()
+
+    try:
+        inicio = time.perf_counter()
+        resumo, divergencias = reconciliation.conciliar(database.SQLALCHEMY_DATABASE_URL, args.processos)
+        duracao = time.perf_counter() - inicio
+
+        do_teste = [d for d in divergencias if (d["full_sku"] or "").startswith(PREFIXO)]
+        saldo = {d["variation_id"] for d in do_teste if d["tipo"] == "saldo_divergente"}
+        soma = {d["variation_id"] for d in do_teste if d["tipo"] == "soma_divergente"}
+        quebras = {d["movimento_id"] for d in do_teste if d["tipo"] == "quebra_cadeia"}
+        contas = {d["movimento_id"] for d in do_teste if d["tipo"] == "conta_errada"}
+        outros = [d for d in do_teste if d["tipo"] not in ("saldo_divergente", "soma_divergente", "quebra_cadeia", "conta_errada")]
+
+        print(f"\nConciliacao: {resumo['movimentos']} movimentacoes, {resumo['processos']} processos, "
+              f"{resumo['faixas']} faixas: {duracao:.2f}s ({resumo['movimentos'] / duracao:,.0f} movimentacoes/s)")
+        print(f"  saldo editado injetado: {len(editados)}  encontrados (saldo/soma): {len(saldo)}/{len(soma)}")
+        print(f"  cadeia adulterada injetada: {len(adulterados)}  encontrados (quebra/conta): {len(quebras)}/{len(contas)}")
+
+        ok = (
+            saldo == editados and soma == editados
+            and quebras == adulterados and contas == adulterados and not outros
+        )
+    finally:
+        if args.limpar:
+            with database.get_engine().begin() as conexao:
+                limpar(conexao, produto_id)
+            print("\nDados de teste apagados.")
+
+    print("\n[OK] Todas as divergencias encontradas" if ok else "\n[ERRO] Divergencias nao conferem")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
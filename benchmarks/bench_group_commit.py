@@ -0,0 +1,221 @@
+"""
+Benchmark: commit por requisição vs commit em grupo nas movimentações.
+
+Gera carga em malha aberta (as requisições chegam no ritmo pedido,
+independente de as anteriores terem terminado, como clientes de verdade)
+chamando a mesma função da rota POST /api/movimentacoes, em cada taxa
+(padrão 50, 200 e 1000 req/s) e em cada modo:
+
+- direto: cada requisição abre a sua transação e faz o seu commit
+- grupo:  a fila de group_commit.py junta as requisições e faz um commit por lote
+
+Para cada combinação mostra vazão obtida, latência p50/p95/p99 (medida a
+partir do horário previsto de chegada), commits no banco e erros, e no fim
+confere que nenhum saldo ficou diferente da soma das movimentações aceitas.
+
+Um banco local responde em microssegundos; use --rtt-ms para simular a ida e
+volta até um banco remoto (ex: Supabase), somada a cada instrução e a cada
+commit.
+
+Rode contra um banco de TESTE. Com --limpar o produto de teste e seu
+histórico são apagados ao final.
+
+Uso:
+    python benchmarks/bench_group_commit.py --rtt-ms 20 --segundos 5 --limpar
+    python benchmarks/bench_group_commit.py --taxas 200 --modos grupo --janela-ms 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import database
+import main
+import models
+from group_commit import fila_movimentacoes
+from schemas import MovementCreate, ProdutoCreate, CorCreate
+
+
+def criar_produto_teste(cores):
+    db = database.SessionLocal()
+    try:
+        resposta = main.criar_produto(
+            ProdutoCreate(
+                name=f"Bench Group Commit {int(time.time())}",
+                category="Bench",
+                colors=[
+                    CorCreate(color_name=f"Cor {i}", price=10, cost=5, stock=1_000_000, min_stock_alert=0)
+                    for i in range(cores)
+                ],
+            ),
+            db,
+        )
+        return resposta["id"], [v["sku"] for v in resposta["variacoes"]]
+    finally:
+        db.close()
+
+
+def instalar_rtt(engine, rtt_ms, commits):
+    """Conta commits e, se pedido, soma o RTT simulado a cada instrução e commit"""
+    atraso = rtt_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if atraso:
+            time.sleep(atraso)
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        commits.append(1)
+        if atraso:
+            time.sleep(atraso)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def rodar(taxa, segundos, skus, threads, aceitas, commits):
+    total = int(taxa * segundos)
+    aleatorio = random.Random(taxa)
+    pedidos = [
+        MovementCreate(
+            sku=aleatorio.choice(skus),
+            movement_type=aleatorio.choice(["entrada", "saida"]),
+            quantity=aleatorio.randint(1, 5),
+            reason="bench",
+        )
+        for _ in range(total)
+    ]
+    latencias = []
+    erros = []
+    lock = threading.Lock()
+
+    def requisicao(pedido, previsto):
+        db = database.SessionLocal()
+        try:
+            resposta = main.criar_movimentacao(pedido, db)
+        finally:
+            db.close()
+        fim = time.perf_counter()
+        with lock:
+            latencias.append((fim - previsto) * 1000)
+            if isinstance(resposta, dict):
+                aceitas.append((pedido.sku, pedido.quantity if pedido.movement_type == "entrada" else -pedido.quantity))
+            else:
+                erros.append(resposta.body)
+
+    commits_antes = len(commits)
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for i, pedido in enumerate(pedidos):
+            previsto = inicio + i / taxa
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            executor.submit(requisicao, pedido, previsto)
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "vazao": len(latencias) / duracao,
+        "p50": percentil(latencias, 0.50),
+        "p95": percentil(latencias, 0.95),
+        "p99": percentil(latencias, 0.99),
+        "media": statistics.mean(latencias) if latencias else 0.0,
+        "commits": len(commits) - commits_antes,
+        "erros": len(erros),
+        "exemplo_erro": erros[0] if erros else None,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taxas", type=int, nargs="+", default=[50, 200, 1000], help="requisições por segundo")
+    parser.add_argument("--modos", nargs="+", choices=["direto", "grupo"], default=["direto", "grupo"])
+    parser.add_argument("--segundos", type=float, default=5.0, help="duração de cada rodada")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="ida e volta simulada até o banco")
+    parser.add_argument("--janela-ms", type=float, default=None, help="janela da fila (padrão: MOVIMENTACOES_JANELA_MS)")
+    parser.add_argument("--threads", type=int, default=200, help="threads atendendo requisições (como o threadpool do uvicorn)")
+    parser.add_argument("--skus", type=int, default=20, help="SKUs distintos disputados")
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    engine = database.get_engine()
+    if engine is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    produto_id, skus = criar_produto_teste(args.skus)
+    commits = []
+    instalar_rtt(engine, args.rtt_ms, commits)
+    if args.janela_ms is not None:
+        fila_movimentacoes.janela = args.janela_ms / 1000
+
+    aceitas = []
+    resultados = []
+    try:
+        for taxa in args.taxas:
+            for modo in args.modos:
+                if modo == "grupo":
+                    fila_movimentacoes.iniciar()
+                try:
+                    resultado = rodar(taxa, args.segundos, skus, args.threads, aceitas, commits)
+                finally:
+                    fila_movimentacoes.parar()
+                resultados.append((taxa, modo, resultado))
+                print(f"  {taxa:>5} req/s  {modo:<6}  vazao {resultado['vazao']:7.0f}/s  "
+                      f"p50 {resultado['p50']:8.1f} ms  p95 {resultado['p95']:8.1f} ms  p99 {resultado['p99']:8.1f} ms  "
+                      f"commits {resultado['commits']:>6}  erros {resultado['erros']}")
+
+        print(f"\nRTT simulado: {args.rtt_ms} ms  |  pool: {database.get_engine().pool.status()}")
+        print(f"{'taxa':>7}  {'modo':<6}  {'vazao/s':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'commits':>8}  {'mov/commit':>10}  erros")
+        for taxa, modo, r in resultados:
+            por_commit = (taxa * args.segundos) / r["commits"] if r["commits"] else 0
+            print(f"{taxa:>7}  {modo:<6}  {r['vazao']:>8.0f}  {r['p50']:>8.1f}  {r['p95']:>8.1f}  {r['p99']:>8.1f}  "
+                  f"{r['commits']:>8}  {por_commit:>10.1f}  {r['erros']}")
+            if r["exemplo_erro"]:
+                print(f"         exemplo de erro: {r['exemplo_erro']!r}")
+
+        # Nenhuma movimentação aceita pode ter sido perdida
+        esperado = {sku: 1_000_000 for sku in skus}
+        for sku, delta in aceitas:
+            esperado[sku] += delta
+        db = database.SessionLocal()
+        try:
+            saldos = dict(
+                db.query(models.ColorVariation.full_sku, models.ColorVariation.available_stock)
+                .filter(models.ColorVariation.full_sku.in_(skus))
+                .all()
+            )
+        finally:
+            db.close()
+        ok = saldos == esperado
+    finally:
+        if args.limpar:
+            db = database.SessionLocal()
+            try:
+                ids = [v.id for v in db.query(models.ColorVariation.id).filter(models.ColorVariation.full_sku.in_(skus))]
+                db.query(models.StockMovement).filter(models.StockMovement.variation_id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                main.excluir_produto(produto_id, db)
+            finally:
+                db.close()
+            print("\nProduto de teste apagado.")
+
+    print("\n[OK] Saldos conferem com as movimentações aceitas" if ok else "\n[ERRO] Saldos divergentes")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,118 @@
+"""
+Benchmark: importação de produtos em massa (POST /api/produtos/import).
+
+Gera uma planilha CSV de teste (N linhas, 5 cores por produto, SKUs
+informados) e a envia em pedaços de 64 KB, como um upload, duas vezes:
+
+- primeira: cria produtos e variações
+- segunda: os mesmos SKUs, ou seja, só atualizações (upsert)
+
+Mostra o tempo de cada rodada (meta: 10 mil linhas em menos de 10 s) e
+confere que o snapshot do dashboard continua igual ao cálculo completo.
+
+Rode contra um banco de TESTE. Com --limpar os produtos de teste são
+apagados ao final.
+
+Uso:
+    python benchmarks/bench_importacao.py --linhas 10000 --limpar
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import database
+import main
+import models
+from dashboard import ler_metricas, calcular_metricas
+
+PREFIXO = "BENCH-IMP-"
+CORES = ["Azul", "Preto", "Rosa", "Verde", "Branco"]
+
+
+def gerar_csv(linhas):
+    texto = ["produto;fabricante;categoria;cor;sku;preco;custo;estoque;minimo"]
+    for i in range(linhas):
+        texto.append(f"Bench Importacao {i // len(CORES)};Bench;Capas;{CORES[i % len(CORES)]};"
+                     f"{PREFIXO}{i:07d};19,90;8,50;{i % 7};2")
+    return ("\n".join(texto) + "\n").encode("utf-8")
+
+
+def enviar(cliente, corpo):
+    def pedacos():
+        for inicio in range(0, len(corpo), 65536):
+            yield corpo[inicio:inicio + 65536]
+
+    inicio = time.perf_counter()
+    resposta = cliente.post("/api/produtos/import", content=pedacos(), headers={"content-type": "text/csv"})
+    return resposta, time.perf_counter() - inicio
+
+
+def metricas_conferem(db):
+    """Snapshot x cálculo completo (a margem média acumula arredondamento de 6 casas por SKU)"""
+    snapshot, completo = ler_metricas(db), calcular_metricas(db)
+    return all(
+        math.isclose(float(snapshot[campo]), float(completo[campo]), rel_tol=1e-9, abs_tol=1e-6)
+        if isinstance(completo[campo], (int, float)) else snapshot[campo] == completo[campo]
+        for campo in completo
+    )
+
+
+def limpar():
+    db = database.SessionLocal()
+    try:
+        ids = [p.id for p in db.query(models.Product.id).filter(models.Product.name.like("Bench Importacao %"))]
+        for produto_id in ids:
+            main.excluir_produto(produto_id, db)
+    finally:
+        db.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=10_000)
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    corpo = gerar_csv(args.linhas)
+    print(f"Planilha: {args.linhas} linhas, {len(corpo) / 1024:.0f} KB")
+
+    ok = True
+    with TestClient(main.app) as cliente:
+        try:
+            for rodada in ("criacao", "upsert"):
+                resposta, duracao = enviar(cliente, corpo)
+                resultado = resposta.json()
+                print(f"  {rodada:<8} {duracao:6.2f}s  ({args.linhas / duracao:,.0f} linhas/s)  "
+                      f"produtos criados {resultado.get('produtos_criados')}  "
+                      f"variacoes criadas {resultado.get('variacoes_criadas')}  "
+                      f"atualizadas {resultado.get('variacoes_atualizadas')}  erros {resultado.get('total_erros')}")
+                ok = ok and resposta.status_code == 200 and not resultado.get("total_erros")
+
+            db = database.SessionLocal()
+            try:
+                confere = metricas_conferem(db)
+            finally:
+                db.close()
+            print(f"  snapshot do dashboard confere: {confere}")
+            ok = ok and confere
+        finally:
+            if args.limpar:
+                limpar()
+                print("\nProdutos de teste apagados.")
+
+    print("\n[OK] Importacao concluida" if ok else "\n[ERRO] Importacao com falhas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,291 @@
+"""
+Benchmark: CPU por requisição de GET /api/ordens-servico e GET /api/compras.
+
+Cria N ordens de serviço (2 peças e 1 serviço cada) e N compras (2 itens
+cada) e mede, para cada listagem, o tempo de CPU do processo por requisição:
+
+- antes:  objetos ORM com selectinload/joinedload, dicionários montados à mão
+          (float()/isoformat()) e jsonable_encoder + json.dumps do FastAPI
+- depois: colunas projetadas e serializador compilado (api_json.py)
+
+Também confere que os dois JSON são iguais.
+
+Rode contra um banco de TESTE. Com --limpar os registros de teste são
+apagados ao final.
+
+Uso:
+    python benchmarks/bench_json.py --linhas 5000 --repeticoes 10 --limpar
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, desc, insert, select
+from sqlalchemy.orm import joinedload, selectinload
+
+import database
+import models
+from api_json import ler_compras, ler_ordens_servico, serializador_compras, serializador_ordens
+
+PREFIXO = "BENCH-JSON-"
+MODELO = "Bench JSON"
+
+
+# =========================================
+# DADOS DE TESTE
+# =========================================
+
+def criar_dados(linhas):
+    db = database.SessionLocal()
+    try:
+        pecas = db.execute(
+            insert(models.RepairPart).returning(models.RepairPart.id, sort_by_parameter_order=True),
+            [{"device_model": MODELO, "part_name": f"Peca {i}", "price": Decimal("89.90") + i,
+              "cost_price": Decimal("40.00"), "available_stock": 100, "min_stock_alert": 5, "status": "available"}
+             for i in range(20)],
+        ).scalars().all()
+        servicos = db.execute(
+            insert(models.Service).returning(models.Service.id, sort_by_parameter_order=True),
+            [{"name": f"{MODELO} {i}", "description": "Servico de teste", "price": Decimal("50.00") + i,
+              "estimated_time": 30, "status": "active"}
+             for i in range(10)],
+        ).scalars().all()
+
+        inicio = datetime.datetime(2024, 1, 1)
+        ordens = db.execute(
+            insert(models.ServiceOrder).returning(models.ServiceOrder.id, sort_by_parameter_order=True),
+            [{"order_number": f"{PREFIXO}{i:06d}", "client_name": f"Cliente {i}", "client_phone": "11999990000",
+              "client_email": None, "device_model": "iPhone 13", "service_description": "Troca de tela",
+              "status": "concluido" if i % 3 else "em_andamento",
+              # Um terço sem valor gravado: o total é calculado na listagem
+              "total_value": Decimal("0") if i % 3 == 0 else Decimal("239.80"),
+              "notes": None, "created_at": inicio + datetime.timedelta(minutes=i),
+              "completed_at": inicio + datetime.timedelta(minutes=i, hours=2) if i % 3 else None}
+             for i in range(linhas)],
+        ).scalars().all()
+        db.execute(insert(models.service_order_parts), [
+            {"service_order_id": ordem_id, "repair_part_id": pecas[(i + j) % len(pecas)], "quantity": 1 + j}
+            for i, ordem_id in enumerate(ordens) for j in range(2)
+        ])
+        db.execute(insert(models.service_order_services), [
+            {"service_order_id": ordem_id, "service_id": servicos[i % len(servicos)], "quantity": 1}
+            for i, ordem_id in enumerate(ordens)
+        ])
+
+        compras = db.execute(
+            insert(models.Purchase).returning(models.Purchase.id, sort_by_parameter_order=True),
+            [{"purchase_number": f"{PREFIXO}{i:06d}", "supplier_name": "Fornecedor Bench",
+              "shipping_cost": Decimal("15.00"), "total_value": Decimal("175.00"), "notes": None,
+              "created_at": inicio + datetime.timedelta(minutes=i)}
+             for i in range(linhas)],
+        ).scalars().all()
+        db.execute(insert(models.PurchaseItem), [
+            {"purchase_id": compra_id, "repair_part_id": pecas[(i + j) % len(pecas)], "quantity": 2,
+             "unit_cost": Decimal("40.00"), "total_cost": Decimal("80.00")}
+            for i, compra_id in enumerate(compras) for j in range(2)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def limpar():
+    db = database.SessionLocal()
+    try:
+        ordens = select(models.ServiceOrder.id).where(models.ServiceOrder.order_number.like(f"{PREFIXO}%"))
+        compras = select(models.Purchase.id).where(models.Purchase.purchase_number.like(f"{PREFIXO}%"))
+        db.execute(delete(models.service_order_parts).where(models.service_order_parts.c.service_order_id.in_(ordens)))
+        db.execute(delete(models.service_order_services).where(models.service_order_services.c.service_order_id.in_(ordens)))
+        db.execute(delete(models.ServiceOrder).where(models.ServiceOrder.order_number.like(f"{PREFIXO}%")))
+        db.execute(delete(models.PurchaseItem).where(models.PurchaseItem.purchase_id.in_(compras)))
+        db.execute(delete(models.Purchase).where(models.Purchase.purchase_number.like(f"{PREFIXO}%")))
+        db.execute(delete(models.Service).where(models.Service.name.like(f"{MODELO} %")))
+        db.execute(delete(models.RepairPart).where(models.RepairPart.device_model == MODELO))
+        db.commit()
+    finally:
+        db.close()
+
+
+# =========================================
+# ANTES: montagem manual + jsonable_encoder (como as rotas faziam)
+# =========================================
+
+async def ordens_antes(db):
+    result = await db.execute(
+        select(models.ServiceOrder).options(
+            selectinload(models.ServiceOrder.part_items).joinedload(models.ServiceOrderPart.part),
+            selectinload(models.ServiceOrder.service_items).joinedload(models.ServiceOrderService.service),
+        ).order_by(desc(models.ServiceOrder.created_at))
+    )
+    resultado = []
+    for ordem in result.scalars().all():
+        pecas = [item.part for item in ordem.part_items]
+        quantidades_pecas = {item.repair_part_id: item.quantity for item in ordem.part_items}
+        servicos = [item.service for item in ordem.service_items]
+        quantidades_servicos = {item.service_id: item.quantity for item in ordem.service_items}
+        total = sum(float(p.price) * quantidades_pecas.get(p.id, 1) for p in pecas) + \
+            sum(float(s.price) * quantidades_servicos.get(s.id, 1) for s in servicos)
+        resultado.append({
+            "id": ordem.id,
+            "order_number": ordem.order_number,
+            "client_name": ordem.client_name,
+            "client_phone": ordem.client_phone,
+            "client_email": ordem.client_email,
+            "device_model": ordem.device_model,
+            "service_description": ordem.service_description,
+            "status": ordem.status,
+            "total_value": float(ordem.total_value) if ordem.total_value else total,
+            "notes": ordem.notes,
+            "created_at": ordem.created_at.isoformat() if ordem.created_at else None,
+            "completed_at": ordem.completed_at.isoformat() if ordem.completed_at else None,
+            "parts": [{"id": p.id, "device_model": p.device_model, "part_name": p.part_name or "N/A",
+                       "price": float(p.price) if p.price else 0.0, "quantity": quantidades_pecas.get(p.id, 1)}
+                      for p in pecas],
+            "services": [{"id": s.id, "name": s.name, "description": s.description,
+                          "price": float(s.price) if s.price else 0.0, "quantity": quantidades_servicos.get(s.id, 1)}
+                         for s in servicos],
+        })
+    return _json_fastapi(resultado)
+
+
+async def compras_antes(db):
+    result = await db.execute(
+        select(models.Purchase).options(
+            joinedload(models.Purchase.items).joinedload(models.PurchaseItem.repair_part)
+        ).order_by(desc(models.Purchase.created_at))
+    )
+    resultado = []
+    for compra in result.unique().scalars().all():
+        resultado.append({
+            "id": compra.id,
+            "purchase_number": compra.purchase_number,
+            "supplier_name": compra.supplier_name,
+            "shipping_cost": float(compra.shipping_cost) if compra.shipping_cost else 0.0,
+            "total_value": float(compra.total_value) if compra.total_value else 0.0,
+            "notes": compra.notes,
+            "created_at": compra.created_at.isoformat() if compra.created_at else None,
+            "items": [{
+                "id": item.id,
+                "repair_part_id": item.repair_part_id,
+                "repair_part": {
+                    "id": item.repair_part.id if item.repair_part else None,
+                    "device_model": item.repair_part.device_model if item.repair_part else "N/A",
+                    "part_name": (item.repair_part.part_name or "N/A") if item.repair_part else "N/A",
+                },
+                "quantity": item.quantity,
+                "unit_cost": float(item.unit_cost) if item.unit_cost else 0.0,
+                "total_cost": float(item.total_cost) if item.total_cost else 0.0,
+            } for item in compra.items],
+        })
+    return _json_fastapi(resultado)
+
+
+def _json_fastapi(conteudo):
+    """O que o FastAPI faz com um retorno dict/list: jsonable_encoder + JSONResponse.render"""
+    return json.dumps(jsonable_encoder(conteudo), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+# =========================================
+# DEPOIS: api_json.py (o que as rotas fazem agora)
+# =========================================
+
+async def ordens_depois(db):
+    return serializador_ordens.json(await db.run_sync(ler_ordens_servico, None))
+
+
+async def compras_depois(db):
+    return serializador_compras.json(await db.run_sync(ler_compras))
+
+
+# =========================================
+# MEDIÇÃO
+# =========================================
+
+async def medir(funcao, repeticoes):
+    """Mediana de CPU e de tempo total por requisição; retorna também o último corpo"""
+    cpu, parede = [], []
+    corpo = b""
+    for _ in range(repeticoes):
+        async with database.AsyncSessionLocal() as db:
+            inicio_cpu, inicio = time.process_time(), time.perf_counter()
+            corpo = await funcao(db)
+            cpu.append((time.process_time() - inicio_cpu) * 1000)
+            parede.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(cpu), statistics.median(parede), corpo
+
+
+def _normalizar(dados):
+    """Para comparar: números como float arredondado, ordem dos itens pelo id"""
+    if isinstance(dados, list):
+        itens = [_normalizar(d) for d in dados]
+        return sorted(itens, key=lambda d: d.get("id") or 0) if itens and isinstance(itens[0], dict) else itens
+    if isinstance(dados, dict):
+        return {k: _normalizar(v) for k, v in dados.items()}
+    if isinstance(dados, float):
+        return round(dados, 6)
+    return dados
+
+
+async def rodar(repeticoes):
+    ok = True
+    for nome, antes, depois in (
+        ("/api/ordens-servico", ordens_antes, ordens_depois),
+        ("/api/compras", compras_antes, compras_depois),
+    ):
+        # Aquecimento (conexões do pool, caches de compilação do SQLAlchemy)
+        await medir(antes, 1)
+        await medir(depois, 1)
+        cpu_antes, parede_antes, corpo_antes = await medir(antes, repeticoes)
+        cpu_depois, parede_depois, corpo_depois = await medir(depois, repeticoes)
+        iguais = _normalizar(json.loads(corpo_antes)) == _normalizar(json.loads(corpo_depois))
+        ok = ok and iguais
+        print(f"{nome}  ({len(corpo_depois) / 1024:.0f} KB)")
+        print(f"  antes   CPU {cpu_antes:8.1f} ms   total {parede_antes:8.1f} ms")
+        print(f"  depois  CPU {cpu_depois:8.1f} ms   total {parede_depois:8.1f} ms   ({cpu_antes / cpu_depois:.1f}x menos CPU)")
+        print(f"  mesmo JSON: {iguais}")
+    return ok
+
+
+async def main_async(args):
+    try:
+        return await rodar(args.repeticoes)
+    finally:
+        await database.get_async_engine().dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=5000, help="ordens de serviço e compras a criar")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    if database.get_engine() is None or database.get_async_engine() is None:
+        print("[ERRO] Configure DATABASE_URL e instale o driver assincrono (asyncpg)")
+        sys.exit(1)
+
+    criar_dados(args.linhas)
+    print(f"{args.linhas} ordens de servico e {args.linhas} compras criadas\n")
+    try:
+        ok = asyncio.run(main_async(args))
+    finally:
+        if args.limpar:
+            limpar()
+            print("\nRegistros de teste apagados.")
+
+    print("\n[OK] Benchmark concluido" if ok else "\n[ERRO] Respostas diferentes")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmark: resumo financeiro mensal de 3 anos (GET /api/financas/resumo).
+
+Cria N compras, N ordens de serviço finalizadas e N vendas de serviço
+espalhadas por 3 anos, reconstrói as tabelas de totais e mede o resumo mensal
+do período:
+
+- antes:  agregação agrupada por dia sobre purchases, service_orders e
+          service_sale_history (as três tabelas inteiras do período)
+- depois: leitura de finance_monthly (finance_rollup.ler_resumo), ~36 linhas
+
+Também confere que os totais são iguais.
+
+Rode contra um banco de TESTE: a reconstrução reescreve finance_daily e
+finance_monthly a partir do histórico. Com --limpar os registros de teste
+são apagados ao final e os totais reconstruídos de novo.
+
+Uso:
+    python benchmarks/bench_resumo_financeiro.py --linhas 100000 --repeticoes 10 --limpar
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert
+
+import database
+import models
+from finance_rollup import CAMPOS_TOTAIS, _por_dia, inicio_do_mes, ler_resumo, reconstruir_totais
+
+PREFIXO = "BENCH-FIN-"
+INICIO = datetime.datetime(2021, 1, 1)
+FIM = datetime.datetime(2024, 1, 1)
+DIAS = (FIM - INICIO).days
+
+
+# =========================================
+# DADOS DE TESTE
+# =========================================
+
+def _quando(i, linhas):
+    return INICIO + datetime.timedelta(days=DIAS * i / linhas)
+
+
+def criar_dados(linhas):
+    db = database.SessionLocal()
+    try:
+        servico = db.execute(
+            insert(models.Service).returning(models.Service.id),
+            [{"name": f"{PREFIXO}servico", "price": Decimal("120.00"), "status": "active"}],
+        ).scalar_one()
+        for inicio in range(0, linhas, 10000):
+            faixa = range(inicio, min(inicio + 10000, linhas))
+            db.execute(insert(models.Purchase), [
+                {"purchase_number": f"{PREFIXO}{i:07d}", "supplier_name": "Fornecedor Bench",
+                 "shipping_cost": Decimal("15.00"), "total_value": Decimal("175.00"), "created_at": _quando(i, linhas)}
+                for i in faixa
+            ])
+            db.execute(insert(models.ServiceOrder), [
+                {"order_number": f"{PREFIXO}{i:07d}", "client_name": "Cliente", "device_model": "iPhone 13",
+                 "service_description": "Troca de tela", "status": "concluido", "total_value": Decimal("239.80"),
+                 "profit": Decimal("99.80"), "created_at": _quando(i, linhas), "completed_at": _quando(i, linhas)}
+                for i in faixa
+            ])
+            db.execute(insert(models.ServiceSaleHistory), [
+                {"service_id": servico, "service_name": f"{PREFIXO}servico", "sale_price": Decimal("120.00"),
+                 "part_cost": Decimal("40.00"), "profit": Decimal("80.00"), "sold_at": _quando(i, linhas)}
+                for i in faixa
+            ])
+        reconstruir_totais(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def limpar():
+    db = database.SessionLocal()
+    try:
+        db.execute(delete(models.ServiceSaleHistory).where(models.ServiceSaleHistory.service_name == f"{PREFIXO}servico"))
+        db.execute(delete(models.Service).where(models.Service.name == f"{PREFIXO}servico"))
+        db.execute(delete(models.ServiceOrder).where(models.ServiceOrder.order_number.like(f"{PREFIXO}%")))
+        db.execute(delete(models.Purchase).where(models.Purchase.purchase_number.like(f"{PREFIXO}%")))
+        reconstruir_totais(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+# =========================================
+# ANTES x DEPOIS
+# =========================================
+
+def resumo_antes(db):
+    """Totais por mês agregando as tabelas de origem no período"""
+    compra = models.Purchase
+    ordem = models.ServiceOrder
+    venda = models.ServiceSaleHistory
+    receita = func.coalesce(ordem.total_value, 0)
+    origens = (
+        (("purchases_count", "purchases_value", "shipping_value"), _por_dia(
+            db, compra.created_at, func.count(compra.id), func.sum(compra.total_value), func.sum(compra.shipping_cost),
+            filtro=(compra.created_at >= INICIO, compra.created_at < FIM),
+        )),
+        (("orders_count", "orders_revenue", "orders_cost", "orders_profit"), _por_dia(
+            db, ordem.completed_at, func.count(ordem.id), func.sum(receita), func.sum(receita - ordem.profit),
+            func.sum(ordem.profit),
+            filtro=(ordem.status == "concluido", ordem.profit.isnot(None),
+                    ordem.completed_at >= INICIO, ordem.completed_at < FIM),
+        )),
+        (("sales_count", "sales_revenue", "sales_cost", "sales_profit"), _por_dia(
+            db, venda.sold_at, func.count(venda.id), func.sum(venda.sale_price), func.sum(venda.part_cost),
+            func.sum(venda.profit),
+            filtro=(venda.sold_at >= INICIO, venda.sold_at < FIM),
+        )),
+    )
+    meses = {}
+    for campos, por_dia in origens:
+        for dia, somas in por_dia.items():
+            linha = meses.setdefault(inicio_do_mes(dia), {campo: Decimal(0) for campo in CAMPOS_TOTAIS})
+            for campo, valor in zip(campos, somas):
+                linha[campo] += valor
+    return {campo: float(sum(linha[campo] for linha in meses.values())) for campo in CAMPOS_TOTAIS}, len(meses)
+
+
+def resumo_depois(db):
+    resumo = ler_resumo(db, INICIO, FIM, "mes")
+    return {campo: resumo["totais"][campo] for campo in CAMPOS_TOTAIS}, len(resumo["periodos"])
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        db = database.SessionLocal()
+        try:
+            inicio = time.perf_counter()
+            resultado = funcao(db)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        finally:
+            db.close()
+    return statistics.median(tempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=100000, help="compras, ordens e vendas a criar (cada)")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    criar_dados(args.linhas)
+    print(f"{args.linhas} compras, ordens e vendas criadas entre {INICIO:%Y-%m-%d} e {FIM:%Y-%m-%d}\n")
+    try:
+        medir(resumo_antes, 1)
+        medir(resumo_depois, 1)
+        ms_antes, (totais_antes, meses_antes) = medir(resumo_antes, args.repeticoes)
+        ms_depois, (totais_depois, meses_depois) = medir(resumo_depois, args.repeticoes)
+        # O período pode conter outros registros além dos de teste; compara os dois caminhos
+        ok = all(abs(totais_antes[campo] - totais_depois[campo]) < 0.005 for campo in CAMPOS_TOTAIS)
+        print(f"antes   {ms_antes:9.1f} ms   ({meses_antes} meses, {3 * args.linhas} linhas de origem)")
+        print(f"depois  {ms_depois:9.1f} ms   ({meses_depois} linhas de finance_monthly)   "
+              f"{ms_antes / ms_depois:.0f}x mais rapido")
+        print(f"mesmos totais: {ok}")
+    finally:
+        if args.limpar:
+            limpar()
+            print("\nRegistros de teste apagados.")
+
+    print("\n[OK] Benchmark concluido" if ok else "\n[ERRO] Totais diferentes")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
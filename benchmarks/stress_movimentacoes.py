@@ -0,0 +1,142 @@
+"""
+Teste de estresse: movimentações simultâneas no mesmo SKU.
+
+N threads (padrão 100), cada uma com sua própria sessão, chamam a mesma
+função da rota POST /api/movimentacoes sobre um único SKU, misturando
+entradas e saídas. Ao final verifica:
+
+- saldo final == saldo inicial + soma das movimentações aceitas (nenhuma
+  atualização perdida)
+- o saldo nunca ficou negativo
+- o histórico forma uma cadeia contínua (previous_stock de cada movimento ==
+  new_stock do anterior) e tem uma linha por movimentação aceita
+
+e informa movimentações por segundo.
+
+Rode contra um banco de TESTE (Postgres). Com --limpar o produto de teste e
+seu histórico são apagados ao final.
+
+Uso:
+    python benchmarks/stress_movimentacoes.py --threads 100 --por-thread 20
+    python benchmarks/stress_movimentacoes.py --estoque-inicial 50   # força saídas recusadas
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import main
+import models
+from schemas import MovementCreate, ProdutoCreate, CorCreate
+
+
+def criar_sku_teste(estoque_inicial):
+    db = database.SessionLocal()
+    try:
+        resposta = main.criar_produto(
+            ProdutoCreate(
+                name=f"Stress {int(time.time())}",
+                category="Stress",
+                colors=[CorCreate(color_name="Teste", price=10, cost=5, stock=estoque_inicial, min_stock_alert=0)],
+            ),
+            db,
+        )
+        return resposta["id"], resposta["variacoes"][0]["sku"]
+    finally:
+        db.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--por-thread", type=int, default=20, help="movimentações por thread")
+    parser.add_argument("--estoque-inicial", type=int, default=1000)
+    parser.add_argument("--limpar", action="store_true")
+    args = parser.parse_args()
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    produto_id, sku = criar_sku_teste(args.estoque_inicial)
+    barreira = threading.Barrier(args.threads)
+    aceitas = []  # deltas aplicados
+    recusadas = []
+    erros = []
+    lock = threading.Lock()
+
+    def escritor(semente):
+        aleatorio = random.Random(semente)
+        db = database.SessionLocal()
+        try:
+            barreira.wait()
+            for _ in range(args.por_thread):
+                tipo = aleatorio.choice(["entrada", "saida", "saida"])
+                quantidade = aleatorio.randint(1, 5)
+                resposta = main.criar_movimentacao(MovementCreate(sku=sku, movement_type=tipo, quantity=quantidade), db)
+                with lock:
+                    if isinstance(resposta, dict):
+                        aceitas.append(quantidade if tipo == "entrada" else -quantidade)
+                    elif resposta.status_code == 400:
+                        recusadas.append(tipo)
+                    else:
+                        erros.append(resposta.body)
+        finally:
+            db.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(escritor, range(args.threads)))
+    duracao = time.perf_counter() - inicio
+
+    db = database.SessionLocal()
+    try:
+        variacao = db.query(models.ColorVariation).filter(models.ColorVariation.full_sku == sku).one()
+        movimentos = db.query(models.StockMovement).filter(
+            models.StockMovement.variation_id == variacao.id
+        ).order_by(models.StockMovement.id).all()
+
+        esperado = args.estoque_inicial + sum(aceitas)
+        quebras = sum(
+            1 for anterior, atual in zip(movimentos, movimentos[1:])
+            if atual.previous_stock != anterior.new_stock
+        )
+        negativos = sum(1 for m in movimentos if m.new_stock < 0)
+        total = len(aceitas) + len(recusadas) + len(erros)
+
+        print(f"\n{args.threads} threads x {args.por_thread} movimentações no SKU {sku}")
+        print(f"  tempo: {duracao:.2f}s  ->  {total / duracao:.0f} movimentações/s ({len(aceitas) / duracao:.0f} aceitas/s)")
+        print(f"  aceitas: {len(aceitas)}  recusadas (estoque insuficiente): {len(recusadas)}  erros: {len(erros)}")
+        print(f"  saldo final: {variacao.available_stock}  esperado: {esperado}")
+        print(f"  linhas de histórico: {len(movimentos)}  quebras na cadeia: {quebras}  saldos negativos: {negativos}")
+        for erro in erros[:3]:
+            print(f"  exemplo de erro: {erro!r}")
+
+        ok = (
+            variacao.available_stock == esperado
+            and len(movimentos) == len(aceitas)
+            and not quebras and not negativos and not erros
+        )
+
+        if args.limpar:
+            db.query(models.StockMovement).filter(
+                models.StockMovement.variation_id == variacao.id
+            ).delete(synchronize_session=False)
+            db.commit()
+            main.excluir_produto(produto_id, db)
+            print("\nProduto de teste apagado.")
+    finally:
+        db.close()
+
+    print("\n[OK] Nenhuma atualização perdida" if ok else "\n[ERRO] Inconsistência encontrada")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
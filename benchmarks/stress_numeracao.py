@@ -0,0 +1,135 @@
+"""
+Teste de concorrência: numeração de ordens de serviço e compras.
+
+Dispara centenas de criações em paralelo (threads, cada uma com sua própria
+sessão, chamando as mesmas funções das rotas POST /api/ordens-servico e
+POST /api/compras) e verifica:
+
+- nenhuma criação falhou (antes, duas requisições simultâneas recebiam o
+  mesmo número e uma delas quebrava no índice único)
+- todos os números são distintos
+- os números novos são consecutivos, sem buracos
+
+Rode contra um banco de TESTE (Postgres): o script cria registros de verdade.
+Use --limpar para apagar o que foi criado ao final (o contador não volta).
+
+Uso:
+    python benchmarks/stress_numeracao.py --criacoes 300 --threads 50
+    python benchmarks/stress_numeracao.py --tipo compra --limpar
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import main
+import models
+from schemas import ServiceOrderCreate, PurchaseCreate, PurchaseItemCreate
+
+MARCADOR = "stress-numeracao"
+
+
+def criar_ordem(_):
+    db = database.SessionLocal()
+    try:
+        return main.criar_ordem_servico(
+            ServiceOrderCreate(client_name=MARCADOR, device_model="Teste", service_description="Teste"),
+            db,
+        )
+    finally:
+        db.close()
+
+
+def criar_compra(peca_id):
+    db = database.SessionLocal()
+    try:
+        return main.criar_compra(
+            PurchaseCreate(
+                supplier_name=MARCADOR,
+                items=[PurchaseItemCreate(repair_part_id=peca_id, quantity=1, unit_cost=1.0)],
+            ),
+            db,
+        )
+    finally:
+        db.close()
+
+
+def rodar(nome, funcao, argumento, criacoes, threads, chave_numero):
+    barreira = threading.Barrier(threads)
+
+    def tarefa(i):
+        # Os primeiros lotes começam juntos para forçar a disputa
+        if i < threads:
+            barreira.wait()
+        return funcao(argumento)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        respostas = list(executor.map(tarefa, range(criacoes)))
+    duracao = time.perf_counter() - inicio
+
+    numeros = [r[chave_numero] for r in respostas if isinstance(r, dict)]
+    falhas = [r for r in respostas if not isinstance(r, dict)]
+    sequenciais = sorted(int(re.search(r"(\d+)$", n).group(1)) for n in numeros)
+    duplicados = len(numeros) - len(set(numeros))
+    buracos = (sequenciais[-1] - sequenciais[0] + 1 - len(set(sequenciais))) if sequenciais else 0
+
+    print(f"\n{nome}: {criacoes} criações, {threads} threads, {duracao:.2f}s ({criacoes / duracao:.0f}/s)")
+    print(f"  sucesso: {len(numeros)}  falhas: {len(falhas)}  duplicados: {duplicados}  buracos: {buracos}")
+    if numeros:
+        print(f"  faixa: {min(numeros)} .. {max(numeros)}")
+    for falha in falhas[:3]:
+        print(f"  exemplo de falha: {getattr(falha, 'body', falha)!r}")
+    return not falhas and not duplicados and not buracos, [r["id"] for r in respostas if isinstance(r, dict)]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--criacoes", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--tipo", choices=["os", "compra", "ambos"], default="ambos")
+    parser.add_argument("--limpar", action="store_true", help="apaga os registros criados ao final")
+    args = parser.parse_args()
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    ok = True
+    db = database.SessionLocal()
+    try:
+        peca = models.RepairPart(device_model=MARCADOR, part_name=MARCADOR, price=1, cost_price=1, available_stock=0)
+        db.add(peca)
+        db.commit()
+        peca_id = peca.id
+
+        ids_ordens, ids_compras = [], []
+        if args.tipo in ("os", "ambos"):
+            resultado, ids_ordens = rodar("Ordens de serviço", criar_ordem, None, args.criacoes, args.threads, "order_number")
+            ok = ok and resultado
+        if args.tipo in ("compra", "ambos"):
+            resultado, ids_compras = rodar("Compras", criar_compra, peca_id, args.criacoes, args.threads, "purchase_number")
+            ok = ok and resultado
+
+        if args.limpar:
+            db.query(models.ServiceOrder).filter(models.ServiceOrder.id.in_(ids_ordens)).delete(synchronize_session=False)
+            db.query(models.PurchaseItem).filter(models.PurchaseItem.purchase_id.in_(ids_compras)).delete(synchronize_session=False)
+            db.query(models.Purchase).filter(models.Purchase.id.in_(ids_compras)).delete(synchronize_session=False)
+            db.query(models.RepairPart).filter(models.RepairPart.id == peca_id).delete(synchronize_session=False)
+            db.commit()
+            print("\nRegistros de teste apagados.")
+    finally:
+        db.close()
+
+    print("\n[OK] Numeração sem colisões" if ok else "\n[ERRO] Houve colisões ou falhas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
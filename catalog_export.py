@@ -0,0 +1,97 @@
+"""
+Exportação do catálogo completo (GET /api/produtos/export).
+
+Uma linha por variação (produtos sem variação saem com os campos da cor
+vazios), lida do banco com cursor no servidor (yield_per) e enviada em
+blocos de LOTE_EXPORTACAO linhas. Nada é acumulado: a memória fica constante
+qualquer que seja o tamanho do catálogo. Os cabeçalhos HTTP (e a linha de
+cabeçalho do CSV) saem antes da consulta.
+
+As colunas usam os nomes dos campos de ProdutoCreate/CorCreate, então o CSV
+exportado pode ser reimportado em POST /api/produtos/import.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+import models
+
+LOTE_EXPORTACAO = 1000
+
+COLUNAS = (
+    "product_id",
+    "name",
+    "manufacturer",
+    "compatibility",
+    "category",
+    "variation_id",
+    "color_name",
+    "full_sku",
+    "variation_price",
+    "cost_price",
+    "available_stock",
+    "min_stock_alert",
+)
+
+
+def consulta_exportacao():
+    produto = models.Product
+    cv = models.ColorVariation
+    return (
+        select(
+            produto.id.label("product_id"),
+            produto.name,
+            produto.manufacturer,
+            produto.compatibility,
+            produto.category,
+            cv.id.label("variation_id"),
+            cv.color_name,
+            cv.full_sku,
+            cv.variation_price,
+            cv.cost_price,
+            cv.available_stock,
+            cv.min_stock_alert,
+        )
+        .outerjoin(cv, cv.product_id == produto.id)
+        .order_by(produto.id, cv.id)
+        .execution_options(yield_per=LOTE_EXPORTACAO)
+    )
+
+
+def _blocos(obter_sessao):
+    """Blocos de linhas do cursor no servidor; a sessão é aberta e fechada aqui"""
+    db = obter_sessao()
+    try:
+        for bloco in db.execute(consulta_exportacao()).partitions():
+            yield bloco
+    finally:
+        db.close()
+
+
+def gerar_csv(obter_sessao):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUNAS)
+    # BOM: o Excel abre o arquivo com os acentos corretos
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    for bloco in _blocos(obter_sessao):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(bloco)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _valor_json(valor):
+    # Numeric chega como Decimal; preço/custo têm 2 casas, float representa bem
+    return float(valor) if valor is not None and not isinstance(valor, (int, str)) else valor
+
+
+def gerar_ndjson(obter_sessao):
+    for bloco in _blocos(obter_sessao):
+        yield "".join(
+            json.dumps({coluna: _valor_json(valor) for coluna, valor in zip(COLUNAS, linha)}, ensure_ascii=False) + "\n"
+            for linha in bloco
+        ).encode("utf-8")
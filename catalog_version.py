@@ -0,0 +1,115 @@
+"""
+Versão do catálogo para GET condicional (ETag / If-None-Match).
+
+Cada grupo de tabelas tem um contador na tabela "counters" (counters.py),
+incrementado na mesma transação de qualquer escrita nessas tabelas:
+
+- products e color_variations -> "versao:produtos" (inclui o estoque)
+- repair_parts -> "versao:reparos"
+- services -> "versao:servicos"
+
+As escritas são detectadas pelos eventos da Session (objetos do flush e
+comandos insert/update/delete executados pela Session, como os da
+importação), então nenhuma rota precisa lembrar de incrementar. A exceção é
+um SELECT com UPDATE dentro de CTE (stock.py, no Postgres), que chama
+marcar() explicitamente. O incremento é feito no before_commit, uma vez por
+transação e por contador, para segurar a trava da linha do contador só até o
+commit.
+
+As rotas de leitura montam o ETag com uma consulta à chave primária de
+"counters" e respondem 304 sem consultar o catálogo quando o navegador já tem
+a versão atual. Escritas feitas fora da aplicação (SQL direto) não mudam a
+versão.
+"""
+from itertools import chain
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+import models
+from counters import proximo_valor
+
+CHAVE_SESSAO = "versoes_alteradas"
+
+VERSAO_PRODUTOS = "versao:produtos"
+VERSAO_REPAROS = "versao:reparos"
+VERSAO_SERVICOS = "versao:servicos"
+
+CONTADOR_DA_TABELA = {
+    "products": VERSAO_PRODUTOS,
+    "color_variations": VERSAO_PRODUTOS,
+    "repair_parts": VERSAO_REPAROS,
+    "services": VERSAO_SERVICOS,
+}
+
+
+# =========================================
+# INCREMENTO (eventos da Session)
+# =========================================
+
+def marcar(session, tabela):
+    """Registra uma escrita na tabela; o contador é incrementado no commit"""
+    contador = CONTADOR_DA_TABELA.get(tabela)
+    if contador:
+        session.info.setdefault(CHAVE_SESSAO, set()).add(contador)
+
+
+@event.listens_for(Session, "before_flush")
+def _marcar_flush(session, flush_context, instances):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        marcar(session, getattr(obj, "__tablename__", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _marcar_comando(estado):
+    # Vale também para comandos sobre a Table (ex: stock.py usa ColorVariation.__table__)
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        tabela = getattr(estado.statement, "table", None)
+        marcar(estado.session, getattr(tabela, "name", None))
+
+
+@event.listens_for(Session, "before_commit")
+def _incrementar(session):
+    # O flush final do commit acontece depois deste evento; antecipa para
+    # que as alterações ainda pendentes também sejam marcadas
+    session.flush()
+    for contador in sorted(session.info.pop(CHAVE_SESSAO, ())):
+        proximo_valor(session, contador)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(session):
+    session.info.pop(CHAVE_SESSAO, None)
+
+
+# =========================================
+# LEITURA (ETag)
+# =========================================
+
+def ler_versoes(db, contadores):
+    """Valores atuais dos contadores (0 se ainda não houve escrita), na ordem pedida"""
+    valores = dict(db.execute(
+        select(models.Counter.name, models.Counter.value).where(models.Counter.name.in_(contadores))
+    ).all())
+    return [valores.get(contador, 0) for contador in contadores]
+
+
+def etag(recurso, versoes):
+    """ETag forte, ex: "produtos-12" ou "servicos-3-12" """
+    return '"' + "-".join([recurso, *(str(v) for v in versoes)]) + '"'
+
+
+def cabecalhos_etag(etag_atual):
+    """ETag + no-cache: o navegador guarda a resposta, mas sempre revalida"""
+    return {"ETag": etag_atual, "Cache-Control": "no-cache"}
+
+
+def nao_modificado(request, etag_atual):
+    """True se o If-None-Match da requisição já tem a versão atual"""
+    cabecalho = request.headers.get("if-none-match")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    # If-None-Match usa comparação fraca: ignora o prefixo W/
+    return any(valor.strip().removeprefix("W/") == etag_atual for valor in cabecalho.split(","))
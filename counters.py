@@ -0,0 +1,76 @@
+"""
+Contadores atômicos guardados na tabela "counters".
+
+Cada contador é uma linha (nome, valor). proximo_valor() incrementa e devolve
+o novo valor em uma única instrução (UPDATE ... RETURNING), então duas
+requisições simultâneas nunca recebem o mesmo número: a segunda espera a
+trava da linha até a primeira terminar a transação.
+
+Como o incremento faz parte da transação de quem chamou, um rollback também
+desfaz o número (a numeração não fica com buracos).
+
+Usado na numeração das ordens de serviço (OS-YYYY-NNN) e das compras
+(COMP-YYYY-NNN).
+"""
+import re
+
+from sqlalchemy import select, update
+
+import models
+
+
+def insert_dialeto(db, tabela):
+    """INSERT na tabela com suporte a ON CONFLICT do dialeto em uso (Postgres ou SQLite)"""
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(tabela)
+
+
+def proximo_valor(db, nome, valor_inicial=None):
+    """
+    Incrementa o contador e retorna o novo valor.
+
+    valor_inicial: função chamada só quando o contador ainda não existe; deve
+    retornar o último valor já usado (ex: maior número existente na tabela).
+    """
+    contador = models.Counter
+
+    # Caminho normal: um único UPDATE atômico
+    novo_valor = db.execute(
+        update(contador)
+        .where(contador.name == nome)
+        .values(value=contador.value + 1)
+        .returning(contador.value)
+    ).scalar()
+    if novo_valor is not None:
+        return novo_valor
+
+    # Primeiro uso do contador: cria a linha a partir do último valor existente.
+    # Se outra requisição criar ao mesmo tempo, o ON CONFLICT vira incremento.
+    ultimo = valor_inicial() if valor_inicial else 0
+    stmt = insert_dialeto(db, models.Counter).values(name=nome, value=ultimo + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[contador.name],
+        set_={"value": contador.value + 1},
+    ).returning(contador.value)
+    return db.execute(stmt).scalar()
+
+
+def maior_sequencial(db, coluna, prefixo):
+    """Maior número sequencial já usado em uma coluna no formato PREFIXO-NNN"""
+    padrao = re.compile(re.escape(prefixo) + r"(\d+)$")
+    maior = 0
+    for (valor,) in db.execute(select(coluna).where(coluna.like(f"{prefixo}%"))):
+        encontrado = padrao.match(valor or "")
+        if encontrado:
+            maior = max(maior, int(encontrado.group(1)))
+    return maior
+
+
+def proximo_numero_documento(db, coluna, sigla, ano):
+    """Próximo número no formato SIGLA-YYYY-NNN (ex: OS-2024-001)"""
+    prefixo = f"{sigla}-{ano}-"
+    numero = proximo_valor(db, prefixo.rstrip("-"), lambda: maior_sequencial(db, coluna, prefixo))
+    return f"{prefixo}{numero:03d}"
@@ -97,6 +97,7 @@ CREATE TABLE IF NOT EXISTS stock_movements (
 CREATE INDEX IF NOT EXISTS idx_stock_movements_variation ON stock_movements(variation_id);
 CREATE INDEX IF NOT EXISTS idx_stock_movements_type ON stock_movements(movement_type);
 CREATE INDEX IF NOT EXISTS idx_stock_movements_created ON stock_movements(created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_variation_id ON stock_movements(variation_id, id);
 
 COMMENT ON TABLE stock_movements IS 'Histórico de movimentações de estoque';
 COMMENT ON COLUMN stock_movements.movement_type IS 'Tipo: entrada, saida ou ajuste';
@@ -112,6 +113,7 @@ CREATE TABLE IF NOT EXISTS repair_parts (
     part_name VARCHAR NOT NULL,
     price NUMERIC(10, 2) NOT NULL,
     cost_price NUMERIC(10, 2) DEFAULT 0,
+    landed_cost NUMERIC(12, 4),
     available_stock INTEGER DEFAULT 0,
     min_stock_alert INTEGER DEFAULT 5,
     status VARCHAR DEFAULT 'available',
@@ -121,11 +123,15 @@ CREATE TABLE IF NOT EXISTS repair_parts (
 CREATE INDEX IF NOT EXISTS idx_repair_parts_device_model ON repair_parts(device_model);
 CREATE INDEX IF NOT EXISTS idx_repair_parts_status ON repair_parts(status);
 
+-- Bancos criados antes do custo com frete
+ALTER TABLE repair_parts ADD COLUMN IF NOT EXISTS landed_cost NUMERIC(12, 4);
+
 COMMENT ON TABLE repair_parts IS 'Tabela de peças físicas (produtos que você compra e estoca)';
 COMMENT ON COLUMN repair_parts.device_model IS 'Modelo do aparelho (ex: iPhone 13, Samsung Galaxy S21)';
 COMMENT ON COLUMN repair_parts.part_name IS 'Nome da peça (ex: Tela, Bateria, Conector de Carga)';
 COMMENT ON COLUMN repair_parts.price IS 'Preço de venda da peça';
 COMMENT ON COLUMN repair_parts.cost_price IS 'Custo de compra da peça';
+COMMENT ON COLUMN repair_parts.landed_cost IS 'Custo unitário com frete da última compra (limpo quando o custo é editado)';
 COMMENT ON COLUMN repair_parts.available_stock IS 'Estoque disponível';
 
 -- ============================================
@@ -176,6 +182,7 @@ CREATE TABLE IF NOT EXISTS service_orders (
 CREATE INDEX IF NOT EXISTS idx_service_orders_number ON service_orders(order_number);
 CREATE INDEX IF NOT EXISTS idx_service_orders_status ON service_orders(status);
 CREATE INDEX IF NOT EXISTS idx_service_orders_created ON service_orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_service_orders_status_created ON service_orders(status, created_at);
 
 COMMENT ON TABLE service_orders IS 'Tabela de ordens de serviço';
 COMMENT ON COLUMN service_orders.order_number IS 'Número da ordem (ex: OS-2024-001)';
@@ -246,15 +253,42 @@ CREATE TABLE IF NOT EXISTS purchase_items (
     repair_part_id INTEGER NOT NULL REFERENCES repair_parts(id) ON DELETE CASCADE,
     quantity INTEGER NOT NULL,
     unit_cost NUMERIC(10, 2) NOT NULL,
-    total_cost NUMERIC(10, 2) NOT NULL
+    total_cost NUMERIC(10, 2) NOT NULL,
+    landed_unit_cost NUMERIC(12, 4)
 );
 
+-- Bancos criados antes do custo com frete
+ALTER TABLE purchase_items ADD COLUMN IF NOT EXISTS landed_unit_cost NUMERIC(12, 4);
+
 CREATE INDEX IF NOT EXISTS idx_purchase_items_purchase ON purchase_items(purchase_id);
 CREATE INDEX IF NOT EXISTS idx_purchase_items_part ON purchase_items(repair_part_id);
 
 COMMENT ON TABLE purchase_items IS 'Itens de uma compra de peças';
 COMMENT ON COLUMN purchase_items.unit_cost IS 'Custo unitário da peça na compra';
 COMMENT ON COLUMN purchase_items.total_cost IS 'Custo total (quantity × unit_cost)';
+COMMENT ON COLUMN purchase_items.landed_unit_cost IS 'Custo unitário + frete da compra rateado pelo valor dos itens';
+
+-- Custo com frete das compras registradas antes do rateio (só preenche nulos)
+UPDATE purchase_items i
+SET landed_unit_cost = i.unit_cost + (
+    SELECT CASE
+        WHEN SUM(o.total_cost) > 0 THEN COALESCE(p.shipping_cost, 0) * i.total_cost / SUM(o.total_cost)
+        ELSE COALESCE(p.shipping_cost, 0) * i.quantity / SUM(o.quantity)
+    END
+    FROM purchase_items o JOIN purchases p ON p.id = o.purchase_id
+    WHERE o.purchase_id = i.purchase_id
+    GROUP BY p.shipping_cost
+) / i.quantity
+WHERE i.landed_unit_cost IS NULL AND i.quantity > 0;
+
+UPDATE repair_parts r
+SET landed_cost = u.landed_unit_cost
+FROM (
+    SELECT DISTINCT ON (repair_part_id) repair_part_id, unit_cost, landed_unit_cost
+    FROM purchase_items
+    ORDER BY repair_part_id, id DESC
+) u
+WHERE u.repair_part_id = r.id AND r.landed_cost IS NULL AND r.cost_price = u.unit_cost;
 
 -- ============================================
 -- 13. TABELA: service_sale_history (Histórico de Vendas de Serviços)
@@ -280,6 +314,95 @@ COMMENT ON COLUMN service_sale_history.part_cost IS 'Custo da peça vinculada';
 COMMENT ON COLUMN service_sale_history.profit IS 'Lucro calculado (sale_price - part_cost)';
 COMMENT ON COLUMN service_sale_history.sold_at IS 'Data/hora da venda';
 
+-- ============================================
+-- 14. TABELA: dashboard_snapshot (Agregados do Dashboard)
+-- ============================================
+CREATE TABLE IF NOT EXISTS dashboard_snapshot (
+    id INTEGER PRIMARY KEY,
+    total_skus INTEGER DEFAULT 0,
+    valor_estoque NUMERIC(14, 2) DEFAULT 0,
+    lucro_potencial NUMERIC(14, 2) DEFAULT 0,
+    soma_margens NUMERIC(18, 6) DEFAULT 0,
+    skus_com_preco INTEGER DEFAULT 0,
+    skus_com_estoque INTEGER DEFAULT 0,
+    qtd_criticos INTEGER DEFAULT 0,
+    qtd_baixos INTEGER DEFAULT 0,
+    qtd_zerados INTEGER DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE dashboard_snapshot IS 'Agregados do dashboard (linha única, id = 1) atualizados por delta a cada alteração de variação';
+COMMENT ON COLUMN dashboard_snapshot.soma_margens IS 'Soma das margens percentuais das variações com preço > 0';
+COMMENT ON COLUMN dashboard_snapshot.skus_com_preco IS 'Quantidade de variações com preço > 0 (divisor da margem média)';
+
+-- ============================================
+-- 15. TABELA: counters (Contadores Atômicos)
+-- ============================================
+CREATE TABLE IF NOT EXISTS counters (
+    name VARCHAR PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+COMMENT ON TABLE counters IS 'Contadores incrementados com UPDATE ... RETURNING (numeração de OS e compras)';
+COMMENT ON COLUMN counters.name IS 'Nome do contador (ex: OS-2024, COMP-2024)';
+COMMENT ON COLUMN counters.value IS 'Último valor entregue';
+
+-- ============================================
+-- 16. TABELA: stock_checkpoints (Checkpoints de Estoque)
+-- ============================================
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+    id SERIAL PRIMARY KEY,
+    variation_id INTEGER NOT NULL REFERENCES color_variations(id) ON DELETE CASCADE,
+    checkpoint_at TIMESTAMP NOT NULL,
+    stock INTEGER NOT NULL DEFAULT 0,
+    cost_price NUMERIC(10, 2),
+    variation_price NUMERIC(10, 2),
+    last_movement_id INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_checkpoints_data ON stock_checkpoints(checkpoint_at, variation_id);
+
+COMMENT ON TABLE stock_checkpoints IS 'Saldo de todas as variações em um instante (python ledger.py checkpoint); base da posição de estoque em data passada';
+COMMENT ON COLUMN stock_checkpoints.checkpoint_at IS 'Instante do checkpoint (igual para todas as variações do mesmo checkpoint)';
+COMMENT ON COLUMN stock_checkpoints.last_movement_id IS 'Id da última movimentação já incluída no saldo; a releitura começa depois dele';
+
+-- ============================================
+-- 17. TABELAS: finance_daily / finance_monthly (Totais financeiros por período)
+-- ============================================
+CREATE TABLE IF NOT EXISTS finance_daily (
+    period_start DATE PRIMARY KEY,
+    purchases_count INTEGER NOT NULL DEFAULT 0,
+    purchases_value NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    shipping_value NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    orders_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_cost NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_profit NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_count INTEGER NOT NULL DEFAULT 0,
+    sales_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_cost NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_profit NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS finance_monthly (
+    period_start DATE PRIMARY KEY,
+    purchases_count INTEGER NOT NULL DEFAULT 0,
+    purchases_value NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    shipping_value NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    orders_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_cost NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_profit NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_count INTEGER NOT NULL DEFAULT 0,
+    sales_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_cost NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    sales_profit NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+COMMENT ON TABLE finance_daily IS 'Compras, receita, custo e lucro por dia, atualizados na transação de cada compra/finalização (finance_rollup.py)';
+COMMENT ON TABLE finance_monthly IS 'Mesmos totais por mês (period_start = primeiro dia do mês)';
+COMMENT ON COLUMN finance_daily.orders_cost IS 'Receita (total_value) - lucro (profit) das ordens finalizadas';
+
 -- ============================================
 -- MENSAGEM DE CONFIRMAÇÃO
 -- ============================================
@@ -300,5 +423,10 @@ BEGIN
     RAISE NOTICE '  - purchases';
     RAISE NOTICE '  - purchase_items';
     RAISE NOTICE '  - service_sale_history (NOVA)';
+    RAISE NOTICE '  - dashboard_snapshot';
+    RAISE NOTICE '  - counters';
+    RAISE NOTICE '  - stock_checkpoints';
+    RAISE NOTICE '  - finance_daily';
+    RAISE NOTICE '  - finance_monthly';
 END $$;
 
@@ -0,0 +1,288 @@
+"""
+Métricas dos cartões do dashboard.
+
+As métricas ficam guardadas na tabela dashboard_snapshot (linha única) e são
+atualizadas por delta, na mesma transação, sempre que uma rota altera
+estoque, preço ou custo de uma ColorVariation. Assim o GET / lê uma linha
+só, independente do tamanho do catálogo.
+
+A consulta agregada completa (uma única instrução SQL com agregações
+condicionais) é usada apenas para criar/reconstruir o snapshot:
+
+    python dashboard.py reconstruir
+"""
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from sqlalchemy import func, case, select, update, type_coerce, Numeric
+
+import models
+
+# Campos acumulados no snapshot (mesmos nomes das colunas de DashboardSnapshot)
+CAMPOS_SNAPSHOT = (
+    "total_skus",
+    "valor_estoque",
+    "lucro_potencial",
+    "soma_margens",
+    "skus_com_preco",
+    "skus_com_estoque",
+    "qtd_criticos",
+    "qtd_baixos",
+    "qtd_zerados",
+)
+
+# Estado de uma variação relevante para o dashboard
+EstadoVariacao = namedtuple("EstadoVariacao", ["preco", "custo", "estoque", "minimo"])
+
+SNAPSHOT_ID = 1
+
+
+def consulta_metricas():
+    """Monta o SELECT único com todas as métricas dos cartões"""
+    cv = models.ColorVariation
+    preco = func.coalesce(cv.variation_price, 0)
+    custo = func.coalesce(cv.cost_price, 0)
+
+    return select(
+        # Total de SKUs
+        func.count(cv.id).label("total_skus"),
+        # Valor em estoque: preço * quantidade
+        func.coalesce(func.sum(cv.variation_price * cv.available_stock), 0).label("valor_estoque"),
+        # Lucro potencial: (preço - custo) * quantidade
+        func.coalesce(func.sum((cv.variation_price - cv.cost_price) * cv.available_stock), 0).label("lucro_potencial"),
+        # Soma das margens ((preço - custo) / preço) * 100 entre as variações com preço
+        # (type_coerce evita que o resultado seja arredondado para a escala de preço)
+        type_coerce(func.coalesce(func.sum(
+            case((cv.variation_price > 0, (preco - custo) * 100.0 / preco), else_=None)
+        ), 0), Numeric(18, 6)).label("soma_margens"),
+        func.coalesce(func.sum(case((cv.variation_price > 0, 1), else_=0)), 0).label("skus_com_preco"),
+        # SKUs com estoque > 0
+        func.coalesce(func.sum(case((cv.available_stock > 0, 1), else_=0)), 0).label("skus_com_estoque"),
+        # Críticos: estoque <= mínimo configurado
+        func.coalesce(func.sum(
+            case((cv.available_stock <= cv.min_stock_alert, 1), else_=0)
+        ), 0).label("qtd_criticos"),
+        # Baixos: estoque = mínimo + 1 (apenas quando há mínimo configurado)
+        func.coalesce(func.sum(
+            case(((cv.min_stock_alert > 0) & (cv.available_stock == cv.min_stock_alert + 1), 1), else_=0)
+        ), 0).label("qtd_baixos"),
+        # Zerados
+        func.coalesce(func.sum(case((cv.available_stock == 0, 1), else_=0)), 0).label("qtd_zerados"),
+    )
+
+
+def _formatar_metricas(valores):
+    """Converte os agregados brutos no dicionário usado pelos cartões"""
+    total_skus = int(valores["total_skus"] or 0)
+    skus_com_estoque = int(valores["skus_com_estoque"] or 0)
+    skus_com_preco = int(valores["skus_com_preco"] or 0)
+    percentual_estoque = (skus_com_estoque / total_skus) * 100 if total_skus > 0 else 0
+    margem_media = float(valores["soma_margens"] or 0) / skus_com_preco if skus_com_preco > 0 else 0
+
+    return {
+        "total_skus": total_skus,
+        "valor_estoque": float(valores["valor_estoque"] or 0),
+        "lucro_potencial": float(valores["lucro_potencial"] or 0),
+        "margem_media": margem_media,
+        "percentual_estoque": percentual_estoque,
+        "qtd_criticos": int(valores["qtd_criticos"] or 0),
+        "qtd_baixos": int(valores["qtd_baixos"] or 0),
+        "qtd_zerados": int(valores["qtd_zerados"] or 0),
+    }
+
+
+def _agregados(db):
+    """Executa a consulta agregada completa e retorna os valores brutos"""
+    linha = db.execute(consulta_metricas()).one()
+    return {campo: getattr(linha, campo) for campo in CAMPOS_SNAPSHOT}
+
+
+def calcular_metricas(db):
+    """Calcula as métricas direto da tabela de variações (sem usar o snapshot)"""
+    return _formatar_metricas(_agregados(db))
+
+
+# =========================================
+# DELTAS
+# =========================================
+
+def _dec(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor))
+
+
+def estado_variacao(variacao):
+    """Captura o estado de uma ColorVariation relevante para o dashboard"""
+    return EstadoVariacao(
+        preco=_dec(variacao.variation_price),
+        custo=_dec(variacao.cost_price),
+        estoque=variacao.available_stock,
+        minimo=variacao.min_stock_alert,
+    )
+
+
+def contribuicao(estado):
+    """Quanto uma variação soma em cada campo do snapshot (mesmas regras do SQL)"""
+    if estado is None:
+        return {campo: 0 for campo in CAMPOS_SNAPSHOT}
+
+    preco, custo, estoque, minimo = estado
+    tem_preco = preco is not None and preco > 0
+
+    return {
+        "total_skus": 1,
+        "valor_estoque": preco * estoque if preco is not None and estoque is not None else 0,
+        "lucro_potencial": (
+            (preco - custo) * estoque
+            if preco is not None and custo is not None and estoque is not None else 0
+        ),
+        "soma_margens": (
+            ((preco - (custo or 0)) * 100 / preco).quantize(Decimal("0.000001"))
+            if tem_preco else 0
+        ),
+        "skus_com_preco": 1 if tem_preco else 0,
+        "skus_com_estoque": 1 if estoque is not None and estoque > 0 else 0,
+        "qtd_criticos": 1 if estoque is not None and minimo is not None and estoque <= minimo else 0,
+        "qtd_baixos": 1 if minimo is not None and minimo > 0 and estoque == minimo + 1 else 0,
+        "qtd_zerados": 1 if estoque == 0 else 0,
+    }
+
+
+def delta_variacoes(alteracoes):
+    """
+    Soma o delta de uma lista de alterações (antes, depois).
+    Use None em 'antes' para variações novas e em 'depois' para excluídas.
+    """
+    delta = {campo: 0 for campo in CAMPOS_SNAPSHOT}
+    for antes, depois in alteracoes:
+        c_antes = contribuicao(antes)
+        c_depois = contribuicao(depois)
+        for campo in CAMPOS_SNAPSHOT:
+            delta[campo] += c_depois[campo] - c_antes[campo]
+    return delta
+
+
+def aplicar_delta(db, delta):
+    """
+    Aplica o delta no snapshot com um UPDATE atômico (coluna = coluna + delta).
+    Deve ser chamado dentro da mesma transação que alterou as variações.
+    Se o snapshot ainda não existir, não faz nada (ele será criado do zero).
+    """
+    valores = {campo: valor for campo, valor in delta.items() if valor}
+    if not valores:
+        return
+
+    # Grava antes as alterações pendentes das variações: o snapshot é sempre a
+    # última linha travada na transação (mesma ordem em todas as rotas)
+    db.flush()
+
+    snapshot = models.DashboardSnapshot
+    db.execute(
+        update(snapshot)
+        .where(snapshot.id == SNAPSHOT_ID)
+        .values(
+            updated_at=datetime.datetime.utcnow(),
+            **{campo: getattr(snapshot, campo) + valor for campo, valor in valores.items()}
+        )
+    )
+
+
+def registrar_alteracoes(db, alteracoes):
+    """Atalho: calcula e aplica o delta de uma lista de (antes, depois)"""
+    aplicar_delta(db, delta_variacoes(alteracoes))
+
+
+# =========================================
+# LEITURA E RECONSTRUÇÃO
+# =========================================
+
+def reconstruir_snapshot(db):
+    """
+    Recalcula o snapshot do zero a partir de color_variations.
+    Retorna (valores_antigos, valores_novos); valores_antigos é None se não existia.
+    Não faz commit.
+    """
+    # Trava a linha do snapshot antes de agregar: deltas concorrentes esperam
+    # o fim da reconstrução e são aplicados por cima do valor novo
+    atual = db.query(models.DashboardSnapshot).filter(
+        models.DashboardSnapshot.id == SNAPSHOT_ID
+    ).with_for_update().first()
+
+    novos = _agregados(db)
+    antigos = None
+
+    if atual:
+        antigos = {campo: getattr(atual, campo) for campo in CAMPOS_SNAPSHOT}
+        for campo, valor in novos.items():
+            setattr(atual, campo, valor)
+        atual.updated_at = datetime.datetime.utcnow()
+    else:
+        db.add(models.DashboardSnapshot(
+            id=SNAPSHOT_ID,
+            updated_at=datetime.datetime.utcnow(),
+            **novos
+        ))
+
+    db.flush()
+    return antigos, novos
+
+
+def ler_metricas(db):
+    """Lê as métricas do snapshot (O(1)); cria o snapshot na primeira leitura"""
+    snapshot = db.query(models.DashboardSnapshot).filter(
+        models.DashboardSnapshot.id == SNAPSHOT_ID
+    ).first()
+
+    if snapshot is None:
+        try:
+            _, novos = reconstruir_snapshot(db)
+            db.commit()
+            return _formatar_metricas(novos)
+        except Exception as e:
+            print(f"[AVISO] Nao foi possivel criar o snapshot do dashboard: {e}")
+            db.rollback()
+            return calcular_metricas(db)
+
+    return _formatar_metricas({campo: getattr(snapshot, campo) for campo in CAMPOS_SNAPSHOT})
+
+
+if __name__ == "__main__":
+    import sys
+    import database
+
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir":
+        print("Uso: python dashboard.py reconstruir")
+        sys.exit(1)
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    db = database.SessionLocal()
+    try:
+        antigos, novos = reconstruir_snapshot(db)
+        db.commit()
+        print("[OK] Snapshot do dashboard reconstruido")
+        divergencias = 0
+        for campo in CAMPOS_SNAPSHOT:
+            novo = Decimal(str(novos[campo] or 0))
+            antigo = Decimal(str(antigos[campo] or 0)) if antigos else None
+            marca = ""
+            # Margens são arredondadas a 6 casas por variação; ignora o resíduo
+            tolerancia = Decimal("0.01") if campo == "soma_margens" else 0
+            if antigo is not None and abs(antigo - novo) > tolerancia:
+                marca = "  <-- divergente"
+                divergencias += 1
+            print(f"  {campo}: {antigo} -> {novo}{marca}")
+        if antigos is None:
+            print("Snapshot nao existia; criado do zero.")
+        elif divergencias:
+            print(f"[AVISO] {divergencias} campo(s) divergiam do calculo completo")
+        else:
+            print("[OK] Snapshot estava consistente")
+    finally:
+        db.close()
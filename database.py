@@ -1,8 +1,12 @@
 import os
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
+from db_pool import argumentos_engine, modo_serverless
+
 # 1. Carrega as variáveis do arquivo .env
 load_dotenv()
 
@@ -41,73 +45,92 @@ elif "usuario:senha" in SQLALCHEMY_DATABASE_URL or "nome_do_banco" in SQLALCHEMY
 if SQLALCHEMY_DATABASE_URL and not is_placeholder and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# 3. Cria o motor de conexão apenas se não for placeholder
-if is_placeholder:
-    # Não cria engine se for placeholder - a aplicação funcionará sem banco
-    engine = None
-    DATABASE_AVAILABLE = False
-else:
-    # Tenta criar o motor de conexão
-    try:
-        engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
-        DATABASE_AVAILABLE = True
-        print("[OK] Engine do banco de dados criado com sucesso!")
-    except Exception as e:
-        error_msg = str(e)
-        print("=" * 60)
-        print(f"ERRO: Nao foi possivel criar o engine do banco: {e}")
-        print("=" * 60)
+# 3. O motor de conexão é criado por get_engine(). Fora do modo serverless ele
+# é criado já na importação (como antes); no modo serverless só na primeira
+# requisição que usar o banco, e reaproveitado nas invocações seguintes
+# enquanto a instância estiver quente.
+SERVERLESS = modo_serverless()
+
+engine = None
+SessionLocal = None
+DATABASE_AVAILABLE = not is_placeholder
+_lock_engine = threading.RLock()
+
+
+def get_engine():
+    """Retorna o engine síncrono, criando-o na primeira chamada (None se indisponível)"""
+    global engine, SessionLocal, DATABASE_AVAILABLE
+    if engine is not None or not DATABASE_AVAILABLE:
+        return engine
+
+    with _lock_engine:
+        if engine is not None or not DATABASE_AVAILABLE:
+            return engine
+        # Tenta criar o motor de conexão
+        try:
+            # Tamanho do pool, overflow, recycle, pre-ping e modo pgbouncer vêm do .env (ver db_pool.py)
+            argumentos_pool, _ = argumentos_engine(make_url(SQLALCHEMY_DATABASE_URL), "sincrono")
+            novo_engine = create_engine(SQLALCHEMY_DATABASE_URL, **argumentos_pool)
+            # Cria SessionLocal junto com o engine
+            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=novo_engine)
+            engine = novo_engine
+            print("[OK] Engine do banco de dados criado com sucesso!")
+        except Exception as e:
+            error_msg = str(e)
+            print("=" * 60)
+            print(f"ERRO: Nao foi possivel criar o engine do banco: {e}")
+            print("=" * 60)
         
-        # Mensagens específicas para diferentes tipos de erro
-        if "could not translate host name" in error_msg.lower() or "name resolution" in error_msg.lower():
-            print("ERRO ESPECIFICO: Nao foi possivel resolver o nome do servidor")
-            print("\nPossiveis causas:")
-            print("1. Problema de conexao com a internet")
-            print("2. Hostname incorreto na DATABASE_URL")
-            print("3. Projeto Supabase pausado ou inativo")
-            print("4. Problemas de DNS")
-            print("\nSolucoes:")
-            print("1. Verifique sua conexao com a internet")
-            print("2. Acesse https://supabase.com/dashboard e verifique se o projeto esta ATIVO")
-            print("3. Se o projeto estiver pausado, clique em 'Restore' ou 'Resume'")
-            print("4. Obtenha a URL correta em: Settings -> Database -> Connection string")
-            print("5. Verifique se o hostname esta correto (pode ser aws-0, aws-1, etc.)")
-            print("6. Execute: python testar_conexao.py para diagnosticar o problema")
-        elif "password authentication failed" in error_msg.lower():
-            print("ERRO: Autenticacao falhou")
-            print("\nA senha no arquivo .env pode estar incorreta.")
-            print("Verifique a senha no painel do Supabase e atualize o .env")
-        elif "connection" in error_msg.lower() and "refused" in error_msg.lower():
-            print("ERRO: Conexao recusada")
-            print("\nPossiveis causas:")
-            print("1. Projeto Supabase pausado")
-            print("2. Porta incorreta na URL")
-            print("3. Firewall bloqueando a conexao")
-            print("\nSolucoes:")
-            print("1. Verifique se o projeto Supabase esta ativo")
-            print("2. Use a porta correta (6543 para pooler, 5432 para direto)")
-            print("3. Verifique configuracoes de firewall/antivirus")
-        else:
-            print("Verifique se a DATABASE_URL no arquivo .env esta correta.")
-            print("Consulte o arquivo SOLUCAO_CONEXAO.md para mais detalhes.")
+            # Mensagens específicas para diferentes tipos de erro
+            if "could not translate host name" in error_msg.lower() or "name resolution" in error_msg.lower():
+                print("ERRO ESPECIFICO: Nao foi possivel resolver o nome do servidor")
+                print("\nPossiveis causas:")
+                print("1. Problema de conexao com a internet")
+                print("2. Hostname incorreto na DATABASE_URL")
+                print("3. Projeto Supabase pausado ou inativo")
+                print("4. Problemas de DNS")
+                print("\nSolucoes:")
+                print("1. Verifique sua conexao com a internet")
+                print("2. Acesse https://supabase.com/dashboard e verifique se o projeto esta ATIVO")
+                print("3. Se o projeto estiver pausado, clique em 'Restore' ou 'Resume'")
+                print("4. Obtenha a URL correta em: Settings -> Database -> Connection string")
+                print("5. Verifique se o hostname esta correto (pode ser aws-0, aws-1, etc.)")
+                print("6. Execute: python testar_conexao.py para diagnosticar o problema")
+            elif "password authentication failed" in error_msg.lower():
+                print("ERRO: Autenticacao falhou")
+                print("\nA senha no arquivo .env pode estar incorreta.")
+                print("Verifique a senha no painel do Supabase e atualize o .env")
+            elif "connection" in error_msg.lower() and "refused" in error_msg.lower():
+                print("ERRO: Conexao recusada")
+                print("\nPossiveis causas:")
+                print("1. Projeto Supabase pausado")
+                print("2. Porta incorreta na URL")
+                print("3. Firewall bloqueando a conexao")
+                print("\nSolucoes:")
+                print("1. Verifique se o projeto Supabase esta ativo")
+                print("2. Use a porta correta (6543 para pooler, 5432 para direto)")
+                print("3. Verifique configuracoes de firewall/antivirus")
+            else:
+                print("Verifique se a DATABASE_URL no arquivo .env esta correta.")
+                print("Consulte o arquivo SOLUCAO_CONEXAO.md para mais detalhes.")
         
-        print("\nA aplicacao iniciara sem banco de dados (modo de visualizacao).")
-        print("O dashboard funcionara normalmente, mostrando valores zerados.")
-        print("=" * 60)
-        engine = None
-        DATABASE_AVAILABLE = False
-
-# Cria SessionLocal apenas se o engine estiver disponível
-if engine:
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-else:
-    SessionLocal = None
+            print("\nA aplicacao iniciara sem banco de dados (modo de visualizacao).")
+            print("O dashboard funcionara normalmente, mostrando valores zerados.")
+            print("=" * 60)
+            engine = None
+            DATABASE_AVAILABLE = False
+
+    return engine
+
+
+if not SERVERLESS:
+    get_engine()
 
 Base = declarative_base()
 
 # Dependência para injetar o banco nas rotas
 def get_db():
-    if not DATABASE_AVAILABLE or SessionLocal is None:
+    if get_engine() is None or SessionLocal is None:
         yield None
         return
     
@@ -123,4 +146,87 @@ def get_db():
             try:
                 db.close()
             except:
-                pass
\ No newline at end of file
+                pass
+
+
+# =========================================
+# CAMINHO ASSÍNCRONO (AsyncEngine / AsyncSession)
+# =========================================
+# Usa a mesma DATABASE_URL, trocando o driver para um driver assíncrono
+# (asyncpg para Postgres). As rotas que usam get_async_db fazem "await" nas
+# consultas e não bloqueiam o event loop.
+
+def montar_url_async(url):
+    """Converte a URL síncrona para o driver assíncrono equivalente.
+    Retorna (url_async, connect_args)."""
+    url_obj = make_url(url)
+    connect_args = {}
+
+    if url_obj.get_backend_name() == "postgresql":
+        # asyncpg não aceita sslmode na URL; vira o argumento ssl
+        query = dict(url_obj.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = "require" if sslmode in ("require", "prefer", "allow") else True
+        url_obj = url_obj.set(drivername="postgresql+asyncpg", query=query)
+    elif url_obj.get_backend_name() == "sqlite":
+        url_obj = url_obj.set(drivername="sqlite+aiosqlite")
+
+    return url_obj, connect_args
+
+
+async_engine = None
+AsyncSessionLocal = None
+ASYNC_DATABASE_AVAILABLE = DATABASE_AVAILABLE
+
+
+def get_async_engine():
+    """Retorna o engine assíncrono, criando-o na primeira chamada (None se indisponível)"""
+    global async_engine, AsyncSessionLocal, ASYNC_DATABASE_AVAILABLE
+    if async_engine is not None or not ASYNC_DATABASE_AVAILABLE:
+        return async_engine
+
+    with _lock_engine:
+        if async_engine is not None or not ASYNC_DATABASE_AVAILABLE:
+            return async_engine
+        if get_engine() is None:
+            ASYNC_DATABASE_AVAILABLE = False
+            return None
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+            url_async, connect_args_async = montar_url_async(SQLALCHEMY_DATABASE_URL)
+            argumentos_pool_async, connect_args_pool = argumentos_engine(url_async, "assincrono", assincrono=True)
+            connect_args_async.update(connect_args_pool)
+            novo_engine = create_async_engine(url_async, connect_args=connect_args_async, **argumentos_pool_async)
+            AsyncSessionLocal = async_sessionmaker(bind=novo_engine, autoflush=False, expire_on_commit=False)
+            async_engine = novo_engine
+            print("[OK] Engine assincrono do banco de dados criado com sucesso!")
+        except Exception as e:
+            # Ex: driver asyncpg não instalado. As rotas assíncronas responderão 503.
+            print(f"[AVISO] Nao foi possivel criar o engine assincrono: {e}")
+            print("Instale o driver com: pip install asyncpg")
+            async_engine = None
+            AsyncSessionLocal = None
+            ASYNC_DATABASE_AVAILABLE = False
+    return async_engine
+
+
+if not SERVERLESS:
+    get_async_engine()
+
+# Dependência assíncrona para injetar o banco nas rotas
+async def get_async_db():
+    if get_async_engine() is None or AsyncSessionLocal is None:
+        yield None
+        return
+
+    # Criar a AsyncSession não abre conexão; ela só é obtida no primeiro await
+    db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        try:
+            await db.close()
+        except Exception:
+            pass
@@ -0,0 +1,309 @@
+"""
+Configuração e estatísticas do pool de conexões.
+
+Os parâmetros do pool vêm de variáveis de ambiente, para poder ajustar o
+tamanho sem mexer no código:
+
+    DB_POOL_SIZE       conexões mantidas abertas (padrão 5; 0 = sem pool, NullPool)
+    DB_MAX_OVERFLOW    conexões extras além do pool em picos (padrão 10)
+    DB_POOL_TIMEOUT    segundos esperando uma conexão livre antes de erro (padrão 30)
+    DB_POOL_RECYCLE    recicla conexões mais velhas que N segundos (padrão -1, desligado)
+    DB_POOL_PRE_PING   testa a conexão a cada checkout (padrão true; false no modo pgbouncer)
+    DB_PGBOUNCER       auto | true | false (padrão auto: liga quando a porta é 6543)
+    SERVERLESS         auto | true | false (padrão auto: liga na Vercel / AWS Lambda)
+
+No modo serverless cada instância atende uma requisição por vez, então o
+pool síncrono padrão é pequeno (1 conexão + 2 de overflow) e o assíncrono não
+guarda conexões entre invocações (NullPool), já que o event loop pode mudar
+de uma invocação para outra.
+
+No modo pgbouncer (pooler de transação do Supabase) o pre-ping fica desligado
+por padrão, já que custa uma ida e volta extra por checkout, e o asyncpg
+deixa de usar prepared statements nomeados, que quebram quando transações
+seguidas caem em conexões diferentes do servidor.
+
+Cada pool criado aqui é medido: conexões em uso, overflow, tempo esperando
+por conexão livre e histograma da latência de checkout. Os números ficam em
+GET /api/status/pool.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+
+# Limites superiores (ms) das faixas do histograma de latência de checkout
+FAIXAS_HISTOGRAMA_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+PORTA_POOLER_SUPABASE = 6543
+
+
+def _env_bool(nome, padrao):
+    valor = os.getenv(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    return valor.strip().lower() in ("1", "true", "sim", "yes", "on")
+
+
+def _env_int(nome, padrao):
+    valor = os.getenv(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        print(f"[AVISO] {nome}={valor!r} invalido; usando {padrao}")
+        return padrao
+
+
+def modo_pgbouncer(url):
+    """Indica se a conexão passa por um pooler de transação (pgbouncer/Supavisor)"""
+    valor = (os.getenv("DB_PGBOUNCER") or "auto").strip().lower()
+    if valor in ("1", "true", "sim", "yes", "on"):
+        return True
+    if valor in ("0", "false", "nao", "não", "no", "off"):
+        return False
+    return url.get_backend_name() == "postgresql" and url.port == PORTA_POOLER_SUPABASE
+
+
+def modo_serverless():
+    """Indica se a aplicação roda como função serverless (Vercel, AWS Lambda)"""
+    valor = (os.getenv("SERVERLESS") or "auto").strip().lower()
+    if valor in ("1", "true", "sim", "yes", "on"):
+        return True
+    if valor in ("0", "false", "nao", "não", "no", "off"):
+        return False
+    return bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+def ler_configuracao(url):
+    """Lê a configuração do pool das variáveis de ambiente"""
+    pgbouncer = modo_pgbouncer(url)
+    serverless = modo_serverless()
+    tamanho_padrao, overflow_padrao = (1, 2) if serverless else (5, 10)
+    return {
+        "pool_size": max(_env_int("DB_POOL_SIZE", tamanho_padrao), 0),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", overflow_padrao),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", -1),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", not pgbouncer),
+        "pgbouncer": pgbouncer,
+        "serverless": serverless,
+    }
+
+
+# =========================================
+# ESTATÍSTICAS
+# =========================================
+
+class EstatisticasPool:
+    """Contadores de um pool; atualizados pelo próprio pool a cada checkout"""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.pool = None
+        self.configuracao = None
+        self._lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self.checkouts = 0
+            self.conexoes_criadas = 0
+            self.timeouts = 0
+            self.erros = 0
+            self.esperas = 0
+            self.espera_total_ms = 0.0
+            self.espera_max_ms = 0.0
+            self.checkout_total_ms = 0.0
+            self.checkout_max_ms = 0.0
+            self.histograma = [0] * (len(FAIXAS_HISTOGRAMA_MS) + 1)
+            self.amostras_ms = deque(maxlen=1000)
+            self.desde = time.time()
+
+    def registrar_checkout(self, duracao_ms):
+        faixa = len(FAIXAS_HISTOGRAMA_MS)
+        for i, limite in enumerate(FAIXAS_HISTOGRAMA_MS):
+            if duracao_ms <= limite:
+                faixa = i
+                break
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_total_ms += duracao_ms
+            self.checkout_max_ms = max(self.checkout_max_ms, duracao_ms)
+            self.histograma[faixa] += 1
+            self.amostras_ms.append(duracao_ms)
+
+    def registrar_espera(self, duracao_ms):
+        with self._lock:
+            self.esperas += 1
+            self.espera_total_ms += duracao_ms
+            self.espera_max_ms = max(self.espera_max_ms, duracao_ms)
+
+    def incrementar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def resumo(self):
+        """Dicionário pronto para o endpoint de status"""
+        pool = self.pool
+        with self._lock:
+            amostras = sorted(self.amostras_ms)
+
+            def percentil(p):
+                if not amostras:
+                    return None
+                return round(amostras[min(int(len(amostras) * p), len(amostras) - 1)], 3)
+
+            rotulos = [f"<= {limite} ms" for limite in FAIXAS_HISTOGRAMA_MS] + [f"> {FAIXAS_HISTOGRAMA_MS[-1]} ms"]
+            dados = {
+                "nome": self.nome,
+                "tipo_pool": type(pool).__name__ if pool is not None else None,
+                "configuracao": self.configuracao,
+                "desde": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.desde)),
+                "checkouts": self.checkouts,
+                "conexoes_criadas": self.conexoes_criadas,
+                "timeouts": self.timeouts,
+                "erros": self.erros,
+                "espera": {
+                    "checkouts_que_esperaram": self.esperas,
+                    "total_ms": round(self.espera_total_ms, 3),
+                    "media_ms": round(self.espera_total_ms / self.esperas, 3) if self.esperas else 0,
+                    "max_ms": round(self.espera_max_ms, 3),
+                },
+                "latencia_checkout": {
+                    "media_ms": round(self.checkout_total_ms / self.checkouts, 3) if self.checkouts else 0,
+                    "p50_ms": percentil(0.50),
+                    "p95_ms": percentil(0.95),
+                    "p99_ms": percentil(0.99),
+                    "max_ms": round(self.checkout_max_ms, 3),
+                    "histograma": dict(zip(rotulos, self.histograma)),
+                },
+            }
+
+        # Estado atual do pool (fora do lock das estatísticas)
+        if isinstance(pool, QueuePool):
+            dados.update({
+                "tamanho": pool.size(),
+                "em_uso": pool.checkedout(),
+                "livres": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout_segundos": pool.timeout(),
+            })
+        elif pool is not None:
+            dados.update({"tamanho": 0, "em_uso": None, "livres": 0, "overflow": 0})
+        return dados
+
+
+class _PoolMedido:
+    """Mixin que mede o checkout de conexões de qualquer classe de pool"""
+
+    estatisticas = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estatisticas.pool = self
+
+    def connect(self):
+        # Latência total do checkout: espera na fila + conexão nova + pre-ping
+        inicio = time.perf_counter()
+        try:
+            conexao = super().connect()
+        except exc.TimeoutError:
+            self.estatisticas.incrementar("timeouts")
+            raise
+        except Exception:
+            self.estatisticas.incrementar("erros")
+            raise
+        self.estatisticas.registrar_checkout((time.perf_counter() - inicio) * 1000)
+        return conexao
+
+    def _do_get(self):
+        # Só conta como espera quando o pool está esgotado (todas as conexões
+        # em uso e o overflow no limite)
+        esgotado = (
+            isinstance(self, QueuePool)
+            and self._max_overflow > -1
+            and self._overflow >= self._max_overflow
+            and self._pool.empty()
+        )
+        if not esgotado:
+            return super()._do_get()
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.estatisticas.registrar_espera((time.perf_counter() - inicio) * 1000)
+
+    def _create_connection(self):
+        self.estatisticas.incrementar("conexoes_criadas")
+        return super()._create_connection()
+
+
+# Estatísticas por engine ("sincrono", "assincrono")
+estatisticas_pools = {}
+
+
+def classe_pool_medida(nome, assincrono=False, sem_pool=False):
+    """Cria a classe de pool medida para um engine. recreate() reaproveita a
+    mesma classe, então as estatísticas sobrevivem a uma recriação do pool."""
+    if sem_pool:
+        base = NullPool
+    else:
+        base = AsyncAdaptedQueuePool if assincrono else QueuePool
+    estatisticas = estatisticas_pools.setdefault(nome, EstatisticasPool(nome))
+    return type(f"{base.__name__}Medido", (_PoolMedido, base), {"estatisticas": estatisticas})
+
+
+def argumentos_engine(url, nome, assincrono=False):
+    """
+    Argumentos de create_engine/create_async_engine conforme a configuração.
+    Retorna (kwargs, connect_args). Para SQLite o pool padrão é mantido.
+    """
+    if url.get_backend_name() == "sqlite":
+        return {"pool_pre_ping": True}, {}
+
+    config = ler_configuracao(url)
+    if config["serverless"] and assincrono:
+        # O event loop pode mudar entre invocações; conexões asyncpg não podem ser reaproveitadas
+        config["pool_size"] = 0
+    sem_pool = config["pool_size"] == 0
+    kwargs = {
+        "poolclass": classe_pool_medida(nome, assincrono=assincrono, sem_pool=sem_pool),
+        "pool_pre_ping": config["pool_pre_ping"],
+    }
+    if not sem_pool:
+        kwargs.update({
+            "pool_size": config["pool_size"],
+            "max_overflow": config["max_overflow"],
+            "pool_timeout": config["pool_timeout"],
+            "pool_recycle": config["pool_recycle"],
+        })
+
+    estatisticas_pools[nome].configuracao = config
+
+    connect_args = {}
+    if config["pgbouncer"] and assincrono:
+        # O pooler de transação troca a conexão do servidor entre transações:
+        # sem cache de prepared statements e com nomes únicos para não colidir
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        })
+    return kwargs, connect_args
+
+
+def status_pools(zerar=False):
+    """Estatísticas de todos os pools criados, para o endpoint de status.
+    Com zerar=True os contadores recomeçam depois da leitura."""
+    status = {nome: estatisticas.resumo() for nome, estatisticas in estatisticas_pools.items()}
+    if zerar:
+        for estatisticas in estatisticas_pools.values():
+            estatisticas.zerar()
+    return status
+
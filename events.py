@@ -0,0 +1,304 @@
+"""
+Eventos de estoque em tempo real (Server-Sent Events).
+
+As rotas que alteram estoque (movimentações, criação de ordem de serviço e
+de compra) registram eventos na sessão com publicar(); eles só saem depois
+do commit (um rollback os descarta). Cada página aberta recebe os eventos
+por GET /api/eventos/estoque e atualiza os números no lugar, sem recarregar.
+
+Com vários workers do uvicorn, cada processo só enxerga os próprios commits.
+Para todos receberem tudo, os eventos são repassados pelo Postgres
+(NOTIFY/LISTEN): uma thread por processo mantém uma conexão dedicada que
+escuta o canal "estoque" e também envia os NOTIFY depois do commit, fora do
+caminho da requisição. Sem essa conexão (SQLite, ou falha do LISTEN), os
+eventos são entregues só aos clientes do próprio processo.
+
+O pooler de transação do Supabase (porta 6543) não suporta LISTEN. Nesse
+caso configure a conexão direta:
+    EVENTOS_DATABASE_URL  URL usada só pelo LISTEN/NOTIFY (ex: porta 5432)
+"""
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from dashboard import delta_variacoes
+
+CANAL = "estoque"
+CHAVE_SESSAO = "eventos_estoque"
+LIMITE_PAYLOAD = 7000  # o NOTIFY aceita até 8000 bytes
+
+NIVEL_CRITICO = "critico"
+NIVEL_BAIXO = "baixo"
+NIVEL_NORMAL = "normal"
+
+
+def nivel_estoque(estoque, minimo):
+    """Mesma classificação dos cartões do dashboard (crítico: <= mínimo; baixo: mínimo + 1)"""
+    if estoque is not None and minimo is not None and estoque <= minimo:
+        return NIVEL_CRITICO
+    if minimo is not None and minimo > 0 and estoque == minimo + 1:
+        return NIVEL_BAIXO
+    return NIVEL_NORMAL
+
+
+def evento_variacao(variation_id, product_id, sku, antes, depois):
+    """
+    Evento de mudança de estoque de uma ColorVariation.
+    antes/depois: EstadoVariacao. "metricas" traz o delta dos cartões do dashboard.
+    """
+    metricas = {
+        campo: valor if isinstance(valor, int) else float(valor)
+        for campo, valor in delta_variacoes([(antes, depois)]).items() if valor
+    }
+    return {
+        "tipo": "variacao",
+        "variation_id": variation_id,
+        "product_id": product_id,
+        "sku": sku,
+        "estoque_anterior": antes.estoque,
+        "novo_estoque": depois.estoque,
+        "minimo": depois.minimo,
+        "nivel_anterior": nivel_estoque(antes.estoque, antes.minimo),
+        "nivel": nivel_estoque(depois.estoque, depois.minimo),
+        "metricas": metricas,
+    }
+
+
+def evento_peca(peca, estoque_anterior):
+    """Evento de mudança de estoque de uma RepairPart (ordens de serviço e compras)"""
+    return {
+        "tipo": "peca",
+        "id": peca.id,
+        "device_model": peca.device_model,
+        "part_name": peca.part_name,
+        "estoque_anterior": estoque_anterior,
+        "novo_estoque": peca.available_stock,
+    }
+
+
+def publicar(db, eventos):
+    """Registra eventos para envio depois do commit da sessão"""
+    if eventos:
+        db.info.setdefault(CHAVE_SESSAO, []).extend(eventos)
+
+
+# =========================================
+# DISTRIBUIÇÃO LOCAL (clientes SSE deste processo)
+# =========================================
+
+class Barramento:
+    """
+    Entrega os eventos às conexões SSE abertas (uma asyncio.Queue por cliente)
+    e às funções registradas no processo (ex: índice de SKUs)
+    """
+
+    TAMANHO_FILA = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = []
+        self._funcoes = []
+
+    def registrar(self, funcao):
+        """funcao(eventos) é chamada na thread que distribui; deve ser rápida"""
+        self._funcoes.append(funcao)
+
+    def assinar(self):
+        """Chamado dentro do event loop; retorna a fila do cliente"""
+        fila = asyncio.Queue(maxsize=self.TAMANHO_FILA)
+        with self._lock:
+            self._assinantes.append((asyncio.get_running_loop(), fila))
+        return fila
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._assinantes = [(loop, f) for loop, f in self._assinantes if f is not fila]
+
+    def total_assinantes(self):
+        with self._lock:
+            return len(self._assinantes)
+
+    @staticmethod
+    def _entregar(fila, eventos):
+        if fila.full():
+            # Cliente lento: descarta o atrasado e pede para recarregar os dados
+            while not fila.empty():
+                fila.get_nowait()
+            fila.put_nowait([{"tipo": "recarregar"}])
+            return
+        fila.put_nowait(eventos)
+
+    def distribuir(self, eventos):
+        """Pode ser chamado de qualquer thread"""
+        for funcao in self._funcoes:
+            try:
+                funcao(eventos)
+            except Exception as e:
+                print(f"[ERRO] Erro ao aplicar eventos de estoque: {e}")
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for loop, fila in assinantes:
+            try:
+                loop.call_soon_threadsafe(self._entregar, fila, eventos)
+            except RuntimeError:
+                # Event loop já encerrado
+                self.cancelar(fila)
+
+
+# =========================================
+# REPASSE ENTRE PROCESSOS (Postgres NOTIFY/LISTEN)
+# =========================================
+
+def _blocos(eventos):
+    """Divide a lista em payloads que cabem no NOTIFY"""
+    bloco, tamanho = [], 2
+    for evento in eventos:
+        texto = json.dumps(evento, ensure_ascii=False, default=str)
+        if bloco and tamanho + len(texto.encode()) + 1 > LIMITE_PAYLOAD:
+            yield "[" + ",".join(bloco) + "]"
+            bloco, tamanho = [], 2
+        bloco.append(texto)
+        tamanho += len(texto.encode()) + 1
+    if bloco:
+        yield "[" + ",".join(bloco) + "]"
+
+
+class OuvinteNotify:
+    """Thread com uma conexão dedicada: LISTEN no canal e NOTIFY dos eventos locais"""
+
+    def __init__(self, barramento, obter_url, intervalo_reconexao=5.0):
+        self._barramento = barramento
+        self._obter_url = obter_url
+        self.intervalo_reconexao = intervalo_reconexao
+
+        self._saida = queue.Queue()
+        self._parar = threading.Event()
+        self._thread = None
+        self._despertar_leitura, self._despertar_escrita = os.pipe()
+        self.conectado = False
+        self.ultimo_erro = None
+
+    def rodando(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        if self.rodando():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="eventos-estoque", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._despertar()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.conectado = False
+
+    def enviar(self, eventos):
+        """Agenda o NOTIFY (a thread envia; a requisição não espera)"""
+        self._saida.put(eventos)
+        self._despertar()
+
+    def _despertar(self):
+        try:
+            os.write(self._despertar_escrita, b"x")
+        except OSError:
+            pass
+
+    def _loop(self):
+        while not self._parar.is_set():
+            engine = None
+            conexao = None
+            try:
+                engine = create_engine(self._obter_url(), poolclass=NullPool)
+                conexao = engine.raw_connection()
+                driver = conexao.driver_connection
+                driver.autocommit = True
+                cursor = driver.cursor()
+                cursor.execute(f"LISTEN {CANAL}")
+                self.conectado = True
+                self.ultimo_erro = None
+                print("[OK] Eventos de estoque: escutando o canal do Postgres")
+
+                while not self._parar.is_set():
+                    prontos, _, _ = select.select([driver, self._despertar_leitura], [], [], 5.0)
+                    if self._despertar_leitura in prontos:
+                        os.read(self._despertar_leitura, 4096)
+                    while not self._saida.empty():
+                        for payload in _blocos(self._saida.get_nowait()):
+                            cursor.execute("SELECT pg_notify(%s, %s)", (CANAL, payload))
+                    driver.poll()
+                    while driver.notifies:
+                        notificacao = driver.notifies.pop(0)
+                        self._barramento.distribuir(json.loads(notificacao.payload))
+            except Exception as e:
+                self.ultimo_erro = str(e)[:300]
+                if self.conectado:
+                    print(f"[AVISO] Eventos de estoque: conexão LISTEN perdida ({e}); reconectando")
+                else:
+                    print(f"[AVISO] Eventos de estoque: LISTEN indisponível ({e}); entregando só neste processo")
+            finally:
+                self.conectado = False
+                # O que ficou para enviar vai ao menos para os clientes locais
+                while not self._saida.empty():
+                    self._barramento.distribuir(self._saida.get_nowait())
+                if conexao is not None:
+                    try:
+                        conexao.close()
+                    except Exception:
+                        pass
+                if engine is not None:
+                    engine.dispose()
+            self._parar.wait(self.intervalo_reconexao)
+
+
+def url_eventos():
+    """URL da conexão de LISTEN; None se não houver uma utilizável"""
+    import database
+    from db_pool import modo_pgbouncer
+
+    explicita = os.getenv("EVENTOS_DATABASE_URL")
+    if explicita:
+        return explicita.replace("postgres://", "postgresql://", 1)
+    url = database.SQLALCHEMY_DATABASE_URL
+    if not url or not database.DATABASE_AVAILABLE:
+        return None
+    url_obj = make_url(url)
+    if url_obj.get_backend_name() != "postgresql" or modo_pgbouncer(url_obj):
+        return None
+    return url
+
+
+def despachar(eventos):
+    """Envia eventos já confirmados: via Postgres se o LISTEN estiver ativo, senão local"""
+    if ouvinte_estoque.conectado:
+        ouvinte_estoque.enviar(eventos)
+    else:
+        barramento_estoque.distribuir(eventos)
+
+
+@event.listens_for(Session, "after_commit")
+def _depois_do_commit(sessao):
+    eventos = sessao.info.pop(CHAVE_SESSAO, None)
+    if eventos:
+        despachar(eventos)
+
+
+@event.listens_for(Session, "after_rollback")
+def _depois_do_rollback(sessao):
+    sessao.info.pop(CHAVE_SESSAO, None)
+
+
+# Instâncias únicas usadas pela aplicação
+barramento_estoque = Barramento()
+ouvinte_estoque = OuvinteNotify(barramento_estoque, url_eventos)
@@ -0,0 +1,354 @@
+"""
+Dados da página de finanças (/financas).
+
+Antes a página carregava todo o histórico a cada visita (todas as compras com
+os itens, todas as ordens concluídas com as peças, todas as vendas de
+serviço) e somava custo, frete e margem em laços Python e no JavaScript.
+Aqui:
+
+- os cartões do resumo vêm de três consultas agregadas (SUM/COUNT), uma por
+  origem: compras, ordens concluídas e vendas de serviço
+- o lucro das ordens antigas (sem "profit" gravado) é calculado no próprio
+  SQL com o custo de entrada de cada peça (custo_unitario)
+- cada lista é uma página de POR_PAGINA linhas (LIMIT/OFFSET pelos índices de
+  data), com as peças e serviços lidos só para as linhas da página
+- todas as consultas aceitam o mesmo período (de/até)
+
+O custo da página deixa de crescer com o histórico no Python; o banco faz as
+somas pelos índices de data.
+
+Custo de entrada: ao registrar uma compra, o frete é rateado entre os itens
+(ratear_frete) e cada PurchaseItem guarda o custo unitário com frete
+(landed_unit_cost), copiado para a peça (RepairPart.landed_cost). A
+finalização de ordens e serviços e esta página leem esse valor da peça, sem
+percorrer o histórico de compras; o rateio de uma compra não muda depois.
+"""
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import Numeric, case, desc, func, literal, or_, select
+
+import models
+from api_json import ler_compras
+
+POR_PAGINA = 20
+
+CASAS_CUSTO = Decimal("0.0001")  # landed_cost / landed_unit_cost: Numeric(12, 4)
+
+CEM = literal(Decimal("100"), Numeric(5, 2))
+METADE = literal(Decimal("0.5"), Numeric(3, 2))
+
+
+# =========================================
+# PERÍODO E PAGINAÇÃO
+# =========================================
+
+def _data(valor, campo):
+    if not valor:
+        return None
+    try:
+        return datetime.datetime.strptime(valor, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Data inválida em '{campo}': {valor}. Use o formato AAAA-MM-DD")
+
+
+def intervalo_datas(de=None, ate=None):
+    """(início, fim exclusivo) a partir de datas AAAA-MM-DD; None onde não informado"""
+    inicio = _data(de, "de")
+    fim = _data(ate, "ate")
+    if fim is not None:
+        fim += datetime.timedelta(days=1)  # "até" inclui o dia inteiro
+    return inicio, fim
+
+
+def _no_periodo(coluna, inicio, fim):
+    filtro = []
+    if inicio is not None:
+        filtro.append(coluna >= inicio)
+    if fim is not None:
+        filtro.append(coluna < fim)
+    return filtro
+
+
+def paginacao(total, pagina, por_pagina=POR_PAGINA):
+    """Página pedida limitada ao intervalo existente: {"pagina", "paginas", "total", "deslocamento"}"""
+    paginas = max(1, -(-total // por_pagina))
+    pagina = min(max(1, pagina), paginas)
+    return {"pagina": pagina, "paginas": paginas, "total": total, "deslocamento": (pagina - 1) * por_pagina}
+
+
+# =========================================
+# CUSTO DE ENTRADA (peça + frete)
+# =========================================
+
+def ratear_frete(frete, itens):
+    """
+    Custo unitário com frete de cada item, na ordem recebida. itens: pares
+    (quantidade, custo unitário). O frete é dividido proporcionalmente ao
+    valor de cada item (ou à quantidade, se a compra não tem valor de peças).
+    """
+    frete = Decimal(str(frete or 0))
+    valores = [Decimal(str(custo)) * quantidade for quantidade, custo in itens]
+    total_valor = sum(valores)
+    total_quantidade = sum(quantidade for quantidade, _ in itens)
+    resultado = []
+    for (quantidade, custo), valor in zip(itens, valores):
+        if total_valor > 0:
+            parte = frete * valor / total_valor
+        else:
+            parte = frete * quantidade / total_quantidade
+        resultado.append((Decimal(str(custo)) + parte / quantidade).quantize(CASAS_CUSTO))
+    return resultado
+
+
+def custo_unitario(peca):
+    """Custo de uma unidade da peça: com frete da última compra, senão o cadastrado, senão 50% do preço"""
+    if peca.landed_cost and peca.landed_cost > 0:
+        return float(peca.landed_cost)
+    if peca.cost_price and peca.cost_price > 0:
+        return float(peca.cost_price)
+    return float(peca.price or 0) * 0.5
+
+
+def custo_alterado(peca, novo_custo):
+    """True se o custo informado difere do cadastrado (em centavos)"""
+    atual = Decimal(str(peca.cost_price or 0)).quantize(Decimal("0.01"))
+    return Decimal(str(novo_custo)).quantize(Decimal("0.01")) != atual
+
+
+# =========================================
+# LUCRO DAS ORDENS (expressões SQL)
+# =========================================
+
+def _custo_pecas(ordens):
+    """
+    Custo das peças por ordem (service_order_id, custo_pecas, frete), só das
+    ordens da subconsulta. custo_pecas + frete é a soma de custo_unitario.
+    """
+    op = models.service_order_parts
+    peca = models.RepairPart
+    quantidade = func.coalesce(op.c.quantity, 1)
+    custo_base = case((peca.cost_price > 0, peca.cost_price), else_=func.coalesce(peca.price, 0) * METADE)
+    custo_entrada = case((peca.landed_cost > 0, peca.landed_cost), else_=custo_base)
+    return (
+        select(
+            op.c.service_order_id,
+            func.sum(custo_base * quantidade).label("custo_pecas"),
+            func.sum((custo_entrada - custo_base) * quantidade).label("frete"),
+        )
+        .join(peca, peca.id == op.c.repair_part_id)
+        .where(op.c.service_order_id.in_(ordens))
+        .group_by(op.c.service_order_id)
+        .subquery()
+    )
+
+
+def _colunas_lucro(custo):
+    """receita, custo_pecas, frete, lucro e margem de cada ordem (junção com _custo_pecas)"""
+    ordem = models.ServiceOrder
+    receita = func.coalesce(ordem.total_value, 0)
+    custo_pecas = func.coalesce(custo.c.custo_pecas, 0)
+    frete = func.coalesce(custo.c.frete, 0)
+    # Lucro gravado na finalização; ordens antigas: receita - (peças + frete)
+    lucro = case((ordem.profit.isnot(None), ordem.profit), else_=receita - custo_pecas - frete)
+    margem = case((receita > 0, lucro * CEM / receita), else_=0)
+    return receita, custo_pecas, frete, lucro, margem
+
+
+def _filtro_ordens(inicio, fim):
+    ordem = models.ServiceOrder
+    return [ordem.status == "concluido", *_no_periodo(ordem.created_at, inicio, fim)]
+
+
+# =========================================
+# RESUMO (cartões do topo)
+# =========================================
+
+def resumo_financeiro(db, inicio=None, fim=None):
+    """
+    Totais do período: compras, receita de serviços (ordens + vendas), lucro e
+    margem média (média simples das margens das ordens com margem e das vendas
+    com preço, como antes). Também devolve a quantidade de cada lista.
+    """
+    compra = models.Purchase
+    ordem = models.ServiceOrder
+    venda = models.ServiceSaleHistory
+
+    compras = db.execute(
+        select(func.count(compra.id), func.coalesce(func.sum(compra.total_value), 0))
+        .where(*_no_periodo(compra.created_at, inicio, fim))
+    ).one()
+
+    filtro = _filtro_ordens(inicio, fim)
+    custo = _custo_pecas(select(ordem.id).where(*filtro))
+    receita, _, _, lucro, margem = _colunas_lucro(custo)
+    ordens = db.execute(
+        select(
+            func.count(ordem.id),
+            func.coalesce(func.sum(receita), 0),
+            func.coalesce(func.sum(lucro), 0),
+            func.coalesce(func.sum(case((margem != 0, margem))), 0),
+            func.count(case((margem != 0, 1))),
+        )
+        .outerjoin(custo, custo.c.service_order_id == ordem.id)
+        .where(*filtro)
+    ).one()
+
+    preco = func.coalesce(venda.sale_price, 0)
+    lucro_venda = func.coalesce(venda.profit, 0)
+    vendas = db.execute(
+        select(
+            func.count(venda.id),
+            func.coalesce(func.sum(preco), 0),
+            func.coalesce(func.sum(lucro_venda), 0),
+            func.coalesce(func.sum(case((preco > 0, lucro_venda * CEM / preco))), 0),
+            func.count(case((preco > 0, 1))),
+        )
+        .where(*_no_periodo(venda.sold_at, inicio, fim))
+    ).one()
+
+    margens = ordens[4] + vendas[4]
+    return {
+        "total_compras": float(compras[1]),
+        "total_servicos": float(ordens[1]) + float(vendas[1]),
+        "lucro_total": float(ordens[2]) + float(vendas[2]),
+        "margem_media": (float(ordens[3]) + float(vendas[3])) / margens if margens else 0.0,
+        "qtd_compras": compras[0],
+        "qtd_ordens": ordens[0],
+        "qtd_vendas": vendas[0],
+    }
+
+
+# =========================================
+# LISTAS PAGINADAS
+# =========================================
+
+def ler_compras_pagina(db, inicio=None, fim=None, limite=POR_PAGINA, deslocamento=0):
+    """Uma página de compras do período, com os itens (mesmo formato de /api/compras)"""
+    filtro = _no_periodo(models.Purchase.created_at, inicio, fim)
+    return ler_compras(db, filtro=filtro, limite=limite, deslocamento=deslocamento)
+
+
+def ler_ordens_pagina(db, inicio=None, fim=None, limite=POR_PAGINA, deslocamento=0):
+    """Uma página de ordens concluídas do período, com custo, frete, lucro e margem"""
+    ordem = models.ServiceOrder
+    peca = models.RepairPart
+    servico = models.Service
+    op = models.service_order_parts
+    os_ = models.service_order_services
+
+    pagina = (
+        select(ordem.id)
+        .where(*_filtro_ordens(inicio, fim))
+        .order_by(desc(ordem.created_at), desc(ordem.id))
+        .limit(limite)
+        .offset(deslocamento)
+    )
+    ids = db.scalars(pagina).all()
+    if not ids:
+        return []
+
+    custo = _custo_pecas(ids)
+    receita, custo_pecas, frete, lucro, margem = _colunas_lucro(custo)
+    resultado = []
+    por_id = {}
+    for linha in db.execute(
+        select(
+            ordem.id, ordem.order_number, ordem.client_name, ordem.device_model,
+            ordem.service_description, ordem.status, ordem.created_at, ordem.completed_at,
+            receita.label("total_value"), custo_pecas.label("custo_pecas"), frete.label("frete_proporcional"),
+            (receita - lucro).label("custo_total"), lucro.label("lucro"), margem.label("margem_lucro"),
+        )
+        .outerjoin(custo, custo.c.service_order_id == ordem.id)
+        .where(ordem.id.in_(ids))
+        .order_by(desc(ordem.created_at), desc(ordem.id))
+    ):
+        # Serviços não têm custo de compra (mão de obra não é rastreada)
+        item = dict(linha._mapping, custo_servicos=0, pecas_sem_custo=[], services=[])
+        resultado.append(item)
+        por_id[linha.id] = item
+
+    # Peças sem custo cadastrado (o custo delas é a estimativa de 50% do preço)
+    for linha in db.execute(
+        select(op.c.service_order_id, peca.id, peca.device_model, peca.part_name,
+               func.coalesce(peca.price, 0).label("price"))
+        .join(peca, peca.id == op.c.repair_part_id)
+        .where(
+            op.c.service_order_id.in_(ids),
+            or_(peca.cost_price.is_(None), peca.cost_price <= 0),
+            or_(peca.landed_cost.is_(None), peca.landed_cost <= 0),
+        )
+    ):
+        por_id[linha.service_order_id]["pecas_sem_custo"].append({
+            "id": linha.id,
+            "nome": f"{linha.device_model} - {linha.part_name or 'N/A'}",
+            "preco": linha.price,
+        })
+
+    for linha in db.execute(
+        select(os_.c.service_order_id, servico.id, servico.name,
+               func.coalesce(servico.price, 0).label("price"), func.coalesce(os_.c.quantity, 1).label("quantity"))
+        .join(servico, servico.id == os_.c.service_id)
+        .where(os_.c.service_order_id.in_(ids))
+    ):
+        por_id[linha.service_order_id]["services"].append({
+            "id": linha.id,
+            "name": linha.name,
+            "price": linha.price,
+            "quantity": linha.quantity,
+        })
+    return resultado
+
+
+def ler_vendas_pagina(db, inicio=None, fim=None, limite=POR_PAGINA, deslocamento=0):
+    """Uma página de vendas de serviço (finalizadas direto do card) do período"""
+    venda = models.ServiceSaleHistory
+    return [
+        dict(linha._mapping)
+        for linha in db.execute(
+            select(
+                venda.id, venda.service_name,
+                func.coalesce(venda.sale_price, 0).label("sale_price"),
+                venda.part_cost,
+                func.coalesce(venda.profit, 0).label("profit"),
+                venda.sold_at,
+            )
+            .where(*_no_periodo(venda.sold_at, inicio, fim))
+            .order_by(desc(venda.sold_at), desc(venda.id))
+            .limit(limite)
+            .offset(deslocamento)
+        )
+    ]
+
+
+def dados_financas(db, de=None, ate=None, pagina_compras=1, pagina_ordens=1, pagina_vendas=1):
+    """Contexto do template: resumo do período e a página pedida de cada lista"""
+    inicio, fim = intervalo_datas(de, ate)
+    resumo = resumo_financeiro(db, inicio, fim)
+
+    paginas = {
+        "compras": paginacao(resumo["qtd_compras"], pagina_compras),
+        "ordens": paginacao(resumo["qtd_ordens"], pagina_ordens),
+        "vendas": paginacao(resumo["qtd_vendas"], pagina_vendas),
+    }
+    return {
+        "resumo": resumo,
+        "paginas": paginas,
+        "purchases": ler_compras_pagina(db, inicio, fim, deslocamento=paginas["compras"]["deslocamento"]),
+        "service_orders": ler_ordens_pagina(db, inicio, fim, deslocamento=paginas["ordens"]["deslocamento"]),
+        "service_sales": ler_vendas_pagina(db, inicio, fim, deslocamento=paginas["vendas"]["deslocamento"]),
+    }
+
+
+def dados_financas_vazios():
+    """Contexto do template sem banco (ou com erro): zeros e listas vazias"""
+    resumo = {"total_compras": 0.0, "total_servicos": 0.0, "lucro_total": 0.0, "margem_media": 0.0,
+              "qtd_compras": 0, "qtd_ordens": 0, "qtd_vendas": 0}
+    pagina = paginacao(0, 1)
+    return {
+        "resumo": resumo,
+        "paginas": {"compras": pagina, "ordens": pagina, "vendas": pagina},
+        "purchases": [],
+        "service_orders": [],
+        "service_sales": [],
+    }
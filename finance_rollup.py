@@ -0,0 +1,267 @@
+"""
+Totais financeiros por dia e por mês (tabelas finance_daily e finance_monthly).
+
+Receita, custo e lucro ficam espalhados por service_orders.profit,
+service_sale_history e purchases; um resumo de período teria que percorrer
+as três tabelas. Aqui cada evento financeiro soma a sua parte na linha do
+dia e na linha do mês, na mesma transação da rota que o gravou:
+
+- criar_compra: quantidade, valor e frete da compra (pela data da compra)
+- finalizar_ordem_servico: receita (total_value), custo e lucro da ordem
+  (pela data de conclusão); editar ou excluir uma ordem finalizada, ou
+  finalizar de novo, desconta a contribuição anterior
+- finalizar_servico: receita, custo da peça e lucro da venda
+
+O incremento é um INSERT ... ON CONFLICT DO UPDATE (coluna = coluna + delta),
+então duas rotas simultâneas no mesmo dia não perdem valores: a segunda
+espera a trava da linha até o commit da primeira. Um gráfico de 3 anos por
+mês lê 36 linhas.
+
+Datas em UTC, como as colunas de origem. Ordens concluídas pela edição
+(sem finalizar) não têm lucro gravado e ficam de fora, também na
+reconstrução. Para criar as tabelas a partir do histórico (ou conferir os
+totais):
+
+    python finance_rollup.py reconstruir
+"""
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, func, insert, select, text
+
+import models
+from counters import insert_dialeto
+
+GRANULARIDADES = ("dia", "mes")
+
+# Campos acumulados (mesmos nomes das colunas de TotaisFinanceiros)
+CAMPOS_TOTAIS = (
+    "purchases_count",
+    "purchases_value",
+    "shipping_value",
+    "orders_count",
+    "orders_revenue",
+    "orders_cost",
+    "orders_profit",
+    "sales_count",
+    "sales_revenue",
+    "sales_cost",
+    "sales_profit",
+)
+
+
+def inicio_do_mes(dia):
+    return dia.replace(day=1)
+
+
+def _dia(quando):
+    return quando.date() if isinstance(quando, datetime.datetime) else quando
+
+
+def _dec(valor):
+    return Decimal(str(valor or 0))
+
+
+# =========================================
+# INCREMENTO (mesma transação da rota)
+# =========================================
+
+def registrar(db, quando, **delta):
+    """
+    Soma o delta (campos de CAMPOS_TOTAIS) na linha do dia e na do mês de
+    "quando". Não faz commit.
+    """
+    valores = {campo: valor for campo, valor in delta.items() if valor}
+    if not valores:
+        return
+    dia = _dia(quando)
+    for tabela, inicio in ((models.FinanceDaily, dia), (models.FinanceMonthly, inicio_do_mes(dia))):
+        linha = {campo: valores.get(campo, 0) for campo in CAMPOS_TOTAIS}
+        stmt = insert_dialeto(db, tabela).values(period_start=inicio, **linha)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[tabela.period_start],
+            set_={campo: getattr(tabela, campo) + getattr(stmt.excluded, campo) for campo in valores},
+        ))
+
+
+def registrar_compra(db, quando, valor_total, frete):
+    registrar(db, quando, purchases_count=1, purchases_value=_dec(valor_total), shipping_value=_dec(frete))
+
+
+def estado_ordem(ordem):
+    """(data de conclusão, receita, lucro) se a ordem conta nos totais, senão None"""
+    if ordem.status != "concluido" or ordem.profit is None or ordem.completed_at is None:
+        return None
+    return ordem.completed_at, _dec(ordem.total_value), _dec(ordem.profit)
+
+
+def registrar_ordem(db, antes, depois):
+    """
+    Aplica a mudança de uma ordem (estados de estado_ordem antes e depois da
+    alteração): desconta a contribuição antiga e soma a nova.
+    """
+    for estado, sinal in ((antes, -1), (depois, 1)):
+        if estado is None:
+            continue
+        quando, receita, lucro = estado
+        registrar(
+            db, quando,
+            orders_count=sinal,
+            orders_revenue=sinal * receita,
+            orders_cost=sinal * (receita - lucro),
+            orders_profit=sinal * lucro,
+        )
+
+
+def registrar_venda(db, quando, preco, custo, lucro):
+    registrar(db, quando, sales_count=1, sales_revenue=_dec(preco), sales_cost=_dec(custo), sales_profit=_dec(lucro))
+
+
+# =========================================
+# LEITURA (GET /api/financas/resumo)
+# =========================================
+
+def _periodo(dia, granularidade):
+    return dia.isoformat() if granularidade == "dia" else dia.strftime("%Y-%m")
+
+
+def ler_resumo(db, inicio=None, fim=None, granularidade="mes"):
+    """
+    Totais por período entre as datas (fim exclusivo, ver finance.intervalo_datas),
+    em ordem cronológica; períodos sem movimento não aparecem. Com
+    granularidade "mes", os meses de "inicio" e de "fim" entram inteiros.
+    """
+    tabela = models.FinanceDaily if granularidade == "dia" else models.FinanceMonthly
+    filtro = []
+    if inicio is not None:
+        dia = inicio.date()
+        filtro.append(tabela.period_start >= (dia if granularidade == "dia" else inicio_do_mes(dia)))
+    if fim is not None:
+        filtro.append(tabela.period_start < fim.date())
+
+    periodos = []
+    totais = {campo: Decimal(0) for campo in CAMPOS_TOTAIS}
+    for linha in db.execute(
+        select(tabela.period_start, *(getattr(tabela, campo) for campo in CAMPOS_TOTAIS))
+        .where(*filtro)
+        .order_by(tabela.period_start)
+    ):
+        valores = {campo: getattr(linha, campo) for campo in CAMPOS_TOTAIS}
+        for campo in CAMPOS_TOTAIS:
+            totais[campo] += _dec(valores[campo])
+        periodos.append({"periodo": _periodo(_dia(linha.period_start), granularidade), **_formatar(valores)})
+    return {"granularidade": granularidade, "periodos": periodos, "totais": _formatar(totais)}
+
+
+def _formatar(valores):
+    """Valores para JSON, com receita e lucro somando ordens e vendas"""
+    resultado = {
+        campo: int(valor or 0) if campo.endswith("_count") else float(valor or 0)
+        for campo, valor in valores.items()
+    }
+    resultado["revenue"] = resultado["orders_revenue"] + resultado["sales_revenue"]
+    resultado["cost"] = resultado["orders_cost"] + resultado["sales_cost"]
+    resultado["profit"] = resultado["orders_profit"] + resultado["sales_profit"]
+    return resultado
+
+
+# =========================================
+# RECONSTRUÇÃO
+# =========================================
+
+def _por_dia(db, coluna, *somas, filtro=()):
+    """{dia: [somas...]} agrupando pela data da coluna"""
+    dia = func.date(coluna)
+    resultado = {}
+    for linha in db.execute(select(dia, *somas).where(coluna.isnot(None), *filtro).group_by(dia)):
+        chave = linha[0] if isinstance(linha[0], datetime.date) else datetime.date.fromisoformat(linha[0])
+        resultado[chave] = [_dec(valor) for valor in linha[1:]]
+    return resultado
+
+
+def reconstruir_totais(db):
+    """
+    Recalcula as duas tabelas do zero a partir de purchases, service_orders
+    (concluídas com lucro gravado) e service_sale_history. Retorna o número
+    de linhas (dias, meses). Não faz commit.
+    """
+    compra = models.Purchase
+    ordem = models.ServiceOrder
+    venda = models.ServiceSaleHistory
+
+    # Incrementos concorrentes esperam o fim da reconstrução (e os que já
+    # estavam em andamento terminam antes da leitura do histórico)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE finance_daily, finance_monthly IN SHARE ROW EXCLUSIVE MODE"))
+
+    receita = func.coalesce(ordem.total_value, 0)
+    origens = (
+        (("purchases_count", "purchases_value", "shipping_value"), _por_dia(
+            db, compra.created_at,
+            func.count(compra.id), func.sum(func.coalesce(compra.total_value, 0)),
+            func.sum(func.coalesce(compra.shipping_cost, 0)),
+        )),
+        (("orders_count", "orders_revenue", "orders_cost", "orders_profit"), _por_dia(
+            db, ordem.completed_at,
+            func.count(ordem.id), func.sum(receita), func.sum(receita - ordem.profit), func.sum(ordem.profit),
+            filtro=(ordem.status == "concluido", ordem.profit.isnot(None)),
+        )),
+        (("sales_count", "sales_revenue", "sales_cost", "sales_profit"), _por_dia(
+            db, venda.sold_at,
+            func.count(venda.id), func.sum(func.coalesce(venda.sale_price, 0)),
+            func.sum(func.coalesce(venda.part_cost, 0)), func.sum(func.coalesce(venda.profit, 0)),
+        )),
+    )
+
+    dias = {}
+    meses = {}
+    for campos, por_dia in origens:
+        for dia, somas in por_dia.items():
+            for destino, chave in ((dias, dia), (meses, inicio_do_mes(dia))):
+                linha = destino.setdefault(chave, {campo: Decimal(0) for campo in CAMPOS_TOTAIS})
+                for campo, valor in zip(campos, somas):
+                    linha[campo] += valor
+
+    for tabela, linhas in ((models.FinanceDaily, dias), (models.FinanceMonthly, meses)):
+        db.execute(delete(tabela))
+        if linhas:
+            db.execute(insert(tabela), [
+                {"period_start": chave, **{campo: int(v) if campo.endswith("_count") else v for campo, v in valores.items()}}
+                for chave, valores in sorted(linhas.items())
+            ])
+    db.flush()
+    return len(dias), len(meses)
+
+
+if __name__ == "__main__":
+    import sys
+    import database
+
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir":
+        print("Uso: python finance_rollup.py reconstruir")
+        sys.exit(1)
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    db = database.SessionLocal()
+    try:
+        antes = ler_resumo(db)["totais"]
+        dias, meses = reconstruir_totais(db)
+        db.commit()
+        depois = ler_resumo(db)["totais"]
+        print(f"[OK] Totais financeiros reconstruidos: {dias} dia(s), {meses} mes(es)")
+        divergencias = 0
+        for campo in CAMPOS_TOTAIS:
+            marca = ""
+            if abs(antes[campo] - depois[campo]) > 0.005:
+                marca = "  <-- divergente"
+                divergencias += 1
+            print(f"  {campo}: {antes[campo]} -> {depois[campo]}{marca}")
+        if divergencias:
+            print(f"[AVISO] {divergencias} campo(s) divergiam do historico")
+        else:
+            print("[OK] Totais estavam consistentes")
+    finally:
+        db.close()
@@ -0,0 +1,192 @@
+"""
+Fila de movimentações com commit em grupo (opcional).
+
+Em picos de venda cada POST /api/movimentacoes paga um commit síncrono no
+banco remoto. Com a fila ligada, as requisições entregam a movimentação a
+uma thread gravadora e esperam a resposta; a thread junta o que chegou em
+poucos milissegundos (ou enquanto o commit anterior ainda estava em
+andamento) e grava tudo em uma transação só, com stock.movimentar_lote().
+Cada requisição recebe o seu próprio resultado (novo estoque ou erro), já
+confirmado no banco.
+
+Um lote que falha no commit devolve o erro para todas as requisições do
+lote; uma linha recusada (SKU inexistente, estoque insuficiente) não afeta
+as outras, como no endpoint de lote.
+
+A fila é por processo (cada worker do uvicorn tem a sua) e fica desligada no
+modo serverless.
+
+Configuração (variáveis de ambiente):
+    MOVIMENTACOES_GROUP_COMMIT  liga a fila (padrão false)
+    MOVIMENTACOES_JANELA_MS     espera por mais movimentações depois da primeira (padrão 3)
+    MOVIMENTACOES_LOTE_MAX      máximo de movimentações por transação (padrão 200)
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from stock import movimentar_estoque, movimentar_lote, ErroMovimentacao
+
+
+class FilaMovimentacoes:
+    """Thread gravadora que aplica as movimentações recebidas em lotes"""
+
+    def __init__(self, obter_sessao, janela_ms=3.0, lote_max=200, habilitada=False):
+        self._obter_sessao = obter_sessao
+        self.habilitada = habilitada
+        self.janela = janela_ms / 1000
+        self.lote_max = lote_max
+
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+        self.lotes = 0
+        self.movimentos = 0
+        self.maior_lote = 0
+        self.falhas = 0
+
+    # ---------------------------------------------------------
+    # Usado pelas rotas
+    # ---------------------------------------------------------
+    def enviar(self, movimento, timeout=30):
+        """
+        Entrega a movimentação (objeto com sku, movement_type, quantity e
+        reason) e espera o commit do lote. Retorna o resultado da linha no
+        formato de movimentar_lote() ou levanta a exceção do commit.
+        Um TimeoutError não garante que a movimentação deixou de ser gravada.
+        """
+        futuro = Future()
+        self._fila.put((movimento, futuro))
+        return futuro.result(timeout=timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                "habilitada": self.habilitada,
+                "ativa": self.rodando(),
+                "janela_ms": self.janela * 1000,
+                "lote_max": self.lote_max,
+                "pendentes": self._fila.qsize(),
+                "lotes": self.lotes,
+                "movimentos": self.movimentos,
+                "media_por_lote": round(self.movimentos / self.lotes, 2) if self.lotes else None,
+                "maior_lote": self.maior_lote,
+                "falhas": self.falhas,
+            }
+
+    # ---------------------------------------------------------
+    # Thread gravadora
+    # ---------------------------------------------------------
+    def rodando(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        if self.rodando():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="fila-movimentacoes", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """Para a thread depois de gravar o que já estava na fila"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _coletar(self):
+        """Primeira movimentação da fila + as que chegarem dentro da janela"""
+        try:
+            pedidos = [self._fila.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        prazo = time.monotonic() + self.janela
+        while len(pedidos) < self.lote_max:
+            try:
+                # O que já está na fila entra sem esperar; depois só até o prazo
+                pedidos.append(self._fila.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                pedidos.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return pedidos
+
+    @staticmethod
+    def _movimentar_um(db, movimento):
+        """movimentar_estoque() com o resultado no formato de movimentar_lote()"""
+        resultado = {"linha": 0, "sku": movimento.sku}
+        try:
+            aplicado = movimentar_estoque(db, movimento.sku, movimento.movement_type, movimento.quantity, movimento.reason)
+        except ErroMovimentacao as e:
+            resultado.update({"status": "erro", "status_code": e.status_code, "message": e.mensagem})
+            return resultado
+        resultado.update({"status": "sucesso", "estoque_anterior": aplicado.estoque_anterior, "novo_estoque": aplicado.novo_estoque})
+        return resultado
+
+    def _gravar(self, pedidos):
+        db = self._obter_sessao()
+        try:
+            if len(pedidos) == 1:
+                # Sem concorrência no momento: caminho de uma instrução só
+                resultados = [self._movimentar_um(db, pedidos[0][0])]
+            else:
+                resultados = movimentar_lote(db, [movimento for movimento, _ in pedidos])
+            db.commit()
+        except Exception as e:
+            try:
+                db.rollback()
+            except Exception:
+                pass
+            print(f"[ERRO] Erro ao gravar lote de {len(pedidos)} movimentações: {e}")
+            with self._lock:
+                self.falhas += 1
+            for _, futuro in pedidos:
+                futuro.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        with self._lock:
+            self.lotes += 1
+            self.movimentos += len(pedidos)
+            self.maior_lote = max(self.maior_lote, len(pedidos))
+        for (_, futuro), resultado in zip(pedidos, resultados):
+            futuro.set_result(resultado)
+
+    def _loop(self):
+        while not (self._parar.is_set() and self._fila.empty()):
+            pedidos = self._coletar()
+            if not pedidos:
+                continue
+            try:
+                self._gravar(pedidos)
+            except Exception as e:
+                # Ex: falha ao abrir a sessão; ninguém pode ficar esperando
+                print(f"[ERRO] Erro na fila de movimentações: {e}")
+                for _, futuro in pedidos:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+
+
+def _criar_fila():
+    import database
+    return FilaMovimentacoes(
+        obter_sessao=lambda: database.SessionLocal(),
+        janela_ms=float(os.getenv("MOVIMENTACOES_JANELA_MS", "3")),
+        lote_max=max(int(os.getenv("MOVIMENTACOES_LOTE_MAX", "200")), 1),
+        habilitada=os.getenv("MOVIMENTACOES_GROUP_COMMIT", "false").strip().lower() in ("1", "true", "sim", "yes", "on"),
+    )
+
+
+# Instância única usada pela aplicação (iniciada no startup se habilitada)
+fila_movimentacoes = _criar_fila()
@@ -0,0 +1,190 @@
+"""
+Monitor de saúde do banco de dados.
+
+Em vez de cada rota executar "SELECT 1" antes de trabalhar, um monitor em
+segundo plano testa o banco em intervalos fixos e guarda o resultado. As rotas
+apenas consultam o estado em memória.
+
+Depois de algumas falhas seguidas o circuito abre: as rotas passam a responder
+503 imediatamente, sem esperar a conexão falhar. O monitor continua testando
+no mesmo intervalo e fecha o circuito assim que o banco volta.
+
+Configuração (variáveis de ambiente):
+    DB_HEALTH_INTERVAL   intervalo entre testes, em segundos (padrão 15)
+    DB_HEALTH_FAILURES   falhas seguidas para abrir o circuito (padrão 3)
+"""
+import datetime
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import text
+
+ESTADO_DESCONHECIDO = "desconhecido"
+ESTADO_OK = "ok"
+ESTADO_FALHANDO = "falhando"
+ESTADO_CIRCUITO_ABERTO = "circuito_aberto"
+ESTADO_SEM_BANCO = "sem_banco"
+
+
+class MonitorBanco:
+    """Testa o banco periodicamente e mantém um circuit breaker em memória"""
+
+    def __init__(self, obter_engine, intervalo=15.0, limite_falhas=3):
+        self._obter_engine = obter_engine
+        self.intervalo = intervalo
+        self.limite_falhas = limite_falhas
+
+        self._lock = threading.Lock()
+        self._lock_teste = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+        self.estado = ESTADO_DESCONHECIDO
+        self.falhas_consecutivas = 0
+        self.ultimo_erro = None
+        self.ultima_verificacao = None  # time.monotonic() do último teste
+        self.ultima_verificacao_em = None  # datetime (UTC) do último teste
+        self.ultimo_sucesso_em = None
+        self.circuito_aberto_em = None
+        self.latencias_ms = deque(maxlen=20)
+
+    # ---------------------------------------------------------
+    # Teste
+    # ---------------------------------------------------------
+    def testar(self):
+        """Executa um SELECT 1 e atualiza o estado. Retorna True se o banco respondeu."""
+        engine = self._obter_engine()
+        if engine is None:
+            with self._lock:
+                self.estado = ESTADO_SEM_BANCO
+                self.ultima_verificacao = time.monotonic()
+                self.ultima_verificacao_em = datetime.datetime.utcnow()
+            return False
+
+        inicio = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1")).fetchone()
+        except Exception as e:
+            self._registrar_falha(e)
+            return False
+
+        self._registrar_sucesso((time.perf_counter() - inicio) * 1000)
+        return True
+
+    def _registrar_sucesso(self, latencia_ms):
+        with self._lock:
+            if self.estado == ESTADO_CIRCUITO_ABERTO:
+                print("[OK] Banco de dados respondeu novamente; circuito fechado")
+            self.estado = ESTADO_OK
+            self.falhas_consecutivas = 0
+            self.ultimo_erro = None
+            self.circuito_aberto_em = None
+            self.latencias_ms.append(latencia_ms)
+            self.ultima_verificacao = time.monotonic()
+            self.ultima_verificacao_em = datetime.datetime.utcnow()
+            self.ultimo_sucesso_em = self.ultima_verificacao_em
+
+    def _registrar_falha(self, erro):
+        with self._lock:
+            self.falhas_consecutivas += 1
+            self.ultimo_erro = str(erro)[:300]
+            self.ultima_verificacao = time.monotonic()
+            self.ultima_verificacao_em = datetime.datetime.utcnow()
+            if self.falhas_consecutivas >= self.limite_falhas:
+                if self.estado != ESTADO_CIRCUITO_ABERTO:
+                    print(f"[AVISO] Banco de dados falhou {self.falhas_consecutivas} vezes seguidas; circuito aberto")
+                    self.circuito_aberto_em = self.ultima_verificacao_em
+                self.estado = ESTADO_CIRCUITO_ABERTO
+            else:
+                self.estado = ESTADO_FALHANDO
+
+    # ---------------------------------------------------------
+    # Consulta (usada pelas rotas)
+    # ---------------------------------------------------------
+    def disponivel(self):
+        """
+        Retorna se as rotas podem usar o banco, sem fazer I/O na maioria das chamadas.
+        Sem a thread em segundo plano (ex: serverless), testa no máximo uma vez por
+        intervalo, e só uma requisição por vez faz o teste.
+        """
+        desconhecido = self.estado == ESTADO_DESCONHECIDO
+        if desconhecido or (not self.rodando() and self._desatualizado()):
+            # O primeiro teste é esperado por todos; os seguintes só por quem testa
+            if self._lock_teste.acquire(blocking=desconhecido):
+                try:
+                    if self.estado == ESTADO_DESCONHECIDO or self._desatualizado():
+                        self.testar()
+                finally:
+                    self._lock_teste.release()
+
+        # Enquanto o circuito está fechado as rotas tentam normalmente,
+        # mesmo que o último teste tenha falhado
+        return self.estado in (ESTADO_OK, ESTADO_FALHANDO)
+
+    def _desatualizado(self):
+        return self.ultima_verificacao is None or time.monotonic() - self.ultima_verificacao >= self.intervalo
+
+    def status(self):
+        """Resumo do estado para o endpoint de status"""
+        with self._lock:
+            latencias = list(self.latencias_ms)
+            return {
+                "estado": self.estado,
+                "disponivel": self.estado in (ESTADO_OK, ESTADO_FALHANDO),
+                "circuito_aberto": self.estado == ESTADO_CIRCUITO_ABERTO,
+                "falhas_consecutivas": self.falhas_consecutivas,
+                "limite_falhas": self.limite_falhas,
+                "intervalo_segundos": self.intervalo,
+                "monitor_em_execucao": self.rodando(),
+                "ultima_latencia_ms": round(latencias[-1], 2) if latencias else None,
+                "media_latencia_ms": round(sum(latencias) / len(latencias), 2) if latencias else None,
+                "max_latencia_ms": round(max(latencias), 2) if latencias else None,
+                "ultima_verificacao": self.ultima_verificacao_em.isoformat() if self.ultima_verificacao_em else None,
+                "ultimo_sucesso": self.ultimo_sucesso_em.isoformat() if self.ultimo_sucesso_em else None,
+                "circuito_aberto_em": self.circuito_aberto_em.isoformat() if self.circuito_aberto_em else None,
+                "ultimo_erro": self.ultimo_erro,
+            }
+
+    # ---------------------------------------------------------
+    # Thread em segundo plano
+    # ---------------------------------------------------------
+    def rodando(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        """Inicia o teste periódico em uma thread daemon"""
+        if self.rodando():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="monitor-banco", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.testar()
+            except Exception as e:
+                print(f"[ERRO] Erro no monitor do banco: {e}")
+            self._parar.wait(self.intervalo)
+
+
+def _criar_monitor():
+    import database
+    return MonitorBanco(
+        obter_engine=database.get_engine,
+        intervalo=float(os.getenv("DB_HEALTH_INTERVAL", "15")),
+        limite_falhas=int(os.getenv("DB_HEALTH_FAILURES", "3")),
+    )
+
+
+# Instância única usada pela aplicação
+monitor_banco = _criar_monitor()
@@ -0,0 +1,246 @@
+"""
+Posição de estoque em uma data passada (checkpoints do histórico).
+
+Um checkpoint é uma "foto" do saldo de todas as variações em um instante,
+gravada na tabela stock_checkpoints junto com o id da última movimentação
+já incluída nesse saldo (last_movement_id). Para responder "qual era o
+estoque do SKU X no dia D" basta:
+
+    saldo do checkpoint mais recente <= D
+    + movimentações com id > last_movement_id e created_at <= D
+
+ou seja, só o trecho do histórico depois do checkpoint é relido, e não o
+histórico inteiro. Rode um checkpoint periodicamente (ex: todo dia ou no
+fechamento do mês, via cron):
+
+    python ledger.py checkpoint
+    python ledger.py posicao 2024-01-31
+
+Variações criadas depois do checkpoint partem do previous_stock da sua
+primeira movimentação; variações sem checkpoint e sem movimentação nenhuma
+usam o saldo atual (o estoque inicial do cadastro não gera movimentação).
+"""
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import DateTime, Integer, case, func, insert, literal, select, text
+
+import models
+from sku_allocator import escapar_like
+
+
+def delta_movimento():
+    """Variação do saldo por linha do histórico (mesma regra de stock.delta_estoque)"""
+    sm = models.StockMovement
+    return case((sm.movement_type == "entrada", sm.quantity), else_=-sm.quantity)
+
+
+def criar_checkpoint(db):
+    """
+    Grava o saldo atual de todas as variações como um checkpoint, sem commit.
+    Retorna (instante, quantidade de variações, last_movement_id).
+    """
+    sm = models.StockMovement.__table__
+    cv = models.ColorVariation.__table__
+    sc = models.StockCheckpoint.__table__
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Espera as movimentações em andamento terminarem e segura novas até o
+        # commit: uma movimentação com id menor que o last_movement_id mas
+        # ainda não confirmada ficaria fora do saldo e também fora da releitura
+        db.execute(text("LOCK TABLE stock_movements IN SHARE MODE"))
+
+    ultimo_movimento = db.execute(select(func.coalesce(func.max(sm.c.id), 0))).scalar()
+    agora = datetime.datetime.utcnow()
+    resultado = db.execute(
+        insert(sc).from_select(
+            ["variation_id", "checkpoint_at", "stock", "cost_price", "variation_price", "last_movement_id"],
+            select(
+                cv.c.id,
+                literal(agora, DateTime),
+                func.coalesce(cv.c.available_stock, 0),
+                cv.c.cost_price,
+                cv.c.variation_price,
+                literal(ultimo_movimento, Integer),
+            ),
+        )
+    )
+    return agora, resultado.rowcount, ultimo_movimento
+
+
+def posicao_estoque(db, limite, sku=None, produto_id=None):
+    """
+    Saldo e valor de cada variação no instante `limite` (datetime, inclusivo).
+
+    sku filtra por prefixo do full_sku; produto_id por produto.
+    Retorna um dict com as linhas, os totais e o checkpoint usado.
+    """
+    sm = models.StockMovement
+    cv = models.ColorVariation
+    sc = models.StockCheckpoint
+
+    # Checkpoint mais recente até a data (todas as variações de um checkpoint
+    # têm o mesmo checkpoint_at e o mesmo last_movement_id)
+    instante = db.execute(
+        select(func.max(sc.checkpoint_at)).where(sc.checkpoint_at <= limite)
+    ).scalar()
+    ultimo_movimento = 0
+    if instante is not None:
+        ultimo_movimento = db.execute(
+            select(sc.last_movement_id).where(sc.checkpoint_at == instante).limit(1)
+        ).scalar() or 0
+
+    variacoes_query = select(
+        cv.id, cv.full_sku, cv.color_name, cv.available_stock, cv.cost_price, cv.variation_price,
+        models.Product.id.label("product_id"), models.Product.name.label("product_name"),
+    ).join(models.Product, cv.product_id == models.Product.id)
+    if sku:
+        variacoes_query = variacoes_query.where(cv.full_sku.like(f"{escapar_like(sku.strip().upper())}%", escape="\\"))
+    if produto_id is not None:
+        variacoes_query = variacoes_query.where(cv.product_id == produto_id)
+    variacoes = db.execute(variacoes_query.order_by(cv.id)).all()
+    ids = [v.id for v in variacoes]
+    if not ids:
+        return {"data": limite.isoformat(), "checkpoint": instante.isoformat() if instante else None,
+                "movimentos_relidos": 0, "variacoes": [], "total_unidades": 0,
+                "valor_custo": 0.0, "valor_venda": 0.0}
+
+    # Sem filtro o relatório cobre o catálogo todo: dispensa a lista de ids
+    por_id = [sm.variation_id.in_(ids)] if sku or produto_id is not None else []
+
+    checkpoints = {}
+    if instante is not None:
+        checkpoints = {
+            linha.variation_id: linha
+            for linha in db.execute(
+                select(sc.variation_id, sc.stock, sc.cost_price, sc.variation_price)
+                .where(sc.checkpoint_at == instante, *([sc.variation_id.in_(ids)] if por_id else []))
+            )
+        }
+
+    # Releitura: só as movimentações depois do checkpoint (faixa do índice do id)
+    def agregado(*condicoes):
+        return (
+            select(
+                sm.variation_id,
+                func.coalesce(func.sum(delta_movimento()), 0).label("delta"),
+                func.count(sm.id).label("quantidade"),
+                func.min(sm.id).label("primeiro_id"),
+            )
+            .where(sm.id > ultimo_movimento, *por_id, *condicoes)
+            .group_by(sm.variation_id)
+            .subquery()
+        )
+
+    def com_saldo_inicial(subquery):
+        # previous_stock da primeira movimentação de cada grupo
+        return {
+            linha.variation_id: linha
+            for linha in db.execute(
+                select(subquery, sm.previous_stock)
+                .join(sm, sm.id == subquery.c.primeiro_id)
+            )
+        }
+
+    relidos = com_saldo_inicial(agregado(sm.created_at <= limite))
+
+    # Sem checkpoint e sem movimentação até a data: o saldo da época é o
+    # previous_stock da primeira movimentação posterior, se houver
+    sem_base = [i for i in ids if i not in checkpoints and i not in relidos]
+    posteriores = com_saldo_inicial(agregado(sm.created_at > limite, sm.variation_id.in_(sem_base))) if sem_base else {}
+
+    linhas = []
+    total_unidades = 0
+    total_custo = Decimal("0")
+    total_venda = Decimal("0")
+    movimentos_relidos = 0
+    for variacao in variacoes:
+        checkpoint = checkpoints.get(variacao.id)
+        relido = relidos.get(variacao.id)
+        custo = variacao.cost_price
+        preco = variacao.variation_price
+
+        if checkpoint is not None:
+            estoque = checkpoint.stock + (relido.delta if relido else 0)
+            # Custo e preço da época do checkpoint (não há histórico de preço)
+            custo, preco = checkpoint.cost_price, checkpoint.variation_price
+            origem = "checkpoint"
+        elif relido is not None:
+            estoque = (relido.previous_stock or 0) + relido.delta
+            origem = "historico"
+        elif variacao.id in posteriores:
+            estoque = posteriores[variacao.id].previous_stock or 0
+            origem = "historico"
+        else:
+            estoque = variacao.available_stock or 0
+            origem = "atual"
+        if relido is not None:
+            movimentos_relidos += relido.quantidade
+
+        custo = custo or Decimal("0")
+        preco = preco or Decimal("0")
+        total_unidades += estoque
+        total_custo += custo * estoque
+        total_venda += preco * estoque
+        linhas.append({
+            "variation_id": variacao.id,
+            "full_sku": variacao.full_sku,
+            "color_name": variacao.color_name,
+            "product_id": variacao.product_id,
+            "product_name": variacao.product_name,
+            "estoque": estoque,
+            "cost_price": float(custo),
+            "variation_price": float(preco),
+            "valor_custo": float(custo * estoque),
+            "valor_venda": float(preco * estoque),
+            "origem": origem,
+        })
+
+    return {
+        "data": limite.isoformat(),
+        "checkpoint": instante.isoformat() if instante else None,
+        "movimentos_relidos": movimentos_relidos,
+        "variacoes": linhas,
+        "total_unidades": total_unidades,
+        "valor_custo": float(total_custo),
+        "valor_venda": float(total_venda),
+    }
+
+
+def fim_do_dia(data):
+    """Último instante do dia (as consultas por data incluem o dia inteiro)"""
+    return datetime.datetime.combine(data, datetime.time.max)
+
+
+if __name__ == "__main__":
+    import sys
+    import database
+
+    uso = "Uso: python ledger.py checkpoint | python ledger.py posicao AAAA-MM-DD [SKU]"
+    if len(sys.argv) < 2 or sys.argv[1] not in ("checkpoint", "posicao"):
+        print(uso)
+        sys.exit(1)
+
+    if database.get_engine() is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    db = database.SessionLocal()
+    try:
+        if sys.argv[1] == "checkpoint":
+            instante, total, ultimo = criar_checkpoint(db)
+            db.commit()
+            print(f"[OK] Checkpoint de {total} variacoes em {instante:%Y-%m-%d %H:%M:%S} (ultima movimentacao: {ultimo})")
+        else:
+            if len(sys.argv) < 3:
+                print(uso)
+                sys.exit(1)
+            data = datetime.date.fromisoformat(sys.argv[2])
+            posicao = posicao_estoque(db, fim_do_dia(data), sku=sys.argv[3] if len(sys.argv) > 3 else None)
+            for linha in posicao["variacoes"]:
+                print(f"  {linha['full_sku']:<20} {linha['estoque']:>8} un  custo R$ {linha['valor_custo']:>12.2f}  ({linha['origem']})")
+            print(f"Posicao em {data}: {posicao['total_unidades']} un, custo R$ {posicao['valor_custo']:.2f}, "
+                  f"venda R$ {posicao['valor_venda']:.2f}")
+            print(f"Checkpoint usado: {posicao['checkpoint'] or 'nenhum'}; movimentacoes relidas: {posicao['movimentos_relidos']}")
+    finally:
+        db.close()
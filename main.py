@@ -1,72 +1,87 @@
-from fastapi import FastAPI, Request, Depends
-from starlette.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Depends, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, or_, select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from schemas import ProdutoCreate, CorCreate, SupplierCreate, ProdutoUpdate, CorUpdate
 from schemas import MovementCreate, ConfigUpdate, RepairPartCreate, RepairPartUpdate
 from schemas import ServiceCreate, ServiceUpdate
 from schemas import ServiceOrderCreate, ServiceOrderUpdate, ServiceOrderPartCreate, ServiceOrderServiceCreate
 from schemas import PurchaseCreate, PurchaseUpdate, PurchaseItemCreate
 from sqlalchemy import desc
+import asyncio
+import base64
+import datetime
 import json
 import os
-from typing import Optional
+from typing import List, Optional
 
 # Importações dos arquivos que criamos acima
-from database import engine, get_db, DATABASE_AVAILABLE
+import database
+from database import engine, get_db, get_async_db, DATABASE_AVAILABLE
 import models
-
-# Cria as tabelas no banco automaticamente se não existirem
-# Tenta criar as tabelas, mas não falha se não houver conexão
+from migrate import criar_tabelas
+from dashboard import ler_metricas, estado_variacao, registrar_alteracoes
+from health import monitor_banco
+from counters import proximo_numero_documento
+from stock import movimentar_estoque, movimentar_lote, ErroMovimentacao, LIMITE_LOTE
+from ledger import criar_checkpoint, posicao_estoque, fim_do_dia
+from group_commit import fila_movimentacoes
+from events import barramento_estoque, ouvinte_estoque, url_eventos, publicar, evento_peca
+from sku_index import indice_sku, evento_catalogo
+from sku_allocator import sku_base, alocar_skus, escapar_like
+from product_import import Importacao, LeitorCsv, linhas_do_corpo
+from catalog_export import gerar_csv, gerar_ndjson
+from product_update import aplicar_edicao
+from finance import dados_financas, dados_financas_vazios, ratear_frete, custo_unitario, custo_alterado, intervalo_datas
+from finance_rollup import registrar_compra, registrar_ordem, registrar_venda, estado_ordem, ler_resumo, GRANULARIDADES
+from api_json import ler_ordens_servico, ler_compras, serializador_ordens, serializador_compras
+from catalog_version import (
+    VERSAO_PRODUTOS, VERSAO_REPAROS, VERSAO_SERVICOS,
+    ler_versoes, etag, cabecalhos_etag, nao_modificado,
+)
+from db_pool import status_pools
+
+# Cria as tabelas no banco automaticamente se não existirem.
+# No modo serverless isso fica para o comando explícito "python migrate.py",
+# para não pagar a introspecção do catálogo em cada cold start.
+# (Nesse modo o engine ainda não existe aqui: é criado na primeira requisição.)
 if DATABASE_AVAILABLE and engine:
-    try:
-        models.Base.metadata.create_all(bind=engine)
-        print("[OK] Tabelas criadas/verificadas com sucesso")
-    except Exception as e:
-        error_msg = str(e)
-        print("=" * 60)
-        print("[AVISO] Nao foi possivel criar as tabelas no banco de dados")
-        print("=" * 60)
-        
-        # Mensagens específicas para diferentes tipos de erro
-        if "Tenant or user not found" in error_msg or "tenant or user not found" in error_msg.lower():
-            print("ERRO ESPECIFICO: Projeto Supabase nao encontrado")
-            print("\nPossiveis causas:")
-            print("1. O projeto Supabase esta PAUSADO (projetos gratuitos pausam apos inatividade)")
-            print("2. O projeto foi DELETADO ou MOVIDO")
-            print("3. O ID do projeto na URL esta INCORRETO")
-            print("\nSolucoes:")
-            print("1. Acesse https://supabase.com/dashboard")
-            print("2. Verifique se o projeto esta ATIVO (nao pausado)")
-            print("3. Se estiver pausado, clique em 'Restore' ou 'Resume'")
-            print("4. Obtenha a URL correta em: Settings -> Database -> Connection string")
-            print("5. Atualize o arquivo .env com a nova URL")
-        elif "password authentication failed" in error_msg.lower():
-            print("ERRO: Autenticacao falhou")
-            print("\nA senha no arquivo .env pode estar incorreta.")
-            print("Verifique a senha no painel do Supabase e atualize o .env")
-        elif "connection" in error_msg.lower() and "failed" in error_msg.lower():
-            print("ERRO: Falha na conexao com o banco de dados")
-            print("\nVerifique:")
-            print("1. Sua conexao com a internet")
-            print("2. Se o projeto Supabase esta ativo")
-            print("3. Se a URL no .env esta correta")
-        else:
-            print(f"Detalhes do erro: {error_msg[:200]}")
-        
-        print("\nA aplicacao iniciara sem banco de dados (modo visualizacao).")
-        print("O dashboard funcionara normalmente, mostrando valores zerados.")
-        print("=" * 60)
+    # Tenta criar as tabelas, mas não falha se não houver conexão
+    if not criar_tabelas(engine):
         # Marca como não disponível para evitar tentativas futuras
         DATABASE_AVAILABLE = False
-else:
+elif not database.SERVERLESS:
     print("[AVISO] Banco de dados nao configurado. Aplicacao funcionara sem banco (modo visualizacao).")
 
 app = FastAPI(title="Sistema de Gestão de Estoque")
 
-templates = Jinja2Templates(directory="templates")
+class TemplatesSobDemanda:
+    """
+    Cria o Jinja2Templates só quando a primeira página é renderizada.
+    As rotas da API não usam templates, e importar o jinja2 pesa no cold start.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._templates = None
+
+    def _carregar(self):
+        if self._templates is None:
+            from starlette.templating import Jinja2Templates
+            templates_jinja = Jinja2Templates(directory=self.directory)
+            # Registra o filtro no Jinja2
+            templates_jinja.env.filters['formatar_data'] = formatar_data
+            self._templates = templates_jinja
+        return self._templates
+
+    def TemplateResponse(self, *args, **kwargs):
+        return self._carregar().TemplateResponse(*args, **kwargs)
+
+
+templates = TemplatesSobDemanda(directory="templates")
 
 # Filtro customizado para formatar datas no Jinja2
 def formatar_data(data):
@@ -93,9 +108,6 @@ def formatar_data(data):
     
     return str(data)
 
-# Registra o filtro no Jinja2
-templates.env.filters['formatar_data'] = formatar_data
-
 # Arquivo de configurações
 CONFIG_FILE = "config.json"
 
@@ -150,8 +162,10 @@ def get_default_dashboard_data():
         "dados": {
             "total_skus": 0,
             "valor_estoque": "R$ 0,00",
+            "valor_estoque_bruto": 0,
             "alertas_criticos": 0,
             "lucro_potencial": "R$ 0,00",
+            "lucro_potencial_bruto": 0,
             "margem_media": "0",
             "percentual_estoque": "0,0",
             "qtd_criticos": 0,
@@ -167,7 +181,10 @@ def get_default_dashboard_data():
     }
 
 def can_use_database(db):
-    """Verifica se podemos usar o banco de dados"""
+    """
+    Verifica se podemos usar o banco de dados.
+    Consulta o estado guardado pelo monitor de saúde (sem ir ao banco).
+    """
     if db is None:
         return False
     try:
@@ -176,17 +193,173 @@ def can_use_database(db):
             # Verifica se é SQLite em memória (que não tem dados)
             if hasattr(db.bind, 'url') and 'sqlite:///:memory:' in str(db.bind.url):
                 return False
-        # Tenta uma query simples para verificar se o banco está funcionando
-        from sqlalchemy import text
-        result = db.execute(text("SELECT 1"))
-        result.fetchone()
-        return True
+        return monitor_banco.disponivel()
     except Exception:
         # Se houver qualquer erro, não podemos usar o banco
         return False
 
+@app.on_event("startup")
+def iniciar_monitor_banco():
+    """Inicia o teste periódico do banco em segundo plano"""
+    # No modo serverless a instância fica congelada entre invocações; o monitor
+    # testa sob demanda, no máximo uma vez por intervalo
+    if DATABASE_AVAILABLE and not database.SERVERLESS:
+        monitor_banco.iniciar()
+
+@app.on_event("startup")
+def iniciar_fila_movimentacoes():
+    """Liga o commit em grupo das movimentações (MOVIMENTACOES_GROUP_COMMIT)"""
+    if fila_movimentacoes.habilitada and DATABASE_AVAILABLE and not database.SERVERLESS:
+        fila_movimentacoes.iniciar()
+        print("[OK] Fila de movimentações com commit em grupo iniciada")
+
+@app.on_event("startup")
+def iniciar_eventos_estoque():
+    """Escuta o canal de eventos de estoque no Postgres (repasse entre workers)"""
+    if not DATABASE_AVAILABLE or database.SERVERLESS:
+        return
+    if url_eventos() is None:
+        if database.SQLALCHEMY_DATABASE_URL and database.SQLALCHEMY_DATABASE_URL.startswith("postgresql"):
+            print("[AVISO] Eventos de estoque: pooler de transação não suporta LISTEN; "
+                  "configure EVENTOS_DATABASE_URL para repassar eventos entre workers")
+        return
+    ouvinte_estoque.iniciar()
+
+@app.on_event("startup")
+def montar_indice_sku():
+    """Monta o índice de SKUs em memória (no serverless, na primeira busca)"""
+    if not DATABASE_AVAILABLE or database.SERVERLESS or database.SessionLocal is None:
+        return
+    db = database.SessionLocal()
+    try:
+        total = indice_sku.construir(db)
+        print(f"[OK] Índice de SKUs montado ({total} SKUs)")
+    except Exception as e:
+        print(f"[AVISO] Índice de SKUs não montado no startup: {e}")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def parar_monitor_banco():
+    monitor_banco.parar()
+
+@app.on_event("shutdown")
+def parar_fila_movimentacoes():
+    # Grava o que ainda estiver na fila antes de sair
+    fila_movimentacoes.parar()
+
+@app.on_event("shutdown")
+def parar_eventos_estoque():
+    ouvinte_estoque.parar()
+
+# --- API: STATUS DO BANCO DE DADOS ---
+@app.get("/api/status/banco")
+async def status_banco():
+    """Estado do banco segundo o monitor de saúde (circuito e latência dos testes)"""
+    status = monitor_banco.status()
+    return JSONResponse(status_code=200 if status["disponivel"] else 503, content=status)
+
+@app.get("/api/status/pool")
+async def status_pool(zerar: bool = False):
+    """
+    Estatísticas do pool de conexões (em uso, overflow, espera e histograma
+    da latência de checkout) para dimensionar DB_POOL_SIZE / DB_MAX_OVERFLOW.
+    Use ?zerar=true para recomeçar a contagem depois da leitura.
+    """
+    if not DATABASE_AVAILABLE:
+        return JSONResponse(status_code=503, content={"message": "Banco de dados não disponível"})
+    return status_pools(zerar=zerar)
+
+# --- API: STATUS DA FILA DE MOVIMENTAÇÕES (commit em grupo) ---
+@app.get("/api/status/movimentacoes")
+async def status_fila_movimentacoes():
+    """Lotes gravados, média de movimentações por lote e pendências da fila"""
+    return fila_movimentacoes.status()
+
+# --- API: ÍNDICE DE SKUS (busca sem ir ao banco) ---
+LIMITE_AUTOCOMPLETE = 50
+
+_montagem_indice = asyncio.Lock()
+
+async def _indice_pronto(db):
+    """Remonta o índice se foi invalidado; retorna False se não for possível"""
+    if indice_sku.valido():
+        return True
+    if not can_use_database(db):
+        return False
+    # Várias buscas ao mesmo tempo esperam uma única remontagem
+    async with _montagem_indice:
+        if indice_sku.valido():
+            return True
+        try:
+            versao = indice_sku.versao
+            linhas = await db.run_sync(indice_sku.ler)
+            # A trie é montada fora do event loop
+            await asyncio.to_thread(indice_sku.montar, linhas, versao)
+            return True
+        except Exception as e:
+            print(f"[ERRO] Erro ao montar índice de SKUs: {e}")
+            return False
+
+@app.get("/api/sku/autocomplete")
+async def autocompletar_sku(q: str = "", limite: int = 10, db: AsyncSession = Depends(get_async_db)):
+    """
+    Sugestões por prefixo de SKU, nome do produto ou cor (ex: "cap azu").
+    Sem acentos e sem diferenciar maiúsculas; até `limite` variações em ordem de SKU.
+    """
+    if not await _indice_pronto(db):
+        return JSONResponse(status_code=503, content={"message": "Banco de dados não disponível"})
+    limite = max(1, min(limite, LIMITE_AUTOCOMPLETE))
+    return {"itens": indice_sku.autocompletar(q, limite)}
+
+@app.get("/api/sku/{sku}")
+async def buscar_sku(sku: str, db: AsyncSession = Depends(get_async_db)):
+    """Variação pelo SKU exato (leitor de código de barras)"""
+    if not await _indice_pronto(db):
+        return JSONResponse(status_code=503, content={"message": "Banco de dados não disponível"})
+    item = indice_sku.buscar_sku(sku)
+    if item is None:
+        return JSONResponse(status_code=404, content={"message": "SKU não encontrado"})
+    return item
+
+# --- API: EVENTOS DE ESTOQUE (Server-Sent Events) ---
+INTERVALO_PING_EVENTOS = 15
+
+@app.get("/api/eventos/estoque")
+async def eventos_estoque(request: Request):
+    """
+    Fluxo SSE com as mudanças de estoque confirmadas (movimentações, ordens de
+    serviço e compras), para as páginas atualizarem os números no lugar.
+    Cada mensagem traz uma lista JSON de eventos; {"tipo": "recarregar"}
+    pede para a página buscar tudo de novo (cliente ficou para trás).
+    """
+    fila = barramento_estoque.assinar()
+
+    async def gerar():
+        try:
+            # O navegador reconecta sozinho após 3s se a conexão cair
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    eventos = await asyncio.wait_for(fila.get(), timeout=INTERVALO_PING_EVENTOS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentário SSE: mantém a conexão viva em proxies
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps(eventos, ensure_ascii=False, default=str)}\n\n"
+        finally:
+            barramento_estoque.cancelar(fila)
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+def dashboard(request: Request, db: Session = Depends(get_db)):
     """
     Rota principal FUNCIONAL.
     Conecta ao PostgreSQL, calcula métricas reais e popula a tabela de alertas.
@@ -205,90 +378,16 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         # 1. CÁLCULOS DOS CARTÕES (Métricas Gerais)
         # ---------------------------------------------------------
 
-        # Total de SKUs (conta quantas linhas tem na tabela de variações)
-        try:
-            total_skus = db.query(models.ColorVariation).count()
-        except Exception:
-            total_skus = 0
-
-        # Valor em Estoque (Soma: preço * quantidade de cada item)
-        try:
-            valor_total_query = db.query(
-                func.sum(models.ColorVariation.variation_price * models.ColorVariation.available_stock)
-            ).scalar()
-            valor_estoque = float(valor_total_query) if valor_total_query else 0
-        except Exception:
-            valor_estoque = 0
-
-        # Lucro Potencial - Calcula: (preço_venda - custo) * quantidade_estoque
-        try:
-            lucro_total_query = db.query(
-                func.sum((models.ColorVariation.variation_price - models.ColorVariation.cost_price) * models.ColorVariation.available_stock)
-            ).scalar()
-            lucro_potencial = float(lucro_total_query) if lucro_total_query else 0
-        except Exception:
-            lucro_potencial = 0
-        
-        # Margem média percentual - Calcula a média das margens: ((preço - custo) / preço) * 100
-        try:
-            variacoes_com_preco = db.query(models.ColorVariation).filter(
-                models.ColorVariation.variation_price > 0
-            ).all()
-            
-            if variacoes_com_preco:
-                margens = []
-                for var in variacoes_com_preco:
-                    preco = float(var.variation_price) if var.variation_price else 0
-                    custo = float(var.cost_price) if var.cost_price else 0
-                    if preco > 0:
-                        margem = ((preco - custo) / preco) * 100
-                        margens.append(margem)
-                
-                margem_media = sum(margens) / len(margens) if margens else 0
-            else:
-                margem_media = 0
-        except Exception:
-            margem_media = 0
-        
-        # Percentual em estoque (calcula quantos % dos SKUs têm estoque > 0)
-        percentual_estoque = 0
-        if total_skus > 0:
-            try:
-                skus_com_estoque = db.query(models.ColorVariation).filter(
-                    models.ColorVariation.available_stock > 0
-                ).count()
-                percentual_estoque = (skus_com_estoque / total_skus) * 100
-            except Exception:
-                percentual_estoque = 0
-
-        # Contagem de Críticos (Itens onde o estoque é menor ou igual ao mínimo configurado)
-        try:
-            qtd_criticos = db.query(models.ColorVariation).filter(
-                models.ColorVariation.available_stock <= models.ColorVariation.min_stock_alert
-            ).count()
-        except Exception:
-            qtd_criticos = 0
-
-        # Contagem de Baixos (quase no mínimo - quando estoque = mínimo + 1)
-        qtd_baixos = 0
-        try:
-            variacoes = db.query(models.ColorVariation).all()
-            for var in variacoes:
-                if var and var.min_stock_alert is not None and var.available_stock is not None:
-                    if var.min_stock_alert > 0:
-                        # Classifica como "Baixo" quando estoque = mínimo + 1
-                        if var.available_stock == var.min_stock_alert + 1:
-                            qtd_baixos += 1
-        except Exception:
-            qtd_baixos = 0
-        
-        # Contagem de Zerados
-        try:
-            qtd_zerados = db.query(models.ColorVariation).filter(
-                models.ColorVariation.available_stock == 0
-            ).count()
-        except Exception:
-            qtd_zerados = 0
+        # Métricas lidas do snapshot mantido incrementalmente (dashboard_snapshot)
+        metricas = ler_metricas(db)
+        total_skus = metricas["total_skus"]
+        valor_estoque = metricas["valor_estoque"]
+        lucro_potencial = metricas["lucro_potencial"]
+        margem_media = metricas["margem_media"]
+        percentual_estoque = metricas["percentual_estoque"]
+        qtd_criticos = metricas["qtd_criticos"]
+        qtd_baixos = metricas["qtd_baixos"]
+        qtd_zerados = metricas["qtd_zerados"]
 
         # Contagem de produtos que precisam de reposição urgente (críticos)
         qtd_reposicao_urgente = qtd_criticos
@@ -342,8 +441,10 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
     dados_cards = {
         "total_skus": total_skus,
         "valor_estoque": valor_formatado,
+        "valor_estoque_bruto": valor_estoque_float,
         "alertas_criticos": qtd_criticos,
         "lucro_potencial": lucro_formatado,
+        "lucro_potencial_bruto": lucro_potencial_float,
         "margem_media": f"{margem_media:.0f}" if margem_media > 0 else "0",
         "percentual_estoque": f"{percentual_estoque:.1f}" if percentual_estoque > 0 else "0,0",
         "qtd_criticos": qtd_criticos,
@@ -479,7 +580,7 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         )
 
 @app.get("/produtos", response_class=HTMLResponse)
-async def produtos_page(request: Request, db: Session = Depends(get_db)):
+def produtos_page(request: Request, db: Session = Depends(get_db)):
     """
     Lista todos os produtos agrupados com suas variações.
     """
@@ -505,7 +606,7 @@ async def produtos_page(request: Request, db: Session = Depends(get_db)):
     )
 
 @app.get("/fornecedores", response_class=HTMLResponse)
-async def fornecedores_page(request: Request, db: Session = Depends(get_db)):
+def fornecedores_page(request: Request, db: Session = Depends(get_db)):
     # Verifica se podemos usar o banco de dados
     if not can_use_database(db):
         return templates.TemplateResponse(
@@ -530,7 +631,7 @@ async def fornecedores_page(request: Request, db: Session = Depends(get_db)):
 
 # --- API: LISTAR TODOS OS PRODUTOS (para seleção em movimentações) ---
 @app.get("/api/produtos")
-async def listar_produtos(db: Session = Depends(get_db)):
+async def listar_produtos(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Retorna todos os produtos com suas variações de cor"""
     if not can_use_database(db):
         return JSONResponse(
@@ -539,9 +640,15 @@ async def listar_produtos(db: Session = Depends(get_db)):
         )
     
     try:
-        products = db.query(models.Product).options(
-            joinedload(models.Product.variations)
-        ).all()
+        # Se o navegador já tem a versão atual do catálogo, 304 sem consultar (catalog_version.py)
+        versao = etag("produtos", await db.run_sync(ler_versoes, [VERSAO_PRODUTOS]))
+        if nao_modificado(request, versao):
+            return Response(status_code=304, headers=cabecalhos_etag(versao))
+        
+        result = await db.execute(
+            select(models.Product).options(joinedload(models.Product.variations))
+        )
+        products = result.unique().scalars().all()
         
         produtos_data = []
         for produto in products:
@@ -560,6 +667,7 @@ async def listar_produtos(db: Session = Depends(get_db)):
                 "variations": variacoes
             })
         
+        response.headers.update(cabecalhos_etag(versao))
         return {"products": produtos_data}
     except Exception as e:
         print(f"[ERRO] Erro ao listar produtos: {e}")
@@ -568,9 +676,66 @@ async def listar_produtos(db: Session = Depends(get_db)):
             content={"message": f"Erro ao listar produtos: {str(e)}"}
         )
 
+# --- API: NOMES DOS PRODUTOS (filtro de movimentações) ---
+@app.get("/api/produtos/nomes")
+async def listar_nomes_produtos(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Só id e nome de cada produto, em ordem alfabética (sem as variações)"""
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
+        )
+
+    try:
+        versao = etag("produtos-nomes", await db.run_sync(ler_versoes, [VERSAO_PRODUTOS]))
+        if nao_modificado(request, versao):
+            return Response(status_code=304, headers=cabecalhos_etag(versao))
+
+        result = await db.execute(
+            select(models.Product.id, models.Product.name).order_by(models.Product.name, models.Product.id)
+        )
+        response.headers.update(cabecalhos_etag(versao))
+        return {"products": [{"id": linha.id, "name": linha.name} for linha in result]}
+    except Exception as e:
+        print(f"[ERRO] Erro ao listar nomes dos produtos: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao listar nomes dos produtos: {str(e)}"}
+        )
+
+# --- API: EXPORTAR CATÁLOGO (CSV / NDJSON) ---
+@app.get("/api/produtos/export")
+def exportar_produtos(formato: str = Query("csv", alias="format"), db: Session = Depends(get_db)):
+    """
+    Catálogo completo (produtos, variações, preços, custos e estoque) em
+    fluxo, lido com cursor no servidor; ver catalog_export.py.
+    """
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503, 
+            content={"message": "Banco de dados não disponível"}
+        )
+
+    formato = formato.lower()
+    if formato not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={"message": "Formato inválido. Use: 'csv' ou 'ndjson'"})
+
+    # A sessão da requisição só confirma o banco; o gerador abre a sua,
+    # que fica aberta enquanto a resposta é enviada
+    nome = f"catalogo-{datetime.date.today().isoformat()}.{formato}"
+    if formato == "csv":
+        conteudo, tipo = gerar_csv(database.SessionLocal), "text/csv; charset=utf-8"
+    else:
+        conteudo, tipo = gerar_ndjson(database.SessionLocal), "application/x-ndjson"
+    return StreamingResponse(
+        conteudo,
+        media_type=tipo,
+        headers={"Content-Disposition": f'attachment; filename="{nome}"'},
+    )
+
 # --- API: CRIAR PRODUTO ---
 @app.post("/api/produtos")
-async def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
+def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
     if not can_use_database(db):
         return JSONResponse(
             status_code=503, 
@@ -590,22 +755,18 @@ async def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
         db.flush()  # Para obter o ID do produto antes do commit
         
         # 2. Criar as variações de cor
+        # SKUs gerados (CAT-PROD-COR) de todas as cores de uma vez, com sufixo se já existir
+        skus_gerados = iter(alocar_skus(
+            db,
+            [sku_base(produto.category, produto.name, cor.color_name) for cor in produto.colors if not cor.full_sku],
+            reservados=[cor.full_sku for cor in produto.colors],
+        ))
         variacoes_criadas = []
+        alteracoes_dashboard = []
         for cor in produto.colors:
             # Gerar SKU automaticamente se não fornecido
             if not cor.full_sku:
-                # Formato: CAT-PROD-COR (ex: CAP-SIL-IP14-BLK)
-                categoria_abrev = produto.category[:3].upper() if produto.category else "CAP"
-                produto_abrev = produto.name[:3].upper() if len(produto.name) >= 3 else produto.name.upper()
-                cor_abrev = cor.color_name[:3].upper() if len(cor.color_name) >= 3 else cor.color_name.upper()
-                sku_gerado = f"{categoria_abrev}-{produto_abrev}-{cor_abrev}".replace(" ", "-")
-                
-                # Verificar se o SKU já existe e adicionar sufixo se necessário
-                contador = 1
-                sku_final = sku_gerado
-                while db.query(models.ColorVariation).filter(models.ColorVariation.full_sku == sku_final).first():
-                    sku_final = f"{sku_gerado}-{contador}"
-                    contador += 1
+                sku_final = next(skus_gerados)
             else:
                 sku_final = cor.full_sku
             
@@ -628,13 +789,19 @@ async def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
             
             db.add(nova_variacao)
             db.flush()  # Para obter o ID antes do commit
+            alteracoes_dashboard.append((None, estado_variacao(nova_variacao)))
             variacoes_criadas.append({
                 "id": nova_variacao.id,
                 "sku": sku_final,
                 "color_name": cor.color_name
             })
         
+        # Atualiza o snapshot do dashboard na mesma transação
+        registrar_alteracoes(db, alteracoes_dashboard)
+        publicar(db, [evento_catalogo()])
+        
         db.commit()
+        indice_sku.invalidar()
         db.refresh(novo_produto)
         
         return {
@@ -654,9 +821,63 @@ async def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
             content={"message": f"Erro ao criar produto: {str(e)}"}
         )
 
+# --- API: IMPORTAR PRODUTOS (CSV / JSON lines) ---
+@app.post("/api/produtos/import")
+async def importar_produtos(request: Request, formato: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Importa uma planilha de fornecedor enviada no corpo da requisição, lida em
+    fluxo e gravada em lotes (ver product_import.py). formato: "csv" ou
+    "jsonl"; sem ele, vale o Content-Type (padrão CSV).
+    Responde com o resumo e os erros por linha.
+    """
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503, 
+            content={"message": "Banco de dados não disponível"}
+        )
+
+    tipo = request.headers.get("content-type", "")
+    formato = (formato or ("jsonl" if "json" in tipo else "csv")).lower()
+    if formato not in ("csv", "jsonl", "ndjson"):
+        return JSONResponse(status_code=400, content={"message": "Formato inválido. Use: 'csv' ou 'jsonl'"})
+
+    importacao = Importacao()
+    leitor = LeitorCsv() if formato == "csv" else None
+    numero = 0
+    try:
+        async for linha in linhas_do_corpo(request.stream()):
+            numero += 1
+            if leitor is not None:
+                registro = leitor.alimentar(linha)
+                if registro is not None:
+                    importacao.adicionar(*registro)
+            elif linha.strip():
+                importacao.adicionar(numero, linha)
+            if importacao.lote_cheio():
+                # Gravação síncrona fora do event loop; a leitura continua depois
+                await run_in_threadpool(importacao.gravar, db)
+        if leitor is not None:
+            pendente = leitor.finalizar()
+            if pendente is not None:
+                importacao.adicionar(*pendente)
+        await run_in_threadpool(importacao.gravar, db)
+    except Exception as e:
+        print(f"[ERRO] Erro ao importar produtos: {e}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao importar produtos: {str(e)}", **importacao.resultado()}
+        )
+
+    indice_sku.invalidar()
+    return importacao.resultado()
+
 # --- API: CRIAR FORNECEDOR ---
 @app.post("/api/fornecedores")
-async def criar_fornecedor(supplier: SupplierCreate, db: Session = Depends(get_db)):
+def criar_fornecedor(supplier: SupplierCreate, db: Session = Depends(get_db)):
     if not can_use_database(db):
         return JSONResponse(
             status_code=503, 
@@ -698,7 +919,7 @@ async def criar_fornecedor(supplier: SupplierCreate, db: Session = Depends(get_d
 
 # --- API: OBTER PRODUTO ---
 @app.get("/api/produtos/{produto_id}")
-async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
+async def obter_produto(produto_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Retorna um produto específico com suas variações"""
     if not can_use_database(db):
         return JSONResponse(
@@ -707,9 +928,16 @@ async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
         )
     
     try:
-        produto = db.query(models.Product).options(
-            joinedload(models.Product.variations)
-        ).filter(models.Product.id == produto_id).first()
+        versao = etag(f"produto-{produto_id}", await db.run_sync(ler_versoes, [VERSAO_PRODUTOS]))
+        if nao_modificado(request, versao):
+            return Response(status_code=304, headers=cabecalhos_etag(versao))
+        
+        result = await db.execute(
+            select(models.Product).options(
+                joinedload(models.Product.variations)
+            ).filter(models.Product.id == produto_id)
+        )
+        produto = result.unique().scalars().first()
         
         if not produto:
             return JSONResponse(
@@ -730,6 +958,7 @@ async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
                 "min_stock_alert": var.min_stock_alert if var.min_stock_alert else 10
             })
         
+        response.headers.update(cabecalhos_etag(versao))
         return {
             "id": produto.id,
             "name": produto.name,
@@ -747,7 +976,7 @@ async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
 
 # --- API: ATUALIZAR PRODUTO ---
 @app.put("/api/produtos/{produto_id}")
-async def atualizar_produto(produto_id: int, produto: ProdutoUpdate, db: Session = Depends(get_db)):
+def atualizar_produto(produto_id: int, produto: ProdutoUpdate, db: Session = Depends(get_db)):
     """Atualiza um produto existente e suas variações"""
     if not can_use_database(db):
         return JSONResponse(
@@ -756,85 +985,22 @@ async def atualizar_produto(produto_id: int, produto: ProdutoUpdate, db: Session
         )
     
     try:
-        # Busca o produto
-        produto_existente = db.query(models.Product).options(
-            joinedload(models.Product.variations)
-        ).filter(models.Product.id == produto_id).first()
-        
-        if not produto_existente:
+        # Compara com o que está gravado e escreve só as diferenças (product_update.py)
+        alteracoes = aplicar_edicao(db, produto_id, produto)
+        if alteracoes is None:
             return JSONResponse(
                 status_code=404, 
                 content={"message": "Produto não encontrado"}
             )
         
-        # Atualiza os dados do produto
-        produto_existente.name = produto.name
-        produto_existente.manufacturer = produto.manufacturer or "Genérico"
-        produto_existente.compatibility = produto.compatibility or "Universal"
-        produto_existente.category = produto.category or "Capas"
-        
-        # Mapeia variações existentes por ID
-        variacoes_existentes = {var.id: var for var in produto_existente.variations}
-        ids_recebidos = {cor.id for cor in produto.colors if cor.id is not None}
-        
-        # Remove variações que não foram enviadas
-        for var_id, variacao in variacoes_existentes.items():
-            if var_id not in ids_recebidos:
-                db.delete(variacao)
-        
-        # Atualiza ou cria variações
-        variacoes_atualizadas = []
-        for cor in produto.colors:
-            if cor.id and cor.id in variacoes_existentes:
-                # Atualiza variação existente
-                variacao = variacoes_existentes[cor.id]
-                variacao.color_name = cor.color_name
-                if cor.full_sku:
-                    variacao.full_sku = cor.full_sku
-                variacao.variation_price = cor.variation_price if cor.variation_price is not None else (cor.price or 0.0)
-                variacao.cost_price = cor.cost_price if cor.cost_price is not None else (cor.cost or 0.0)
-                variacao.available_stock = cor.available_stock if cor.available_stock is not None else (cor.stock or 0)
-                variacao.min_stock_alert = cor.min_stock_alert
-            else:
-                # Cria nova variação
-                # Gerar SKU automaticamente se não fornecido
-                if not cor.full_sku:
-                    categoria_abrev = produto.category[:3].upper() if produto.category else "CAP"
-                    produto_abrev = produto.name[:3].upper() if len(produto.name) >= 3 else produto.name.upper()
-                    cor_abrev = cor.color_name[:3].upper() if len(cor.color_name) >= 3 else cor.color_name.upper()
-                    sku_gerado = f"{categoria_abrev}-{produto_abrev}-{cor_abrev}".replace(" ", "-")
-                    
-                    contador = 1
-                    sku_final = sku_gerado
-                    while db.query(models.ColorVariation).filter(models.ColorVariation.full_sku == sku_final).first():
-                        sku_final = f"{sku_gerado}-{contador}"
-                        contador += 1
-                else:
-                    sku_final = cor.full_sku
-                
-                nova_variacao = models.ColorVariation(
-                    product_id=produto_id,
-                    color_name=cor.color_name,
-                    full_sku=sku_final,
-                    variation_price=cor.variation_price if cor.variation_price is not None else (cor.price or 0.0),
-                    cost_price=cor.cost_price if cor.cost_price is not None else (cor.cost or 0.0),
-                    available_stock=cor.available_stock if cor.available_stock is not None else (cor.stock or 0),
-                    min_stock_alert=cor.min_stock_alert
-                )
-                db.add(nova_variacao)
-                variacoes_atualizadas.append({
-                    "id": nova_variacao.id,
-                    "sku": sku_final,
-                    "color_name": cor.color_name
-                })
-        
         db.commit()
-        db.refresh(produto_existente)
+        indice_sku.invalidar()
         
         return {
             "status": "sucesso", 
-            "id": produto_existente.id,
-            "message": "Produto atualizado com sucesso"
+            "id": produto_id,
+            "message": "Produto atualizado com sucesso",
+            "alteracoes": alteracoes
         }
     except Exception as e:
         print(f"[ERRO] Erro ao atualizar produto: {e}")
@@ -850,7 +1016,7 @@ async def atualizar_produto(produto_id: int, produto: ProdutoUpdate, db: Session
 
 # --- API: EXCLUIR PRODUTO ---
 @app.delete("/api/produtos/{produto_id}")
-async def excluir_produto(produto_id: int, db: Session = Depends(get_db)):
+def excluir_produto(produto_id: int, db: Session = Depends(get_db)):
     if not can_use_database(db):
         return JSONResponse(
             status_code=503, 
@@ -872,12 +1038,15 @@ async def excluir_produto(produto_id: int, db: Session = Depends(get_db)):
         # Exclui manualmente as variações de cor primeiro
         # Isso evita problemas com o SQLAlchemy tentando atualizar product_id para None
         if produto.variations:
+            registrar_alteracoes(db, [(estado_variacao(v), None) for v in produto.variations])
             for variacao in list(produto.variations):
                 db.delete(variacao)
         
         # Agora exclui o produto
         db.delete(produto)
+        publicar(db, [evento_catalogo()])
         db.commit()
+        indice_sku.invalidar()
         
         return {"status": "sucesso", "message": "Produto excluído com sucesso"}
     except Exception as e:
@@ -894,7 +1063,7 @@ async def excluir_produto(produto_id: int, db: Session = Depends(get_db)):
 
 # --- API: OBTER FORNECEDOR ---
 @app.get("/api/fornecedores/{fornecedor_id}")
-async def obter_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
+async def obter_fornecedor(fornecedor_id: int, db: AsyncSession = Depends(get_async_db)):
     """Retorna um fornecedor específico com seus produtos"""
     if not can_use_database(db):
         return JSONResponse(
@@ -903,9 +1072,12 @@ async def obter_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
         )
     
     try:
-        fornecedor = db.query(models.Supplier).options(
-            joinedload(models.Supplier.products)
-        ).filter(models.Supplier.id == fornecedor_id).first()
+        result = await db.execute(
+            select(models.Supplier).options(
+                joinedload(models.Supplier.products)
+            ).filter(models.Supplier.id == fornecedor_id)
+        )
+        fornecedor = result.unique().scalars().first()
         
         if not fornecedor:
             return JSONResponse(
@@ -939,7 +1111,7 @@ async def obter_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
 
 # --- API: ATUALIZAR FORNECEDOR ---
 @app.put("/api/fornecedores/{fornecedor_id}")
-async def atualizar_fornecedor(fornecedor_id: int, supplier: SupplierCreate, db: Session = Depends(get_db)):
+def atualizar_fornecedor(fornecedor_id: int, supplier: SupplierCreate, db: Session = Depends(get_db)):
     """Atualiza um fornecedor existente"""
     if not can_use_database(db):
         return JSONResponse(
@@ -991,7 +1163,7 @@ async def atualizar_fornecedor(fornecedor_id: int, supplier: SupplierCreate, db:
 
 # --- API: EXCLUIR FORNECEDOR ---
 @app.delete("/api/fornecedores/{fornecedor_id}")
-async def excluir_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
+def excluir_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
     if not can_use_database(db):
         return JSONResponse(
             status_code=503, 
@@ -1026,34 +1198,143 @@ async def excluir_fornecedor(fornecedor_id: int, db: Session = Depends(get_db)):
         )
 
 @app.get("/movimentacoes", response_class=HTMLResponse)
-async def movimentacoes_page(request: Request, db: Session = Depends(get_db)):
-    # Verifica se podemos usar o banco de dados
+def movimentacoes_page(request: Request):
+    # O histórico não é mais renderizado aqui: a página busca as movimentações
+    # em páginas via GET /api/movimentacoes conforme a rolagem
+    return templates.TemplateResponse(
+        "movements.html", 
+        {"request": request}
+    )
+
+# --- API: HISTÓRICO DE MOVIMENTAÇÕES (paginado por cursor) ---
+LIMITE_PAGINA_MOVIMENTACOES = 200
+
+
+def codificar_cursor(created_at, movimento_id):
+    """Cursor opaco com a posição (created_at, id) da última linha entregue"""
+    bruto = f"{created_at.isoformat()}|{movimento_id}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    """Inverso de codificar_cursor; levanta ValueError se o cursor for inválido"""
+    bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    data, movimento_id = bruto.split("|")
+    return datetime.datetime.fromisoformat(data), int(movimento_id)
+
+
+@app.get("/api/movimentacoes")
+async def listar_movimentacoes(
+    sku: Optional[str] = None,
+    produto_id: Optional[int] = None,
+    tipo: Optional[str] = None,
+    de: Optional[datetime.date] = None,
+    ate: Optional[datetime.date] = None,
+    cursor: Optional[str] = None,
+    limite: int = 50,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lista o histórico do mais recente para o mais antigo, em páginas.
+
+    A paginação é por cursor em (created_at, id), não por OFFSET: cada página
+    continua de onde a anterior parou com uma varredura pelo índice
+    idx_stock_movements_created, então a página 1000 custa o mesmo que a
+    primeira. Filtros: sku (prefixo do full_sku), produto_id, tipo e período
+    de/ate (datas inclusivas). Movimentações antigas sem created_at (gravadas
+    fora do ORM) não têm posição no cursor e ficam de fora.
+    """
     if not can_use_database(db):
-        return templates.TemplateResponse(
-            "movements.html", 
-            {"movements": [], "request": request}
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
         )
-    
+
+    limite = max(1, min(limite, LIMITE_PAGINA_MOVIMENTACOES))
+    sm = models.StockMovement
+
     try:
-        # Busca todas as movimentações, da mais recente para a mais antiga
-        # Carrega junto os dados da Variação e do Produto (join) para mostrar o nome na tela
-        movements = db.query(models.StockMovement)\
-            .join(models.ColorVariation)\
-            .join(models.Product)\
-            .order_by(desc(models.StockMovement.created_at))\
-            .all()
+        query = select(
+            sm.id,
+            sm.movement_type,
+            sm.quantity,
+            sm.previous_stock,
+            sm.new_stock,
+            sm.reason,
+            sm.created_at,
+            models.ColorVariation.full_sku,
+            models.ColorVariation.color_name,
+            models.Product.id.label("product_id"),
+            models.Product.name.label("product_name"),
+        ).join(models.ColorVariation, sm.variation_id == models.ColorVariation.id)\
+         .join(models.Product, models.ColorVariation.product_id == models.Product.id)\
+         .filter(sm.created_at.isnot(None))
+
+        if sku:
+            query = query.filter(models.ColorVariation.full_sku.like(f"{escapar_like(sku.strip().upper())}%", escape="\\"))
+        if produto_id is not None:
+            query = query.filter(models.ColorVariation.product_id == produto_id)
+        if tipo:
+            query = query.filter(sm.movement_type == tipo)
+        if de:
+            query = query.filter(sm.created_at >= datetime.datetime.combine(de, datetime.time.min))
+        if ate:
+            query = query.filter(sm.created_at < datetime.datetime.combine(ate + datetime.timedelta(days=1), datetime.time.min))
+        if cursor:
+            try:
+                cursor_data, cursor_id = decodificar_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return JSONResponse(
+                    status_code=400,
+                    content={"message": "Cursor inválido"}
+                )
+            # "created_at <= c" delimita a faixa no índice; o OR só desempata
+            # as linhas com o mesmo created_at
+            query = query.filter(
+                sm.created_at <= cursor_data,
+                or_(sm.created_at < cursor_data, sm.id < cursor_id)
+            )
+
+        # Uma linha a mais para saber se existe próxima página
+        result = await db.execute(
+            query.order_by(desc(sm.created_at), desc(sm.id)).limit(limite + 1)
+        )
+        linhas = result.all()
+
+        proximo_cursor = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proximo_cursor = codificar_cursor(linhas[-1].created_at, linhas[-1].id)
+
+        return {
+            "movimentacoes": [
+                {
+                    "id": linha.id,
+                    "movement_type": linha.movement_type,
+                    "quantity": linha.quantity or 0,
+                    "previous_stock": linha.previous_stock or 0,
+                    "new_stock": linha.new_stock or 0,
+                    "reason": linha.reason,
+                    "created_at": linha.created_at.isoformat() if linha.created_at else None,
+                    "full_sku": linha.full_sku,
+                    "color_name": linha.color_name,
+                    "product_id": linha.product_id,
+                    "product_name": linha.product_name,
+                }
+                for linha in linhas
+            ],
+            "proximo_cursor": proximo_cursor
+        }
     except Exception as e:
         print(f"[ERRO] Erro ao buscar movimentações: {e}")
-        movements = []
-        
-    return templates.TemplateResponse(
-        "movements.html", 
-        {"movements": movements, "request": request}
-    )
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao buscar movimentações: {str(e)}"}
+        )
 
 # --- API: CRIAR MOVIMENTAÇÃO (O "Coração" do Estoque) ---
 @app.post("/api/movimentacoes")
-async def criar_movimentacao(mov: MovementCreate, db: Session = Depends(get_db)):
+def criar_movimentacao(mov: MovementCreate, db: Session = Depends(get_db)):
     if not can_use_database(db):
         return JSONResponse(
             status_code=503, 
@@ -1061,62 +1342,23 @@ async def criar_movimentacao(mov: MovementCreate, db: Session = Depends(get_db))
         )
     
     try:
-        # Valida quantidade
-        if mov.quantity <= 0:
-            return JSONResponse(
-                status_code=400,
-                content={"message": "Quantidade deve ser maior que zero"}
-            )
-        
-        # Valida tipo de movimentação
-        if mov.movement_type not in ['entrada', 'saida', 'ajuste']:
-            return JSONResponse(
-                status_code=400,
-                content={"message": "Tipo de movimentação inválido. Use: 'entrada', 'saida' ou 'ajuste'"}
-            )
-        
-        # 1. Encontrar a variação pelo SKU
-        variacao = db.query(models.ColorVariation).filter(models.ColorVariation.full_sku == mov.sku).first()
-        
-        if not variacao:
-            return JSONResponse(status_code=404, content={"message": "SKU não encontrado"})
-
-        # 2. Calcular novo estoque
-        estoque_anterior = variacao.available_stock if variacao.available_stock is not None else 0
-        novo_estoque = estoque_anterior
-
-        if mov.movement_type == 'entrada':
-            novo_estoque += mov.quantity
-        elif mov.movement_type == 'saida':
-            if estoque_anterior < mov.quantity:
-                 return JSONResponse(status_code=400, content={"message": "Estoque insuficiente"})
-            novo_estoque -= mov.quantity
-        elif mov.movement_type == 'ajuste':
-            # No ajuste, assumimos que a quantidade informada é a DIFERENÇA (para cima ou baixo)
-            # Se quiser definir o valor FINAL, a lógica seria diferente. 
-            # Vamos seguir a lógica da imagem: Ajuste de -2 (Perda/Quebra)
-            # Tratamos 'ajuste' como SAÍDA (quebra/perda) - subtrai a quantidade
-            if estoque_anterior < mov.quantity:
-                return JSONResponse(status_code=400, content={"message": "Estoque insuficiente para ajuste"})
-            novo_estoque -= mov.quantity
-
-        # 3. Atualizar a tabela de Variações (Saldo Atual)
-        variacao.available_stock = novo_estoque
-        
-        # 4. Gravar o Histórico
-        historico = models.StockMovement(
-            variation_id=variacao.id,
-            movement_type=mov.movement_type,
-            quantity=mov.quantity,
-            previous_stock=estoque_anterior,
-            new_stock=novo_estoque,
-            reason=mov.reason
-        )
-        
-        db.add(historico)
+        if fila_movimentacoes.rodando():
+            # Commit em grupo: a thread da fila grava junto com as movimentações
+            # que chegaram ao mesmo tempo e devolve o resultado desta
+            resultado = fila_movimentacoes.enviar(mov)
+            if resultado["status"] == "erro":
+                return JSONResponse(status_code=resultado["status_code"], content={"message": resultado["message"]})
+            return {"status": "sucesso", "novo_estoque": resultado["novo_estoque"]}
+
+        # Saldo alterado por UPDATE condicional no banco + histórico na mesma
+        # instrução (ver stock.py): sem janela entre ler e gravar o estoque
+        resultado = movimentar_estoque(db, mov.sku, mov.movement_type, mov.quantity, mov.reason)
         db.commit()
         
-        return {"status": "sucesso", "novo_estoque": novo_estoque}
+        return {"status": "sucesso", "novo_estoque": resultado.novo_estoque}
+    except ErroMovimentacao as e:
+        db.rollback()
+        return JSONResponse(status_code=e.status_code, content={"message": e.mensagem})
     except Exception as e:
         print(f"[ERRO] Erro ao criar movimentação: {e}")
         try:
@@ -1129,9 +1371,110 @@ async def criar_movimentacao(mov: MovementCreate, db: Session = Depends(get_db))
             content={"message": f"Erro ao criar movimentação: {str(e)}"}
         )
 
+# --- API: MOVIMENTAÇÕES EM LOTE (leitura de código de barras) ---
+@app.post("/api/movimentacoes/lote")
+def criar_movimentacoes_lote(movs: List[MovementCreate], db: Session = Depends(get_db)):
+    """
+    Aplica várias movimentações em uma única transação (um commit).
+    Cada linha recebe seu próprio resultado; linhas recusadas (SKU não
+    encontrado, estoque insuficiente...) não impedem as demais.
+    """
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
+        )
+    
+    if not movs:
+        return JSONResponse(status_code=400, content={"message": "Nenhuma movimentação informada"})
+    if len(movs) > LIMITE_LOTE:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"Máximo de {LIMITE_LOTE} movimentações por lote"}
+        )
+    
+    try:
+        resultados = movimentar_lote(db, movs)
+        db.commit()
+        
+        aceitas = sum(1 for r in resultados if r["status"] == "sucesso")
+        return {
+            "status": "sucesso",
+            "total": len(resultados),
+            "aceitas": aceitas,
+            "recusadas": len(resultados) - aceitas,
+            "resultados": resultados
+        }
+    except Exception as e:
+        print(f"[ERRO] Erro ao criar movimentações em lote: {e}")
+        try:
+            if db is not None:
+                db.rollback()
+        except:
+            pass
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao criar movimentações: {str(e)}"}
+        )
+
+# --- API: CHECKPOINT DE ESTOQUE (use também: python ledger.py checkpoint) ---
+@app.post("/api/estoque/checkpoints")
+def criar_checkpoint_estoque(db: Session = Depends(get_db)):
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
+        )
+
+    try:
+        instante, total, ultimo_movimento = criar_checkpoint(db)
+        db.commit()
+        return {
+            "status": "sucesso",
+            "checkpoint_at": instante.isoformat(),
+            "variacoes": total,
+            "last_movement_id": ultimo_movimento
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"[ERRO] Erro ao criar checkpoint de estoque: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao criar checkpoint: {str(e)}"}
+        )
+
+# --- API: POSIÇÃO DE ESTOQUE EM UMA DATA ---
+@app.get("/api/estoque/posicao")
+async def posicao_estoque_data(
+    data: Optional[datetime.date] = None,
+    sku: Optional[str] = None,
+    produto_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Estoque e valorização (custo e venda) de cada variação no fim do dia
+    informado (padrão: hoje). Parte do checkpoint mais recente e relê só as
+    movimentações posteriores a ele (ver ledger.py).
+    """
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
+        )
+
+    try:
+        limite = fim_do_dia(data or datetime.datetime.utcnow().date())
+        return await db.run_sync(posicao_estoque, limite, sku=sku, produto_id=produto_id)
+    except Exception as e:
+        print(f"[ERRO] Erro ao calcular posição de estoque: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao calcular posição de estoque: {str(e)}"}
+        )
+
 # --- PÁGINA DE CONFIGURAÇÕES ---
 @app.get("/configuracoes", response_class=HTMLResponse)
-async def configuracoes_page(request: Request, db: Session = Depends(get_db)):
+def configuracoes_page(request: Request, db: Session = Depends(get_db)):
     """Página de configurações do sistema"""
     config = get_config()
     
@@ -1191,7 +1534,7 @@ async def atualizar_configuracoes(config_update: ConfigUpdate):
 
 # --- PÁGINA DE PEÇAS E SERVIÇOS ---
 @app.get("/reparos", response_class=HTMLResponse)
-async def reparos_page(request: Request, db: Session = Depends(get_db)):
+def reparos_page(request: Request, db: Session = Depends(get_db)):
     """Página de gerenciamento de peças físicas e serviços"""
     if not can_use_database(db):
         return templates.TemplateResponse(
@@ -1235,7 +1578,7 @@ async def reparos_page(request: Request, db: Session = Depends(get_db)):
 
 # --- API: LISTAR PEÇAS FÍSICAS ---
 @app.get("/api/reparos")
-async def listar_pecas(db: Session = Depends(get_db)):
+async def listar_pecas(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Lista todas as peças físicas (catálogo de peças)"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1244,7 +1587,13 @@ async def listar_pecas(db: Session = Depends(get_db)):
         )
     
     try:
-        pecas = db.query(models.RepairPart).all()
+        versao = etag("reparos", await db.run_sync(ler_versoes, [VERSAO_REPAROS]))
+        if nao_modificado(request, versao):
+            return Response(status_code=304, headers=cabecalhos_etag(versao))
+        
+        result = await db.execute(select(models.RepairPart))
+        pecas = result.scalars().all()
+        response.headers.update(cabecalhos_etag(versao))
         return [
             {
                 "id": p.id,
@@ -1267,7 +1616,7 @@ async def listar_pecas(db: Session = Depends(get_db)):
 
 # --- API: LISTAR SERVIÇOS (MÃO DE OBRA) ---
 @app.get("/api/servicos")
-async def listar_servicos(status: Optional[str] = None, db: Session = Depends(get_db)):
+async def listar_servicos(request: Request, response: Response, status: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """Lista todos os serviços (mão de obra)"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1276,13 +1625,20 @@ async def listar_servicos(status: Optional[str] = None, db: Session = Depends(ge
         )
     
     try:
-        query = db.query(models.Service).options(
+        # A resposta inclui a peça vinculada: depende das duas versões
+        versao = etag("servicos", await db.run_sync(ler_versoes, [VERSAO_SERVICOS, VERSAO_REPAROS]))
+        if nao_modificado(request, versao):
+            return Response(status_code=304, headers=cabecalhos_etag(versao))
+        
+        query = select(models.Service).options(
             joinedload(models.Service.linked_part)
         )
         if status:
             query = query.filter(models.Service.status == status)
         
-        servicos = query.all()
+        result = await db.execute(query)
+        servicos = result.scalars().all()
+        response.headers.update(cabecalhos_etag(versao))
         return [
             {
                 "id": s.id,
@@ -1310,7 +1666,7 @@ async def listar_servicos(status: Optional[str] = None, db: Session = Depends(ge
 
 # --- API: CRIAR PEÇA DE REPARO ---
 @app.post("/api/reparos")
-async def criar_reparo(peca: RepairPartCreate, db: Session = Depends(get_db)):
+def criar_reparo(peca: RepairPartCreate, db: Session = Depends(get_db)):
     """Cria uma nova peça de reparo"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1355,7 +1711,7 @@ async def criar_reparo(peca: RepairPartCreate, db: Session = Depends(get_db)):
 
 # --- API: ATUALIZAR PEÇA DE REPARO ---
 @app.put("/api/reparos/{peca_id}")
-async def atualizar_reparo(peca_id: int, peca: RepairPartUpdate, db: Session = Depends(get_db)):
+def atualizar_reparo(peca_id: int, peca: RepairPartUpdate, db: Session = Depends(get_db)):
     """Atualiza uma peça de reparo existente"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1378,6 +1734,8 @@ async def atualizar_reparo(peca_id: int, peca: RepairPartUpdate, db: Session = D
         if peca.price is not None:
             peca_db.price = peca.price
         if peca.cost_price is not None:
+            if custo_alterado(peca_db, peca.cost_price):
+                peca_db.landed_cost = None  # o custo com frete da última compra deixa de valer
             peca_db.cost_price = peca.cost_price
         if peca.available_stock is not None:
             peca_db.available_stock = peca.available_stock
@@ -1403,7 +1761,7 @@ async def atualizar_reparo(peca_id: int, peca: RepairPartUpdate, db: Session = D
 
 # --- API: EXCLUIR PEÇA DE REPARO ---
 @app.delete("/api/reparos/{peca_id}")
-async def excluir_reparo(peca_id: int, db: Session = Depends(get_db)):
+def excluir_reparo(peca_id: int, db: Session = Depends(get_db)):
     """Exclui uma peça de reparo"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1441,7 +1799,7 @@ async def excluir_reparo(peca_id: int, db: Session = Depends(get_db)):
 
 # --- API: CRIAR SERVIÇO ---
 @app.post("/api/servicos")
-async def criar_servico(servico: ServiceCreate, db: Session = Depends(get_db)):
+def criar_servico(servico: ServiceCreate, db: Session = Depends(get_db)):
     """Cria um novo serviço (mão de obra)"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1486,7 +1844,7 @@ async def criar_servico(servico: ServiceCreate, db: Session = Depends(get_db)):
 
 # --- API: ATUALIZAR SERVIÇO ---
 @app.put("/api/servicos/{servico_id}")
-async def atualizar_servico(servico_id: int, servico: ServiceUpdate, db: Session = Depends(get_db)):
+def atualizar_servico(servico_id: int, servico: ServiceUpdate, db: Session = Depends(get_db)):
     """Atualiza um serviço existente"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1532,7 +1890,7 @@ async def atualizar_servico(servico_id: int, servico: ServiceUpdate, db: Session
 
 # --- API: FINALIZAR SERVIÇO (REGISTRAR VENDA E CALCULAR LUCRO) ---
 @app.post("/api/servicos/{servico_id}/finalizar")
-async def finalizar_servico(servico_id: int, db: Session = Depends(get_db)):
+def finalizar_servico(servico_id: int, db: Session = Depends(get_db)):
     """
     Finaliza um serviço, calcula lucro e registra no histórico de vendas.
     Fórmula: Lucro = Preço Venda - Custo da Peça Vinculada
@@ -1566,15 +1924,8 @@ async def finalizar_servico(servico_id: int, db: Session = Depends(get_db)):
         custo_peca = 0.0
         
         if servico.linked_part:
-            if servico.linked_part.cost_price and servico.linked_part.cost_price > 0:
-                custo_peca = float(servico.linked_part.cost_price)
-            else:
-                # Se não tem custo, estima 50% do preço da peça (se tiver preço)
-                if servico.linked_part.price and servico.linked_part.price > 0:
-                    custo_peca = float(servico.linked_part.price) * 0.5
-                else:
-                    # Se não tem nem custo nem preço, usa 0
-                    custo_peca = 0.0
+            # Custo com frete da última compra; sem custo, estima 50% do preço da peça
+            custo_peca = custo_unitario(servico.linked_part)
         
         lucro = preco_venda - custo_peca
         
@@ -1590,6 +1941,7 @@ async def finalizar_servico(servico_id: int, db: Session = Depends(get_db)):
         )
         
         db.add(venda)
+        registrar_venda(db, venda.sold_at, preco_venda, custo_peca, lucro)
         
         # (Opcional) Desconta 1 unidade do estoque da peça vinculada
         if servico.linked_part and servico.linked_part.available_stock > 0:
@@ -1646,7 +1998,7 @@ async def finalizar_servico(servico_id: int, db: Session = Depends(get_db)):
 
 # --- API: EXCLUIR SERVIÇO ---
 @app.delete("/api/servicos/{servico_id}")
-async def excluir_servico(servico_id: int, db: Session = Depends(get_db)):
+def excluir_servico(servico_id: int, db: Session = Depends(get_db)):
     """Exclui um serviço"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1690,30 +2042,27 @@ async def obter_mensagem_fornecedor(fornecedor_id: int):
 # =========================================
 
 def gerar_numero_ordem(db: Session) -> str:
-    """Gera um número único de ordem de serviço no formato OS-YYYY-NNN"""
+    """
+    Gera um número único de ordem de serviço no formato OS-YYYY-NNN.
+    O número vem de um contador atômico (tabela counters), travado até o commit.
+    """
     from datetime import datetime
     ano_atual = datetime.now().year
-    
-    # Busca a última ordem do ano atual
-    ultima_ordem = db.query(models.ServiceOrder).filter(
-        models.ServiceOrder.order_number.like(f"OS-{ano_atual}-%")
-    ).order_by(desc(models.ServiceOrder.id)).first()
-    
-    if ultima_ordem and ultima_ordem.order_number:
-        # Extrai o número sequencial
-        try:
-            numero = int(ultima_ordem.order_number.split('-')[-1])
-            proximo_numero = numero + 1
-        except:
-            proximo_numero = 1
-    else:
-        proximo_numero = 1
-    
-    return f"OS-{ano_atual}-{proximo_numero:03d}"
+    return proximo_numero_documento(db, models.ServiceOrder.order_number, "OS", ano_atual)
+
+def opcoes_itens_ordem():
+    """
+    Carrega peças e serviços da ordem junto com as quantidades da tabela de
+    associação: duas consultas a mais no total, independente do número de ordens.
+    """
+    return (
+        selectinload(models.ServiceOrder.part_items).joinedload(models.ServiceOrderPart.part),
+        selectinload(models.ServiceOrder.service_items).joinedload(models.ServiceOrderService.service),
+    )
 
 # --- API: LISTAR ORDENS DE SERVIÇO ---
 @app.get("/api/ordens-servico")
-async def listar_ordens_servico(status: Optional[str] = None, db: Session = Depends(get_db)):
+async def listar_ordens_servico(status: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """Lista todas as ordens de serviço, opcionalmente filtradas por status"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1722,86 +2071,9 @@ async def listar_ordens_servico(status: Optional[str] = None, db: Session = Depe
         )
     
     try:
-        query = db.query(models.ServiceOrder).options(
-            joinedload(models.ServiceOrder.parts),
-            joinedload(models.ServiceOrder.services)
-        )
-        if status:
-            query = query.filter(models.ServiceOrder.status == status)
-        
-        ordens = query.order_by(desc(models.ServiceOrder.created_at)).all()
-        
-        resultado = []
-        for ordem in ordens:
-            # Busca quantidades das peças da tabela de associação
-            from sqlalchemy import select
-            quantidades_pecas = {}
-            for part in ordem.parts:
-                stmt = select(models.service_order_parts.c.quantity).where(
-                    models.service_order_parts.c.service_order_id == ordem.id,
-                    models.service_order_parts.c.repair_part_id == part.id
-                )
-                result = db.execute(stmt).first()
-                quantidades_pecas[part.id] = result[0] if result else 1
-            
-            # Busca quantidades dos serviços da tabela de associação
-            quantidades_servicos = {}
-            for servico in ordem.services:
-                stmt = select(models.service_order_services.c.quantity).where(
-                    models.service_order_services.c.service_order_id == ordem.id,
-                    models.service_order_services.c.service_id == servico.id
-                )
-                result = db.execute(stmt).first()
-                quantidades_servicos[servico.id] = result[0] if result else 1
-            
-            # Calcula o valor total das peças
-            valor_pecas = sum(
-                float(part.price) * quantidades_pecas.get(part.id, 1)
-                for part in ordem.parts
-            )
-            # Calcula o valor total dos serviços
-            valor_servicos = sum(
-                float(servico.price) * quantidades_servicos.get(servico.id, 1)
-                for servico in ordem.services
-            )
-            total = valor_pecas + valor_servicos
-            
-            resultado.append({
-                "id": ordem.id,
-                "order_number": ordem.order_number,
-                "client_name": ordem.client_name,
-                "client_phone": ordem.client_phone,
-                "client_email": ordem.client_email,
-                "device_model": ordem.device_model,
-                "service_description": ordem.service_description,
-                "status": ordem.status,
-                "total_value": float(ordem.total_value) if ordem.total_value else total,
-                "notes": ordem.notes,
-                "created_at": ordem.created_at.isoformat() if ordem.created_at else None,
-                "completed_at": ordem.completed_at.isoformat() if ordem.completed_at else None,
-                "parts": [
-                    {
-                        "id": part.id,
-                        "device_model": part.device_model,
-                        "part_name": part.part_name or "N/A",
-                        "price": float(part.price) if part.price else 0.0,
-                        "quantity": quantidades_pecas.get(part.id, 1)
-                    }
-                    for part in ordem.parts
-                ],
-                "services": [
-                    {
-                        "id": servico.id,
-                        "name": servico.name,
-                        "description": servico.description,
-                        "price": float(servico.price) if servico.price else 0.0,
-                        "quantity": quantidades_servicos.get(servico.id, 1)
-                    }
-                    for servico in ordem.services
-                ]
-            })
-        
-        return resultado
+        # Colunas projetadas + serializador compilado (api_json.py)
+        ordens = await db.run_sync(ler_ordens_servico, status)
+        return serializador_ordens.resposta(ordens)
     except Exception as e:
         print(f"[ERRO] Erro ao listar ordens de serviço: {e}")
         return JSONResponse(
@@ -1811,7 +2083,7 @@ async def listar_ordens_servico(status: Optional[str] = None, db: Session = Depe
 
 # --- API: OBTER ORDEM DE SERVIÇO ESPECÍFICA ---
 @app.get("/api/ordens-servico/{ordem_id}")
-async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
+async def obter_ordem_servico(ordem_id: int, db: AsyncSession = Depends(get_async_db)):
     """Obtém uma ordem de serviço específica"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1820,12 +2092,12 @@ async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
         )
     
     try:
-        ordem = db.query(models.ServiceOrder).options(
-            joinedload(models.ServiceOrder.parts),
-            joinedload(models.ServiceOrder.services)
-        ).filter(
-            models.ServiceOrder.id == ordem_id
-        ).first()
+        result = await db.execute(
+            select(models.ServiceOrder).options(*opcoes_itens_ordem()).filter(
+                models.ServiceOrder.id == ordem_id
+            )
+        )
+        ordem = result.scalars().first()
         
         if not ordem:
             return JSONResponse(
@@ -1833,34 +2105,19 @@ async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
                 content={"message": "Ordem de serviço não encontrada"}
             )
         
-        # Busca quantidades das peças da tabela de associação
-        from sqlalchemy import select
-        quantidades_pecas = {}
-        for part in ordem.parts:
-            stmt = select(models.service_order_parts.c.quantity).where(
-                models.service_order_parts.c.service_order_id == ordem.id,
-                models.service_order_parts.c.repair_part_id == part.id
-            )
-            result = db.execute(stmt).first()
-            quantidades_pecas[part.id] = result[0] if result else 1
-        
-        # Busca quantidades dos serviços da tabela de associação
-        quantidades_servicos = {}
-        for servico in ordem.services:
-            stmt = select(models.service_order_services.c.quantity).where(
-                models.service_order_services.c.service_order_id == ordem.id,
-                models.service_order_services.c.service_id == servico.id
-            )
-            result = db.execute(stmt).first()
-            quantidades_servicos[servico.id] = result[0] if result else 1
+        # Peças e serviços com as quantidades (já carregados da tabela de associação)
+        pecas = [item.part for item in ordem.part_items]
+        quantidades_pecas = {item.repair_part_id: item.quantity for item in ordem.part_items}
+        servicos = [item.service for item in ordem.service_items]
+        quantidades_servicos = {item.service_id: item.quantity for item in ordem.service_items}
         
         valor_pecas = sum(
             float(part.price) * quantidades_pecas.get(part.id, 1)
-            for part in ordem.parts
+            for part in pecas
         )
         valor_servicos = sum(
             float(servico.price) * quantidades_servicos.get(servico.id, 1)
-            for servico in ordem.services
+            for servico in servicos
         )
         total = valor_pecas + valor_servicos
         
@@ -1886,7 +2143,7 @@ async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
                     "cost_price": float(part.cost_price) if part.cost_price else None,
                     "quantity": quantidades_pecas.get(part.id, 1)
                 }
-                for part in ordem.parts
+                for part in pecas
             ],
             "services": [
                 {
@@ -1896,7 +2153,7 @@ async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
                     "price": float(servico.price) if servico.price else 0.0,
                     "quantity": quantidades_servicos.get(servico.id, 1)
                 }
-                for servico in ordem.services
+                for servico in servicos
             ]
         }
     except Exception as e:
@@ -1908,7 +2165,7 @@ async def obter_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
 
 # --- API: CRIAR ORDEM DE SERVIÇO ---
 @app.post("/api/ordens-servico")
-async def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(get_db)):
+def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(get_db)):
     """Cria uma nova ordem de serviço"""
     if not can_use_database(db):
         return JSONResponse(
@@ -1968,9 +2225,6 @@ async def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(g
                         content={"message": f"Serviço {servico.name} não está ativo"}
                     )
         
-        # Gera número da ordem
-        numero_ordem = gerar_numero_ordem(db)
-        
         # Calcula valor total das peças
         valor_pecas = 0.0
         for part_data in ordem.parts:
@@ -1991,6 +2245,10 @@ async def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(g
         import datetime
         data_criacao = ordem.created_at if ordem.created_at else datetime.datetime.utcnow()
         
+        # Gera número da ordem (o contador fica travado até o commit, então
+        # é gerado o mais perto possível do fim da transação)
+        numero_ordem = gerar_numero_ordem(db)
+        
         # Cria a ordem
         nova_ordem = models.ServiceOrder(
             order_number=numero_ordem,
@@ -2022,9 +2280,11 @@ async def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(g
                 db.execute(stmt)
                 
                 # Atualiza estoque (reduz a quantidade)
-                peca.available_stock = (peca.available_stock or 0) - part_data.quantity
+                estoque_anterior = peca.available_stock or 0
+                peca.available_stock = estoque_anterior - part_data.quantity
                 if peca.available_stock < 0:
                     peca.available_stock = 0
+                publicar(db, [evento_peca(peca, estoque_anterior)])
         
         # Adiciona os serviços
         for service_data in ordem.services:
@@ -2061,7 +2321,7 @@ async def criar_ordem_servico(ordem: ServiceOrderCreate, db: Session = Depends(g
 
 # --- API: ATUALIZAR ORDEM DE SERVIÇO ---
 @app.put("/api/ordens-servico/{ordem_id}")
-async def atualizar_ordem_servico(ordem_id: int, ordem: ServiceOrderUpdate, db: Session = Depends(get_db)):
+def atualizar_ordem_servico(ordem_id: int, ordem: ServiceOrderUpdate, db: Session = Depends(get_db)):
     """Atualiza uma ordem de serviço existente"""
     if not can_use_database(db):
         return JSONResponse(
@@ -2070,12 +2330,16 @@ async def atualizar_ordem_servico(ordem_id: int, ordem: ServiceOrderUpdate, db:
         )
     
     try:
-        ordem_db = db.query(models.ServiceOrder).filter(models.ServiceOrder.id == ordem_id).first()
+        # Carrega peças/serviços atuais com as quantidades (usados no total se só um lado mudar)
+        ordem_db = db.query(models.ServiceOrder).options(*opcoes_itens_ordem()).filter(
+            models.ServiceOrder.id == ordem_id
+        ).first()
         if not ordem_db:
             return JSONResponse(
                 status_code=404,
                 content={"message": "Ordem de serviço não encontrada"}
             )
+        estado_anterior = estado_ordem(ordem_db)
         
         # Atualiza campos básicos
         if ordem.client_name is not None:
@@ -2174,29 +2438,20 @@ async def atualizar_ordem_servico(ordem_id: int, ordem: ServiceOrderUpdate, db:
         if ordem.parts is not None or ordem.services is not None:
             # Se apenas um foi atualizado, busca o outro do banco
             if ordem.parts is None:
-                # Busca peças existentes
-                for part in ordem_db.parts:
-                    stmt = select(models.service_order_parts.c.quantity).where(
-                        models.service_order_parts.c.service_order_id == ordem_id,
-                        models.service_order_parts.c.repair_part_id == part.id
-                    )
-                    result = db.execute(stmt).first()
-                    qty = result[0] if result else 1
-                    valor_pecas += float(part.price) * qty
+                # Usa as peças existentes
+                for item in ordem_db.part_items:
+                    valor_pecas += float(item.part.price) * item.quantity
             
             if ordem.services is None:
-                # Busca serviços existentes
-                for servico in ordem_db.services:
-                    stmt = select(models.service_order_services.c.quantity).where(
-                        models.service_order_services.c.service_order_id == ordem_id,
-                        models.service_order_services.c.service_id == servico.id
-                    )
-                    result = db.execute(stmt).first()
-                    qty = result[0] if result else 1
-                    valor_servicos += float(servico.price) * qty
+                # Usa os serviços existentes
+                for item in ordem_db.service_items:
+                    valor_servicos += float(item.service.price) * item.quantity
             
             ordem_db.total_value = valor_pecas + valor_servicos
         
+        # Totais por dia/mês: uma ordem finalizada pode ter mudado de valor ou de status
+        registrar_ordem(db, estado_anterior, estado_ordem(ordem_db))
+        
         db.commit()
         
         return {"status": "sucesso", "message": "Ordem de serviço atualizada com sucesso"}
@@ -2214,10 +2469,10 @@ async def atualizar_ordem_servico(ordem_id: int, ordem: ServiceOrderUpdate, db:
 
 # --- API: FINALIZAR ORDEM DE SERVIÇO (CALCULAR E SALVAR LUCRO) ---
 @app.post("/api/ordens-servico/{ordem_id}/finalizar")
-async def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
+def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
     """
     Finaliza uma ordem de serviço, calcula e salva o lucro.
-    Fórmula: Lucro = (Preço Venda Peça + Preço Serviço) - (Custo Compra Peça)
+    Fórmula: Lucro = (Preço Venda Peça + Preço Serviço) - (Custo Compra Peça com frete)
     """
     if not can_use_database(db):
         return JSONResponse(
@@ -2226,10 +2481,9 @@ async def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
         )
     
     try:
-        ordem_db = db.query(models.ServiceOrder).options(
-            joinedload(models.ServiceOrder.parts),
-            joinedload(models.ServiceOrder.services)
-        ).filter(models.ServiceOrder.id == ordem_id).first()
+        ordem_db = db.query(models.ServiceOrder).options(*opcoes_itens_ordem()).filter(
+            models.ServiceOrder.id == ordem_id
+        ).first()
         
         if not ordem_db:
             return JSONResponse(
@@ -2237,46 +2491,30 @@ async def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
                 content={"message": "Ordem de serviço não encontrada"}
             )
         
-        # Busca quantidades das peças
-        quantidades_pecas = {}
-        for part in ordem_db.parts:
-            stmt = select(models.service_order_parts.c.quantity).where(
-                models.service_order_parts.c.service_order_id == ordem_id,
-                models.service_order_parts.c.repair_part_id == part.id
-            )
-            result = db.execute(stmt).first()
-            quantidades_pecas[part.id] = result[0] if result else 1
+        # Peças com as quantidades (já carregadas da tabela de associação)
+        pecas = [item.part for item in ordem_db.part_items]
+        quantidades_pecas = {item.repair_part_id: item.quantity for item in ordem_db.part_items}
         
         # Calcula receita de peças (preço de venda)
         receita_pecas = 0.0
-        for part in ordem_db.parts:
+        for part in pecas:
             quantidade = quantidades_pecas.get(part.id, 1)
             receita_pecas += float(part.price or 0) * quantidade
         
-        # Calcula custo de compra das peças
+        # Calcula custo de compra das peças, com o frete já rateado na compra
+        # (sem custo cadastrado, estima como 50% do preço)
         custo_pecas = 0.0
-        for part in ordem_db.parts:
+        for part in pecas:
             quantidade = quantidades_pecas.get(part.id, 1)
-            if part.cost_price and part.cost_price > 0:
-                custo_pecas += float(part.cost_price) * quantidade
-            else:
-                # Se não tem cost_price, estima como 50% do preço (margem padrão)
-                custo_estimado = float(part.price or 0) * 0.5
-                custo_pecas += custo_estimado * quantidade
-        
-        # Busca quantidades dos serviços
-        quantidades_servicos = {}
-        for servico in ordem_db.services:
-            stmt = select(models.service_order_services.c.quantity).where(
-                models.service_order_services.c.service_order_id == ordem_id,
-                models.service_order_services.c.service_id == servico.id
-            )
-            result = db.execute(stmt).first()
-            quantidades_servicos[servico.id] = result[0] if result else 1
+            custo_pecas += custo_unitario(part) * quantidade
+        
+        # Serviços com as quantidades
+        servicos = [item.service for item in ordem_db.service_items]
+        quantidades_servicos = {item.service_id: item.quantity for item in ordem_db.service_items}
         
         # Calcula receita de serviços (preço de venda)
         receita_servicos = 0.0
-        for servico in ordem_db.services:
+        for servico in servicos:
             quantidade = quantidades_servicos.get(servico.id, 1)
             receita_servicos += float(servico.price or 0) * quantidade
         
@@ -2290,10 +2528,14 @@ async def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
         
         # Atualiza a ordem: status, completed_at e profit
         from datetime import datetime
+        estado_anterior = estado_ordem(ordem_db)
         ordem_db.status = "concluido"
         ordem_db.completed_at = datetime.utcnow()
         ordem_db.profit = lucro
         
+        # Totais por dia/mês, na mesma transação (finalizar de novo desconta a anterior)
+        registrar_ordem(db, estado_anterior, estado_ordem(ordem_db))
+        
         db.commit()
         db.refresh(ordem_db)
         
@@ -2327,7 +2569,7 @@ async def finalizar_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
 
 # --- API: EXCLUIR ORDEM DE SERVIÇO ---
 @app.delete("/api/ordens-servico/{ordem_id}")
-async def excluir_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
+def excluir_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
     """Exclui uma ordem de serviço"""
     if not can_use_database(db):
         return JSONResponse(
@@ -2343,6 +2585,7 @@ async def excluir_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
                 content={"message": "Ordem de serviço não encontrada"}
             )
         
+        registrar_ordem(db, estado_ordem(ordem), None)
         db.delete(ordem)
         db.commit()
         
@@ -2364,224 +2607,52 @@ async def excluir_ordem_servico(ordem_id: int, db: Session = Depends(get_db)):
 # =========================================
 
 def gerar_numero_compra(db: Session) -> str:
-    """Gera um número único de compra no formato COMP-YYYY-NNN"""
+    """
+    Gera um número único de compra no formato COMP-YYYY-NNN.
+    O número vem de um contador atômico (tabela counters), travado até o commit.
+    """
     from datetime import datetime
     ano_atual = datetime.now().year
-    
-    # Busca a última compra do ano atual
-    ultima_compra = db.query(models.Purchase).filter(
-        models.Purchase.purchase_number.like(f"COMP-{ano_atual}-%")
-    ).order_by(desc(models.Purchase.id)).first()
-    
-    if ultima_compra and ultima_compra.purchase_number:
-        # Extrai o número sequencial
-        try:
-            numero = int(ultima_compra.purchase_number.split('-')[-1])
-            proximo_numero = numero + 1
-        except:
-            proximo_numero = 1
-    else:
-        proximo_numero = 1
-    
-    return f"COMP-{ano_atual}-{proximo_numero:03d}"
+    return proximo_numero_documento(db, models.Purchase.purchase_number, "COMP", ano_atual)
 
 @app.get("/financas", response_class=HTMLResponse)
-async def financas_page(request: Request, db: Session = Depends(get_db)):
-    """Página de finanças - compras e lucros"""
+def financas_page(
+    request: Request,
+    de: Optional[str] = None,
+    ate: Optional[str] = None,
+    aba: str = "compras",
+    pagina_compras: int = 1,
+    pagina_ordens: int = 1,
+    pagina_vendas: int = 1,
+    db: Session = Depends(get_db),
+):
+    """
+    Página de finanças - compras e lucros.
+    Totais por agregação no banco e listas paginadas, filtradas por período
+    (de/ate em AAAA-MM-DD). Ver finance.py.
+    """
+    contexto = {
+        "request": request,
+        "filtro": {"de": de or "", "ate": ate or ""},
+        "aba": "lucros" if aba == "lucros" else "compras",
+    }
     if not can_use_database(db):
         return templates.TemplateResponse(
             "financas.html",
-            {
-                "purchases": [],
-                "service_orders": [],
-                "service_sales": [],
-                "error": "Banco de dados não disponível",
-                "request": request
-            }
+            {**contexto, **dados_financas_vazios(), "error": "Banco de dados não disponível"}
         )
     
     try:
-        # Busca todas as compras
-        purchases = db.query(models.Purchase).order_by(desc(models.Purchase.created_at)).all()
-        
-        # Busca apenas ordens de serviço concluídas para calcular lucros
-        service_orders = db.query(models.ServiceOrder).options(
-            joinedload(models.ServiceOrder.parts),
-            joinedload(models.ServiceOrder.services)
-        ).filter(models.ServiceOrder.status == "concluido").order_by(desc(models.ServiceOrder.created_at)).all()
-        
-        # Busca histórico de vendas de serviços (finalizados diretamente do card)
-        try:
-            # Verifica se a tabela existe
-            from sqlalchemy import inspect
-            inspector = inspect(db.bind)
-            tabelas = inspector.get_table_names()
-            
-            if 'service_sale_history' not in tabelas:
-                print("[ERRO] Tabela 'service_sale_history' não existe no banco de dados!")
-                print("[ERRO] Execute o script criar_todas_tabelas.sql para criar a tabela")
-                service_sales = []
-            else:
-                service_sales = db.query(models.ServiceSaleHistory).order_by(desc(models.ServiceSaleHistory.sold_at)).all()
-                print(f"[INFO] Encontrados {len(service_sales)} registros de vendas de serviços")
-                if len(service_sales) > 0:
-                    print(f"[INFO] Última venda: ID {service_sales[0].id}, Lucro: R$ {service_sales[0].profit}, Data: {service_sales[0].sold_at}")
-        except Exception as e:
-            print(f"[AVISO] Erro ao buscar histórico de vendas de serviços: {e}")
-            print("[AVISO] A tabela service_sale_history pode não existir. Execute o script criar_todas_tabelas.sql")
-            import traceback
-            traceback.print_exc()
-            service_sales = []
-        
-        # Prepara dados das compras
-        purchases_data = []
-        for purchase in purchases:
-            items_data = []
-            for item in purchase.items:
-                items_data.append({
-                    "id": item.id,
-                    "repair_part": {
-                        "id": item.repair_part.id if item.repair_part else None,
-                        "device_model": item.repair_part.device_model if item.repair_part else "N/A",
-                        "part_name": (item.repair_part.part_name or "N/A") if item.repair_part else "N/A"
-                    },
-                    "quantity": item.quantity,
-                    "unit_cost": float(item.unit_cost) if item.unit_cost else 0.0,
-                    "total_cost": float(item.total_cost) if item.total_cost else 0.0
-                })
-            
-            purchases_data.append({
-                "id": purchase.id,
-                "purchase_number": purchase.purchase_number,
-                "supplier_name": purchase.supplier_name,
-                "shipping_cost": float(purchase.shipping_cost) if purchase.shipping_cost else 0.0,
-                "total_value": float(purchase.total_value) if purchase.total_value else 0.0,
-                "notes": purchase.notes,
-                "created_at": purchase.created_at.isoformat() if purchase.created_at else None,
-                "items": items_data
-            })
-        
-        # Calcula totais de compras para cálculo de frete proporcional
-        total_frete_compras = sum(float(p.shipping_cost or 0) for p in purchases)
-        total_custo_pecas_compras = 0.0
-        for purchase in purchases:
-            for item in purchase.items:
-                total_custo_pecas_compras += float(item.total_cost or 0)
-        
-        # Prepara dados das ordens de serviço com cálculo de lucro
-        orders_data = []
-        for order in service_orders:
-            # Busca quantidades das peças
-            quantidades = {}
-            for part in order.parts:
-                stmt = select(models.service_order_parts.c.quantity).where(
-                    models.service_order_parts.c.service_order_id == order.id,
-                    models.service_order_parts.c.repair_part_id == part.id
-                )
-                result = db.execute(stmt).first()
-                quantidades[part.id] = result[0] if result else 1
-            
-            # Calcula custo total das peças (usando cost_price)
-            # Se cost_price não estiver definido, usa uma estimativa baseada no preço (assumindo 50% de margem)
-            custo_pecas = 0.0
-            pecas_sem_custo = []
-            for part in order.parts:
-                quantidade = quantidades.get(part.id, 1)
-                if part.cost_price and part.cost_price > 0:
-                    custo_pecas += float(part.cost_price) * quantidade
-                else:
-                    # Se não tem cost_price, estima como 50% do preço (margem padrão)
-                    custo_estimado = float(part.price or 0) * 0.5
-                    custo_pecas += custo_estimado * quantidade
-                    part_name = part.part_name or "N/A"
-                    pecas_sem_custo.append({
-                        "id": part.id,
-                        "nome": f"{part.device_model} - {part_name}",
-                        "preco": float(part.price or 0)
-                    })
-            
-            # Calcula frete proporcional baseado no custo das peças
-            # Distribui o frete proporcionalmente ao custo das peças usadas
-            if total_custo_pecas_compras > 0 and custo_pecas > 0:
-                frete_proporcional = (custo_pecas / total_custo_pecas_compras) * total_frete_compras
-            else:
-                frete_proporcional = 0.0
-            
-            # Busca quantidades dos serviços
-            quantidades_servicos = {}
-            for servico in order.services:
-                stmt = select(models.service_order_services.c.quantity).where(
-                    models.service_order_services.c.service_order_id == order.id,
-                    models.service_order_services.c.service_id == servico.id
-                )
-                result = db.execute(stmt).first()
-                quantidades_servicos[servico.id] = result[0] if result else 1
-            
-            # Calcula custo dos serviços (serviços não têm custo de compra, apenas preço de venda)
-            # O custo de serviços seria o tempo/homem, mas como não temos isso, consideramos 0
-            # Ou seja, o lucro dos serviços é 100% (ou você pode ajustar isso depois)
-            custo_servicos = 0.0  # Serviços não têm custo de compra, apenas mão de obra (que não rastreamos)
-            
-            # Usa profit salvo se existir, senão calcula (para ordens antigas)
-            receita = float(order.total_value) if order.total_value else 0.0
-            if order.profit is not None:
-                # Usa o lucro já calculado e salvo quando a ordem foi finalizada
-                lucro = float(order.profit)
-                custo_total = receita - lucro  # Calcula o custo reverso para exibição
-            else:
-                # Calcula lucro (para ordens antigas que não têm profit salvo)
-                custo_total = custo_pecas + frete_proporcional + custo_servicos
-                lucro = receita - custo_total
-            margem_lucro = (lucro / receita * 100) if receita > 0 else 0
-            
-            orders_data.append({
-                "id": order.id,
-                "order_number": order.order_number,
-                "client_name": order.client_name,
-                "device_model": order.device_model,
-                "service_description": order.service_description,
-                "status": order.status,
-                "total_value": receita,
-                "custo_pecas": custo_pecas,
-                "custo_servicos": custo_servicos,
-                "frete_proporcional": frete_proporcional,
-                "custo_total": custo_total,
-                "lucro": lucro,
-                "margem_lucro": margem_lucro,
-                "pecas_sem_custo": pecas_sem_custo,  # Lista de peças que não têm cost_price definido
-                "services": [
-                    {
-                        "id": servico.id,
-                        "name": servico.name,
-                        "price": float(servico.price) if servico.price else 0.0,
-                        "quantity": quantidades_servicos.get(servico.id, 1)
-                    }
-                    for servico in order.services
-                ],
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "completed_at": order.completed_at.isoformat() if order.completed_at else None
-            })
-        
-        # Prepara dados das vendas de serviços (finalizados diretamente do card)
-        service_sales_data = []
-        for sale in service_sales:
-            service_sales_data.append({
-                "id": sale.id,
-                "service_name": sale.service_name,
-                "sale_price": float(sale.sale_price) if sale.sale_price else 0.0,
-                "part_cost": float(sale.part_cost) if sale.part_cost else None,
-                "profit": float(sale.profit) if sale.profit else 0.0,
-                "sold_at": sale.sold_at.isoformat() if sale.sold_at else None
-            })
-        
+        dados = dados_financas(
+            db, de=de, ate=ate,
+            pagina_compras=pagina_compras, pagina_ordens=pagina_ordens, pagina_vendas=pagina_vendas,
+        )
+        return templates.TemplateResponse("financas.html", {**contexto, **dados})
+    except ValueError as e:
+        # Data inválida no filtro
         return templates.TemplateResponse(
             "financas.html",
-            {
-                "purchases": purchases_data,
-                "service_orders": orders_data,
-                "service_sales": service_sales_data,
-                "request": request
-            }
+            {**contexto, **dados_financas_vazios(), "error": str(e)}
         )
     except Exception as e:
         print(f"[ERRO] Erro ao carregar página de finanças: {e}")
@@ -2589,18 +2660,48 @@ async def financas_page(request: Request, db: Session = Depends(get_db)):
         traceback.print_exc()
         return templates.TemplateResponse(
             "financas.html",
-            {
-                "purchases": [],
-                "service_orders": [],
-                "service_sales": [],
-                "error": str(e),
-                "request": request
-            }
+            {**contexto, **dados_financas_vazios(), "error": str(e)}
+        )
+
+# --- API: RESUMO FINANCEIRO POR PERÍODO ---
+@app.get("/api/financas/resumo")
+async def resumo_financas(
+    de: Optional[str] = None,
+    ate: Optional[str] = None,
+    granularidade: str = "mes",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Compras, receita, custo e lucro por dia ou por mês (de/ate em AAAA-MM-DD).
+    Lido das tabelas de totais (finance_rollup.py): uma linha por período.
+    """
+    if not can_use_database(db):
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Banco de dados não disponível"}
+        )
+    if granularidade not in GRANULARIDADES:
+        return JSONResponse(
+            status_code=400,
+            content={"message": "Granularidade inválida. Use: 'dia' ou 'mes'"}
+        )
+    try:
+        inicio, fim = intervalo_datas(de, ate)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    
+    try:
+        return await db.run_sync(ler_resumo, inicio, fim, granularidade)
+    except Exception as e:
+        print(f"[ERRO] Erro ao ler resumo financeiro: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Erro ao ler resumo financeiro: {str(e)}"}
         )
 
 # --- API: LISTAR COMPRAS ---
 @app.get("/api/compras")
-async def listar_compras(db: Session = Depends(get_db)):
+async def listar_compras(db: AsyncSession = Depends(get_async_db)):
     """Lista todas as compras"""
     if not can_use_database(db):
         return JSONResponse(
@@ -2609,39 +2710,8 @@ async def listar_compras(db: Session = Depends(get_db)):
         )
     
     try:
-        purchases = db.query(models.Purchase).options(
-            joinedload(models.Purchase.items).joinedload(models.PurchaseItem.repair_part)
-        ).order_by(desc(models.Purchase.created_at)).all()
-        
-        resultado = []
-        for purchase in purchases:
-            items_data = []
-            for item in purchase.items:
-                items_data.append({
-                    "id": item.id,
-                    "repair_part_id": item.repair_part_id,
-                    "repair_part": {
-                        "id": item.repair_part.id if item.repair_part else None,
-                        "device_model": item.repair_part.device_model if item.repair_part else "N/A",
-                        "part_name": (item.repair_part.part_name or "N/A") if item.repair_part else "N/A"
-                    },
-                    "quantity": item.quantity,
-                    "unit_cost": float(item.unit_cost) if item.unit_cost else 0.0,
-                    "total_cost": float(item.total_cost) if item.total_cost else 0.0
-                })
-            
-            resultado.append({
-                "id": purchase.id,
-                "purchase_number": purchase.purchase_number,
-                "supplier_name": purchase.supplier_name,
-                "shipping_cost": float(purchase.shipping_cost) if purchase.shipping_cost else 0.0,
-                "total_value": float(purchase.total_value) if purchase.total_value else 0.0,
-                "notes": purchase.notes,
-                "created_at": purchase.created_at.isoformat() if purchase.created_at else None,
-                "items": items_data
-            })
-        
-        return resultado
+        compras = await db.run_sync(ler_compras)
+        return serializador_compras.resposta(compras)
     except Exception as e:
         print(f"[ERRO] Erro ao listar compras: {e}")
         return JSONResponse(
@@ -2651,7 +2721,7 @@ async def listar_compras(db: Session = Depends(get_db)):
 
 # --- API: CRIAR COMPRA ---
 @app.post("/api/compras")
-async def criar_compra(compra: PurchaseCreate, db: Session = Depends(get_db)):
+def criar_compra(compra: PurchaseCreate, db: Session = Depends(get_db)):
     """Cria uma nova compra de peças"""
     if not can_use_database(db):
         return JSONResponse(
@@ -2717,15 +2787,23 @@ async def criar_compra(compra: PurchaseCreate, db: Session = Depends(get_db)):
         db.add(nova_compra)
         db.flush()  # Para obter o ID da compra
         
+        # Rateia o frete entre os itens: custo unitário com frete de cada um
+        custos_entrada = ratear_frete(
+            compra.shipping_cost, [(item.quantity, item.unit_cost) for item in compra.items]
+        )
+        
         # Adiciona os itens da compra
-        for item_data in compra.items:
+        for item_data, custo_entrada in zip(compra.items, custos_entrada):
             peca = db.query(models.RepairPart).filter(models.RepairPart.id == item_data.repair_part_id).first()
             if peca:
-                # Atualiza o cost_price da peça com o novo custo unitário
+                # Atualiza o cost_price da peça com o novo custo unitário (e o custo com frete)
                 peca.cost_price = item_data.unit_cost
+                peca.landed_cost = custo_entrada
                 
                 # Adiciona ao estoque
-                peca.available_stock = (peca.available_stock or 0) + item_data.quantity
+                estoque_anterior = peca.available_stock or 0
+                peca.available_stock = estoque_anterior + item_data.quantity
+                publicar(db, [evento_peca(peca, estoque_anterior)])
                 
                 # Cria o item da compra
                 item_compra = models.PurchaseItem(
@@ -2733,10 +2811,14 @@ async def criar_compra(compra: PurchaseCreate, db: Session = Depends(get_db)):
                     repair_part_id=item_data.repair_part_id,
                     quantity=item_data.quantity,
                     unit_cost=item_data.unit_cost,
-                    total_cost=item_data.unit_cost * item_data.quantity
+                    total_cost=item_data.unit_cost * item_data.quantity,
+                    landed_unit_cost=custo_entrada
                 )
                 db.add(item_compra)
         
+        # Totais por dia/mês, na mesma transação
+        registrar_compra(db, data_compra, total, nova_compra.shipping_cost)
+        
         db.commit()
         db.refresh(nova_compra)
         
@@ -2793,6 +2875,8 @@ async def atualizar_custo_peca(peca_id: int, request: Request, db: Session = Dep
                 content={"message": "Peça não encontrada"}
             )
         
+        if custo_alterado(peca, cost_price):
+            peca.landed_cost = None  # o custo com frete da última compra deixa de valer
         peca.cost_price = cost_price
         db.commit()
         db.refresh(peca)
@@ -2817,7 +2901,7 @@ async def atualizar_custo_peca(peca_id: int, request: Request, db: Session = Dep
 
 # --- API: OBTER COMPRA ---
 @app.get("/api/compras/{compra_id}")
-async def obter_compra(compra_id: int, db: Session = Depends(get_db)):
+async def obter_compra(compra_id: int, db: AsyncSession = Depends(get_async_db)):
     """Obtém uma compra específica"""
     if not can_use_database(db):
         return JSONResponse(
@@ -2826,9 +2910,12 @@ async def obter_compra(compra_id: int, db: Session = Depends(get_db)):
         )
     
     try:
-        compra = db.query(models.Purchase).options(
-            joinedload(models.Purchase.items).joinedload(models.PurchaseItem.repair_part)
-        ).filter(models.Purchase.id == compra_id).first()
+        result = await db.execute(
+            select(models.Purchase).options(
+                joinedload(models.Purchase.items).joinedload(models.PurchaseItem.repair_part)
+            ).filter(models.Purchase.id == compra_id)
+        )
+        compra = result.unique().scalars().first()
         
         if not compra:
             return JSONResponse(
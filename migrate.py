@@ -0,0 +1,155 @@
+"""
+Criação/atualização do esquema do banco.
+
+Fora do modo serverless, main.py chama criar_tabelas() ao iniciar (como
+sempre fez). No modo serverless isso é pulado para não gastar idas e voltas
+de introspecção do catálogo em cada cold start; rode o comando explícito
+depois de cada deploy que altere o esquema:
+
+    python migrate.py
+
+Preenchimentos de dados (preencher_custo_entrada) não rodam a cada início:
+só quando as colunas que eles preenchem acabaram de ser adicionadas, ou pelo
+comando acima.
+"""
+from sqlalchemy import case, func, inspect, select, text, update
+
+import models
+
+
+def adicionar_colunas(engine):
+    """
+    Adiciona às tabelas que já existiam as colunas declaradas depois nos
+    modelos (ALTER TABLE ... ADD COLUMN). O create_all não altera tabelas
+    existentes. Só colunas que aceitam nulo; rodar de novo não muda nada.
+    Retorna as colunas adicionadas ("tabela.coluna").
+    """
+    adicionadas = set()
+    inspetor = inspect(engine)
+    existentes = set(inspetor.get_table_names())
+    with engine.begin() as conexao:
+        for tabela in models.Base.metadata.sorted_tables:
+            if tabela.name not in existentes:
+                continue
+            gravadas = {coluna["name"] for coluna in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in gravadas or not coluna.nullable:
+                    continue
+                tipo = coluna.type.compile(dialect=engine.dialect)
+                conexao.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}"))
+                print(f"[OK] Coluna {tabela.name}.{coluna.name} adicionada")
+                adicionadas.add(f"{tabela.name}.{coluna.name}")
+    return adicionadas
+
+
+COLUNAS_CUSTO_ENTRADA = {"purchase_items.landed_unit_cost", "repair_parts.landed_cost"}
+
+
+def preencher_custo_entrada(engine):
+    """
+    Custo com frete (landed_unit_cost) dos itens de compras registradas antes
+    do rateio, com a mesma regra de finance.ratear_frete, e o custo com frete
+    das peças cujo custo ainda é o da última compra. Só preenche nulos.
+    """
+    item = models.PurchaseItem.__table__
+    compra = models.Purchase.__table__
+    peca = models.RepairPart.__table__
+    outro = item.alias()
+
+    valor_compra = select(func.sum(outro.c.total_cost)).where(outro.c.purchase_id == item.c.purchase_id).scalar_subquery()
+    qtd_compra = select(func.sum(outro.c.quantity)).where(outro.c.purchase_id == item.c.purchase_id).scalar_subquery()
+    frete = select(func.coalesce(compra.c.shipping_cost, 0)).where(compra.c.id == item.c.purchase_id).scalar_subquery()
+    parte_frete = case(
+        (valor_compra > 0, frete * item.c.total_cost / valor_compra),
+        else_=frete * item.c.quantity / qtd_compra,
+    )
+
+    ultimo = select(item.c.unit_cost, item.c.landed_unit_cost).where(item.c.repair_part_id == peca.c.id) \
+        .order_by(item.c.id.desc()).limit(1)
+
+    with engine.begin() as conexao:
+        conexao.execute(
+            update(item)
+            .where(item.c.landed_unit_cost.is_(None), item.c.quantity > 0)
+            .values(landed_unit_cost=item.c.unit_cost + parte_frete / item.c.quantity)
+        )
+        conexao.execute(
+            update(peca)
+            .where(peca.c.landed_cost.is_(None), peca.c.cost_price == ultimo.with_only_columns(item.c.unit_cost).scalar_subquery())
+            .values(landed_cost=ultimo.with_only_columns(item.c.landed_unit_cost).scalar_subquery())
+        )
+
+
+def criar_indices(engine):
+    """
+    Cria os índices declarados nos modelos que ainda não existirem.
+    O create_all só cria índices junto com tabelas novas; este passo cobre
+    índices adicionados depois em tabelas que já existiam.
+    """
+    for tabela in models.Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(bind=engine, checkfirst=True)
+
+
+def criar_tabelas(engine):
+    """Cria as tabelas que não existirem. Retorna True se deu certo."""
+    try:
+        models.Base.metadata.create_all(bind=engine)
+        adicionadas = adicionar_colunas(engine)
+        criar_indices(engine)
+        if adicionadas & COLUNAS_CUSTO_ENTRADA:
+            preencher_custo_entrada(engine)
+        print("[OK] Tabelas criadas/verificadas com sucesso")
+        return True
+    except Exception as e:
+        error_msg = str(e)
+        print("=" * 60)
+        print("[AVISO] Nao foi possivel criar as tabelas no banco de dados")
+        print("=" * 60)
+        
+        # Mensagens específicas para diferentes tipos de erro
+        if "Tenant or user not found" in error_msg or "tenant or user not found" in error_msg.lower():
+            print("ERRO ESPECIFICO: Projeto Supabase nao encontrado")
+            print("\nPossiveis causas:")
+            print("1. O projeto Supabase esta PAUSADO (projetos gratuitos pausam apos inatividade)")
+            print("2. O projeto foi DELETADO ou MOVIDO")
+            print("3. O ID do projeto na URL esta INCORRETO")
+            print("\nSolucoes:")
+            print("1. Acesse https://supabase.com/dashboard")
+            print("2. Verifique se o projeto esta ATIVO (nao pausado)")
+            print("3. Se estiver pausado, clique em 'Restore' ou 'Resume'")
+            print("4. Obtenha a URL correta em: Settings -> Database -> Connection string")
+            print("5. Atualize o arquivo .env com a nova URL")
+        elif "password authentication failed" in error_msg.lower():
+            print("ERRO: Autenticacao falhou")
+            print("\nA senha no arquivo .env pode estar incorreta.")
+            print("Verifique a senha no painel do Supabase e atualize o .env")
+        elif "connection" in error_msg.lower() and "failed" in error_msg.lower():
+            print("ERRO: Falha na conexao com o banco de dados")
+            print("\nVerifique:")
+            print("1. Sua conexao com a internet")
+            print("2. Se o projeto Supabase esta ativo")
+            print("3. Se a URL no .env esta correta")
+        else:
+            print(f"Detalhes do erro: {error_msg[:200]}")
+        
+        print("\nA aplicacao iniciara sem banco de dados (modo visualizacao).")
+        print("O dashboard funcionara normalmente, mostrando valores zerados.")
+        print("=" * 60)
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+    import database
+
+    engine = database.get_engine()
+    if engine is None:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    if not criar_tabelas(engine):
+        sys.exit(1)
+    # Só preenche nulos: cobre um preenchimento interrompido ou feito por outra versão
+    preencher_custo_entrada(engine)
+    print("[OK] Custos com frete preenchidos")
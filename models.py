@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, Table
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, Table, BigInteger, Index
 from sqlalchemy.orm import relationship
 from database import Base
-from sqlalchemy import DateTime # Importe DateTime se não tiver
+from sqlalchemy import DateTime, Date # Importe DateTime se não tiver
 import datetime
 
 class Product(Base):
@@ -19,6 +19,11 @@ class Product(Base):
 
 class ColorVariation(Base):
     __tablename__ = "color_variations"
+    # Mesmo índice do criar_todas_tabelas.sql: variações de um produto (junção
+    # da listagem e da exportação, que usa cursor e prefere planos de início rápido)
+    __table_args__ = (
+        Index("idx_color_variations_product", "product_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -58,6 +63,12 @@ class Supplier(Base):
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
+    # Mesmos índices do criar_todas_tabelas.sql: paginação do histórico e
+    # leitura da cadeia de cada variação em ordem (conciliação)
+    __table_args__ = (
+        Index("idx_stock_movements_created", "created_at"),
+        Index("idx_stock_movements_variation_id", "variation_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     variation_id = Column(Integer, ForeignKey("color_variations.id"))
@@ -86,6 +97,7 @@ class RepairPart(Base):
     part_name = Column(String)  # Ex: Tela, Bateria, Conector de Carga
     price = Column(Numeric(10, 2))  # Preço de venda da peça
     cost_price = Column(Numeric(10, 2), default=0)  # Custo de compra
+    landed_cost = Column(Numeric(12, 4), nullable=True)  # Custo com frete rateado da última compra (limpo se o custo for editado)
     available_stock = Column(Integer, default=0)  # Estoque disponível
     min_stock_alert = Column(Integer, default=5)  # Alerta de estoque mínimo
     status = Column(String, default="available")  # 'available', 'unavailable'
@@ -133,6 +145,10 @@ service_order_services = Table(
 
 class ServiceOrder(Base):
     __tablename__ = "service_orders"
+    # Página de finanças: ordens concluídas por data (lista paginada e totais do período)
+    __table_args__ = (
+        Index("idx_service_orders_status_created", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String, unique=True, index=True)  # Número da ordem (ex: OS-2024-001)
@@ -154,9 +170,29 @@ class ServiceOrder(Base):
     # Relacionamento many-to-many com serviços (mão de obra)
     services = relationship("Service", secondary=service_order_services, back_populates="service_orders")
 
+    # As mesmas associações como objetos (peça/serviço + quantidade), somente leitura.
+    # Com selectinload as quantidades vêm junto, sem uma consulta por item.
+    part_items = relationship("ServiceOrderPart", viewonly=True)
+    service_items = relationship("ServiceOrderService", viewonly=True)
+
+# Objetos de associação mapeados sobre as tabelas de relacionamento
+class ServiceOrderPart(Base):
+    __table__ = service_order_parts
+
+    part = relationship("RepairPart", viewonly=True)
+
+class ServiceOrderService(Base):
+    __table__ = service_order_services
+
+    service = relationship("Service", viewonly=True)
+
 # Modelos para Finanças - Compras de Peças
 class Purchase(Base):
     __tablename__ = "purchases"
+    # Mesmo índice do criar_todas_tabelas.sql (página de finanças, filtro por período)
+    __table_args__ = (
+        Index("idx_purchases_created", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     purchase_number = Column(String, unique=True, index=True)  # Número da compra (ex: COMP-2024-001)
@@ -178,6 +214,7 @@ class PurchaseItem(Base):
     quantity = Column(Integer)  # Quantidade comprada
     unit_cost = Column(Numeric(10, 2))  # Custo unitário da peça na compra
     total_cost = Column(Numeric(10, 2))  # Custo total (quantity * unit_cost)
+    landed_unit_cost = Column(Numeric(12, 4), nullable=True)  # Custo unitário + parte do frete da compra
     
     # Relacionamentos
     purchase = relationship("Purchase", back_populates="items")
@@ -186,6 +223,10 @@ class PurchaseItem(Base):
 # Modelo para Histórico de Vendas de Serviços
 class ServiceSaleHistory(Base):
     __tablename__ = "service_sale_history"
+    # Mesmo índice do criar_todas_tabelas.sql (página de finanças, filtro por período)
+    __table_args__ = (
+        Index("idx_service_sale_history_sold_at", "sold_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     service_id = Column(Integer, ForeignKey("services.id"), nullable=False)  # ID do serviço vendido
@@ -196,4 +237,68 @@ class ServiceSaleHistory(Base):
     sold_at = Column(DateTime, default=datetime.datetime.utcnow)  # Data/hora da venda
     
     # Relacionamento
-    service = relationship("Service", foreign_keys=[service_id])
\ No newline at end of file
+    service = relationship("Service", foreign_keys=[service_id])
+
+# =========================================
+# SNAPSHOT DO DASHBOARD (Agregados mantidos incrementalmente)
+# =========================================
+class DashboardSnapshot(Base):
+    __tablename__ = "dashboard_snapshot"
+
+    id = Column(Integer, primary_key=True)  # Linha única (id = 1)
+    total_skus = Column(Integer, default=0)  # Quantidade de variações
+    valor_estoque = Column(Numeric(14, 2), default=0)  # Soma de preço * estoque
+    lucro_potencial = Column(Numeric(14, 2), default=0)  # Soma de (preço - custo) * estoque
+    soma_margens = Column(Numeric(18, 6), default=0)  # Soma das margens % das variações com preço
+    skus_com_preco = Column(Integer, default=0)  # Variações com preço > 0 (divisor da margem média)
+    skus_com_estoque = Column(Integer, default=0)  # Variações com estoque > 0
+    qtd_criticos = Column(Integer, default=0)  # Estoque <= mínimo
+    qtd_baixos = Column(Integer, default=0)  # Estoque = mínimo + 1
+    qtd_zerados = Column(Integer, default=0)  # Estoque = 0
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Contadores atômicos (numeração de OS, compras, etc.); ver counters.py
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name = Column(String, primary_key=True)  # Ex: OS-2024, COMP-2024
+    value = Column(BigInteger, nullable=False, default=0)  # Último valor entregue
+
+# =========================================
+# CHECKPOINTS DE ESTOQUE (Posição em data passada; ver ledger.py)
+# =========================================
+class StockCheckpoint(Base):
+    __tablename__ = "stock_checkpoints"
+    __table_args__ = (Index("idx_stock_checkpoints_data", "checkpoint_at", "variation_id"),)
+
+    id = Column(Integer, primary_key=True)
+    variation_id = Column(Integer, ForeignKey("color_variations.id", ondelete="CASCADE"), nullable=False)
+    checkpoint_at = Column(DateTime, nullable=False)  # Instante da foto (igual para todas as variações)
+    stock = Column(Integer, nullable=False, default=0)  # Saldo no instante
+    cost_price = Column(Numeric(10, 2))  # Custo no instante (para valorização)
+    variation_price = Column(Numeric(10, 2))  # Preço de venda no instante
+    last_movement_id = Column(Integer, nullable=False, default=0)  # Última movimentação já incluída no saldo
+
+# =========================================
+# TOTAIS FINANCEIROS POR DIA E POR MÊS (Atualizados incrementalmente; ver finance_rollup.py)
+# =========================================
+class TotaisFinanceiros:
+    """Colunas comuns às tabelas por dia e por mês"""
+    period_start = Column(Date, primary_key=True)  # Dia (ou primeiro dia do mês)
+    purchases_count = Column(Integer, nullable=False, default=0)  # Compras registradas
+    purchases_value = Column(Numeric(14, 2), nullable=False, default=0)  # Valor total das compras (peças + frete)
+    shipping_value = Column(Numeric(14, 2), nullable=False, default=0)  # Frete das compras
+    orders_count = Column(Integer, nullable=False, default=0)  # Ordens de serviço finalizadas
+    orders_revenue = Column(Numeric(14, 2), nullable=False, default=0)  # Receita das ordens (total_value)
+    orders_cost = Column(Numeric(14, 2), nullable=False, default=0)  # Custo das ordens (receita - lucro)
+    orders_profit = Column(Numeric(14, 2), nullable=False, default=0)  # Lucro das ordens (profit)
+    sales_count = Column(Integer, nullable=False, default=0)  # Serviços finalizados direto do card
+    sales_revenue = Column(Numeric(14, 2), nullable=False, default=0)  # Receita dos serviços (sale_price)
+    sales_cost = Column(Numeric(14, 2), nullable=False, default=0)  # Custo das peças vinculadas (part_cost)
+    sales_profit = Column(Numeric(14, 2), nullable=False, default=0)  # Lucro dos serviços (profit)
+
+class FinanceDaily(TotaisFinanceiros, Base):
+    __tablename__ = "finance_daily"
+
+class FinanceMonthly(TotaisFinanceiros, Base):
+    __tablename__ = "finance_monthly"
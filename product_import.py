@@ -0,0 +1,474 @@
+"""
+Importação de produtos em massa (planilhas de fornecedor).
+
+POST /api/produtos/import recebe o arquivo no corpo da requisição e o lê em
+fluxo, sem carregá-lo inteiro na memória:
+
+- CSV (uma linha por cor; separador "," ou ";"; cabeçalho com os nomes dos
+  campos de ProdutoCreate/CorCreate ou os apelidos em APELIDOS_CSV)
+- JSON lines (um objeto por linha: um ProdutoCreate com "colors" ou uma linha
+  plana como a do CSV)
+
+Cada registro é validado com ProdutoCreate/CorCreate. Os registros válidos
+são gravados em lotes de LOTE_IMPORTACAO, um commit por lote, com poucas
+instruções por lote:
+
+- variações com full_sku já cadastrado são atualizadas (upsert pelo SKU)
+- as demais entram no produto de mesmo nome (criado no lote se não existir)
+- cores sem SKU recebem o SKU gerado (sku_allocator), uma consulta por lote
+
+Só os campos presentes no registro são alterados em variações e produtos já
+existentes. Uma linha de SKU já cadastrado pode trazer só o SKU e os campos a
+alterar (ex: "sku;preco;estoque"): nome do produto e cor vêm do cadastro, com
+uma consulta por lote. Erros de validação (ou SKU repetido no arquivo) são informados
+por linha e não impedem as outras.
+"""
+import codecs
+import csv
+import json
+from types import SimpleNamespace
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update
+
+import models
+from dashboard import estado_variacao, registrar_alteracoes
+from events import publicar
+from schemas import ProdutoCreate, CorCreate
+from sku_allocator import sku_base, alocar_skus
+from sku_index import evento_catalogo
+
+LOTE_IMPORTACAO = 500
+LIMITE_ERROS_RESPOSTA = 1000
+
+CAMPOS_PRODUTO = ("name", "manufacturer", "compatibility", "category")
+CAMPOS_COR = tuple(CorCreate.model_fields)
+CAMPOS_NUMERICOS = ("variation_price", "price", "cost_price", "cost", "available_stock", "stock", "min_stock_alert")
+
+# Cabeçalhos aceitos além dos nomes dos campos (planilhas em português)
+APELIDOS_CSV = {
+    "produto": "name",
+    "nome": "name",
+    "fabricante": "manufacturer",
+    "compatibilidade": "compatibility",
+    "categoria": "category",
+    "cor": "color_name",
+    "sku": "full_sku",
+    "preco": "price",
+    "preço": "price",
+    "custo": "cost",
+    "estoque": "stock",
+    "estoque_minimo": "min_stock_alert",
+    "minimo": "min_stock_alert",
+    "mínimo": "min_stock_alert",
+}
+
+
+class ErroLinha(Exception):
+    """Registro recusado; vai para a lista de erros da resposta"""
+
+
+# =========================================
+# LEITURA EM FLUXO
+# =========================================
+
+async def linhas_do_corpo(fluxo):
+    """Quebra os pedaços do corpo (request.stream()) em linhas de texto"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    resto = ""
+    async for pedaco in fluxo:
+        partes = (resto + decodificador.decode(pedaco)).split("\n")
+        resto = partes.pop()
+        for linha in partes:
+            yield linha.rstrip("\r")
+    resto += decodificador.decode(b"", final=True)
+    if resto.strip():
+        yield resto.rstrip("\r")
+
+
+class LeitorCsv:
+    """
+    Recebe linhas físicas e devolve registros (numero_linha, dict).
+    Um campo entre aspas pode conter quebras de linha: a linha só é
+    processada quando as aspas estão balanceadas.
+    """
+
+    def __init__(self):
+        self._colunas = None
+        self._separador = ","
+        self._pendente = []
+        self._numero = 0
+        self._inicio = 0
+
+    def alimentar(self, linha):
+        """Retorna (numero_linha, dict) quando um registro fecha; senão None"""
+        self._numero += 1
+        if not self._pendente:
+            self._inicio = self._numero
+        self._pendente.append(linha)
+        texto = "\n".join(self._pendente)
+        if texto.count('"') % 2:
+            return None
+        self._pendente = []
+        if not texto.strip():
+            return None
+
+        if self._colunas is None:
+            self._separador = ";" if texto.count(";") > texto.count(",") else ","
+            self._colunas = [
+                APELIDOS_CSV.get(c.strip().lower(), c.strip().lower())
+                for c in next(csv.reader([texto], delimiter=self._separador))
+            ]
+            return None
+
+        valores = next(csv.reader([texto], delimiter=self._separador))
+        return self._inicio, dict(zip(self._colunas, valores))
+
+    def finalizar(self):
+        """Aspas abertas no fim do arquivo"""
+        if self._pendente:
+            return self._inicio, ErroLinha("Aspas não fechadas até o fim do arquivo")
+        return None
+
+
+def _numero_csv(valor):
+    """'1.234,56' / '10,5' / '10.5' -> texto aceito pelo pydantic"""
+    valor = valor.strip().replace("R$", "").strip()
+    if "," in valor:
+        valor = valor.replace(".", "").replace(",", ".")
+    return valor
+
+
+def dados_de_linha_plana(linha):
+    """Linha com campos de produto + cor (CSV ou JSON plano) -> dict no formato de ProdutoCreate"""
+    produto = {}
+    cor = {}
+    for campo, valor in linha.items():
+        if valor is None or (isinstance(valor, str) and not valor.strip()):
+            continue
+        if isinstance(valor, str):
+            valor = _numero_csv(valor) if campo in CAMPOS_NUMERICOS else valor.strip()
+        if campo in CAMPOS_PRODUTO:
+            produto[campo] = valor
+        elif campo in CAMPOS_COR:
+            cor[campo] = valor
+    produto["colors"] = [cor]
+    return produto
+
+
+def ler_registro(registro):
+    """dict (CSV) ou texto (JSON lines) -> dict no formato de ProdutoCreate; levanta ErroLinha"""
+    if isinstance(registro, str):
+        try:
+            dados = json.loads(registro)
+        except json.JSONDecodeError as e:
+            raise ErroLinha(f"JSON inválido: {e.msg}")
+        if not isinstance(dados, dict):
+            raise ErroLinha("Cada linha deve ser um objeto JSON")
+        if "colors" in dados:
+            return dados
+        registro = dados
+    return dados_de_linha_plana(registro)
+
+
+def _vazio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _cores(dados):
+    cores = dados.get("colors")
+    return [cor for cor in cores if isinstance(cor, dict)] if isinstance(cores, list) else []
+
+
+def skus_a_completar(dados):
+    """SKUs de cores sem nome do produto ou sem nome da cor no registro"""
+    sem_nome = _vazio(dados.get("name"))
+    return {
+        cor["full_sku"]
+        for cor in _cores(dados)
+        if isinstance(cor.get("full_sku"), str) and (sem_nome or _vazio(cor.get("color_name")))
+    }
+
+
+def cadastro_por_sku(db, skus):
+    """{full_sku: (nome do produto, nome da cor)} das variações cadastradas"""
+    cv = models.ColorVariation
+    produto = models.Product
+    return {
+        linha.full_sku: (linha.name, linha.color_name)
+        for linha in db.execute(
+            select(cv.full_sku, cv.color_name, produto.name)
+            .join(produto, produto.id == cv.product_id)
+            .where(cv.full_sku.in_(skus))
+        )
+    }
+
+
+def completar_do_cadastro(dados, cadastro):
+    """Preenche nome do produto e da cor ausentes com os do SKU já cadastrado"""
+    for cor in _cores(dados):
+        atual = cadastro.get(cor.get("full_sku")) if isinstance(cor.get("full_sku"), str) else None
+        if atual is None:
+            continue
+        nome, nome_cor = atual
+        if _vazio(dados.get("name")):
+            dados["name"] = nome
+        if _vazio(cor.get("color_name")):
+            cor["color_name"] = nome_cor
+
+
+def validar_registro(dados):
+    """dict de ler_registro -> ProdutoCreate; levanta ErroLinha"""
+    try:
+        produto = ProdutoCreate.model_validate(dados)
+    except ValidationError as e:
+        detalhes = "; ".join(
+            f"{'.'.join(str(p) for p in erro['loc'])}: {erro['msg']}" for erro in e.errors()
+        )
+        raise ErroLinha(f"Dados inválidos ({detalhes})")
+
+    if not produto.name.strip():
+        raise ErroLinha("Nome do produto vazio")
+    if not produto.colors:
+        raise ErroLinha("Nenhuma cor informada")
+    for cor in produto.colors:
+        if not cor.color_name.strip():
+            raise ErroLinha("Nome da cor vazio")
+    return produto
+
+
+# =========================================
+# GRAVAÇÃO POR LOTE
+# =========================================
+
+def valores_cor(cor, somente_informados):
+    """Colunas da ColorVariation a partir do CorCreate (mesmas regras de criar_produto)"""
+    informados = cor.model_fields_set
+    valores = {"color_name": cor.color_name}
+    if not somente_informados or {"variation_price", "price"} & informados:
+        valores["variation_price"] = cor.variation_price if cor.variation_price is not None else (cor.price or 0.0)
+    if not somente_informados or {"cost_price", "cost"} & informados:
+        valores["cost_price"] = cor.cost_price if cor.cost_price is not None else (cor.cost or 0.0)
+    if not somente_informados or {"available_stock", "stock"} & informados:
+        valores["available_stock"] = cor.available_stock if cor.available_stock is not None else (cor.stock or 0)
+    if not somente_informados or "min_stock_alert" in informados:
+        valores["min_stock_alert"] = cor.min_stock_alert
+    return valores
+
+
+def valores_produto(produto, somente_informados):
+    informados = produto.model_fields_set
+    valores = {}
+    for campo, padrao in (("manufacturer", "Genérico"), ("compatibility", "Universal"), ("category", "Capas")):
+        if not somente_informados or campo in informados:
+            valores[campo] = getattr(produto, campo) or padrao
+    return valores
+
+
+def importar_lote(db, registros):
+    """
+    Grava um lote de (numero_linha, ProdutoCreate) e faz o commit.
+    Retorna o resumo {"produtos_criados", "variacoes_criadas", "variacoes_atualizadas"}.
+    """
+    cv = models.ColorVariation
+    produto_t = models.Product
+
+    # 1. Variações já cadastradas (pelo SKU), travadas até o commit
+    skus = {cor.full_sku for _, produto in registros for cor in produto.colors if cor.full_sku}
+    existentes = {
+        variacao.full_sku: variacao
+        for variacao in db.execute(
+            select(cv.id, cv.full_sku, cv.product_id, cv.variation_price, cv.cost_price,
+                   cv.available_stock, cv.min_stock_alert)
+            .where(cv.full_sku.in_(skus))
+            .order_by(cv.id)
+            .with_for_update()
+        )
+    } if skus else {}
+
+    # 2. Produtos pelo nome (para as variações novas)
+    novas = [
+        (produto, cor)
+        for _, produto in registros
+        for cor in produto.colors
+        if not (cor.full_sku and cor.full_sku in existentes)
+    ]
+    nomes = {produto.name.strip() for produto, _ in novas}
+    produtos_por_nome = {}
+    if nomes:
+        for linha in db.execute(
+            select(produto_t.id, produto_t.name).where(produto_t.name.in_(nomes)).order_by(produto_t.id)
+        ):
+            produtos_por_nome.setdefault(linha.name, linha.id)
+
+    # 3. Produtos novos: um INSERT de várias linhas
+    a_criar = {}
+    for produto, _ in novas:
+        nome = produto.name.strip()
+        if nome not in produtos_por_nome and nome not in a_criar:
+            a_criar[nome] = {"name": nome, **valores_produto(produto, somente_informados=False)}
+    ids_criados = set()
+    if a_criar:
+        criados = db.execute(
+            insert(produto_t).returning(produto_t.id, produto_t.name, sort_by_parameter_order=True),
+            list(a_criar.values()),
+        )
+        for linha in criados:
+            produtos_por_nome[linha.name] = linha.id
+            ids_criados.add(linha.id)
+
+    # Campos informados de produtos que já existiam
+    atualizar_produtos = {}
+    for _, produto in registros:
+        valores = valores_produto(produto, somente_informados=True)
+        if not valores:
+            continue
+        for cor in produto.colors:
+            existente = existentes.get(cor.full_sku) if cor.full_sku else None
+            produto_id = existente.product_id if existente else produtos_por_nome.get(produto.name.strip())
+            if produto_id is not None and produto_id not in ids_criados:
+                atualizar_produtos.setdefault(produto_id, {}).update(valores)
+    if atualizar_produtos:
+        db.execute(update(produto_t), [{"id": pid, **valores} for pid, valores in atualizar_produtos.items()])
+
+    # 4. SKUs gerados de todas as cores do lote em uma consulta
+    gerados = iter(alocar_skus(
+        db,
+        [sku_base(produto.category, produto.name, cor.color_name) for produto, cor in novas if not cor.full_sku],
+        reservados=skus,
+    ))
+
+    alteracoes_dashboard = []
+    inserir = []
+    for produto, cor in novas:
+        valores = {
+            "product_id": produtos_por_nome[produto.name.strip()],
+            "full_sku": cor.full_sku or next(gerados),
+            **valores_cor(cor, somente_informados=False),
+        }
+        inserir.append(valores)
+        alteracoes_dashboard.append((None, estado_variacao(SimpleNamespace(**valores))))
+
+    atualizar = []
+    for _, produto in registros:
+        for cor in produto.colors:
+            existente = existentes.get(cor.full_sku) if cor.full_sku else None
+            if existente is None:
+                continue
+            valores = valores_cor(cor, somente_informados=True)
+            atualizar.append({"id": existente.id, **valores})
+            alteracoes_dashboard.append((
+                estado_variacao(existente),
+                estado_variacao(SimpleNamespace(**{**existente._mapping, **valores})),
+            ))
+
+    # 5. Um INSERT de várias linhas e um UPDATE em lote (pela chave primária)
+    if inserir:
+        db.execute(insert(cv), inserir)
+    if atualizar:
+        db.execute(update(cv), atualizar)
+
+    registrar_alteracoes(db, alteracoes_dashboard)
+    publicar(db, [evento_catalogo()])
+    db.commit()
+
+    return {
+        "produtos_criados": len(a_criar),
+        "variacoes_criadas": len(inserir),
+        "variacoes_atualizadas": len(atualizar),
+    }
+
+
+# =========================================
+# CONDUÇÃO DA IMPORTAÇÃO
+# =========================================
+
+class Importacao:
+    """Acumula registros validados em lotes e junta o resumo e os erros"""
+
+    def __init__(self, tamanho_lote=LOTE_IMPORTACAO):
+        self.tamanho_lote = tamanho_lote
+        self._lote = []
+        self._skus_vistos = {}
+        self.linhas = 0
+        self.erros = []
+        self.total_erros = 0
+        self.resumo = {"produtos_criados": 0, "variacoes_criadas": 0, "variacoes_atualizadas": 0}
+
+    def _erro(self, numero, mensagem, sku=None):
+        self.total_erros += 1
+        if len(self.erros) < LIMITE_ERROS_RESPOSTA:
+            self.erros.append({"linha": numero, "sku": sku, "message": mensagem})
+
+    def adicionar(self, numero, registro):
+        """registro: dict (CSV), texto (JSON lines) ou ErroLinha do leitor"""
+        self.linhas += 1
+        sku = registro.get("full_sku") or None if isinstance(registro, dict) else None
+        try:
+            if isinstance(registro, ErroLinha):
+                raise registro
+            dados = ler_registro(registro)
+        except ErroLinha as e:
+            self._erro(numero, str(e), sku)
+            return
+        # A validação fica para gravar(): nome e cor podem vir do cadastro
+        self._lote.append((numero, dados, sku))
+
+    def lote_cheio(self):
+        return len(self._lote) >= self.tamanho_lote
+
+    def _validar(self, numero, dados, sku, cadastro):
+        """Valida um registro do lote; None se foi para a lista de erros"""
+        try:
+            completar_do_cadastro(dados, cadastro)
+            produto = validar_registro(dados)
+            for cor in produto.colors:
+                if cor.full_sku and cor.full_sku in self._skus_vistos:
+                    sku = cor.full_sku
+                    raise ErroLinha(f"SKU repetido no arquivo (linha {self._skus_vistos[cor.full_sku]})")
+        except ErroLinha as e:
+            self._erro(numero, str(e), sku)
+            return None
+        for cor in produto.colors:
+            if cor.full_sku:
+                self._skus_vistos[cor.full_sku] = numero
+        return produto
+
+    def gravar(self, db):
+        """Valida e grava o lote pendente (chamado fora do event loop)"""
+        lote, self._lote = self._lote, []
+        if not lote:
+            return
+        validos = []
+        try:
+            skus = set().union(*(skus_a_completar(dados) for _, dados, _ in lote))
+            cadastro = cadastro_por_sku(db, skus) if skus else {}
+            for numero, dados, sku in lote:
+                produto = self._validar(numero, dados, sku, cadastro)
+                if produto is not None:
+                    validos.append((numero, produto))
+            if not validos:
+                return
+            parcial = importar_lote(db, validos)
+        except Exception as e:
+            print(f"[ERRO] Erro ao importar lote (linhas {lote[0][0]} a {lote[-1][0]}): {e}")
+            try:
+                db.rollback()
+            except Exception:
+                pass
+            # Falha na consulta do cadastro: nenhuma linha do lote foi validada
+            numeros = [numero for numero, _ in validos] if validos else [numero for numero, _, _ in lote]
+            for numero in numeros:
+                self._erro(numero, f"Lote não gravado: {str(e)[:200]}")
+            return
+        for chave, valor in parcial.items():
+            self.resumo[chave] += valor
+
+    def resultado(self):
+        return {
+            "status": "sucesso" if not self.total_erros else "parcial",
+            "linhas": self.linhas,
+            **self.resumo,
+            "total_erros": self.total_erros,
+            "erros": self.erros,
+        }
@@ -0,0 +1,143 @@
+"""
+Edição de produto por diferença (PUT /api/produtos/{id}).
+
+As variações gravadas são lidas uma vez (travadas até o commit) e comparadas
+com as enviadas pelo formulário:
+
+- gravadas e não enviadas: um DELETE ... WHERE id IN (...)
+- enviadas com id: UPDATE em lote pela chave primária, só das colunas que
+  mudaram; variações iguais não geram comando
+- enviadas sem id: um INSERT de várias linhas, com os SKUs gerados em uma
+  consulta (sku_allocator)
+
+Editar um preço de um produto com 40 cores grava uma coluna de uma linha.
+O commit fica com quem chama.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import delete, insert, select, update
+
+import models
+from dashboard import estado_variacao, registrar_alteracoes
+from events import publicar
+from product_import import valores_cor, valores_produto
+from sku_allocator import sku_base, alocar_skus
+from sku_index import evento_catalogo
+
+CENTAVOS = Decimal("0.01")
+COLUNAS_DINHEIRO = ("variation_price", "cost_price")
+
+
+def _normalizar(coluna, valor):
+    """Valor como o banco guarda (Numeric(10, 2)), para comparar sem falsas diferenças"""
+    if coluna in COLUNAS_DINHEIRO and valor is not None:
+        return Decimal(str(valor)).quantize(CENTAVOS)
+    return valor
+
+
+def _mudancas(atual, valores):
+    """Só as colunas cujo valor novo difere do gravado"""
+    return {
+        coluna: valor
+        for coluna, valor in valores.items()
+        if _normalizar(coluna, valor) != _normalizar(coluna, atual[coluna])
+    }
+
+
+def aplicar_edicao(db, produto_id, produto):
+    """
+    Aplica um ProdutoUpdate ao produto gravado. Retorna None se o produto não
+    existe; senão, o resumo do que mudou:
+    {"produto": [colunas], "variacoes_criadas": [...], "variacoes_atualizadas": [...],
+     "variacoes_excluidas": [ids]}
+    """
+    produto_t = models.Product
+    cv = models.ColorVariation
+
+    atual = db.execute(
+        select(produto_t.id, produto_t.name, produto_t.manufacturer, produto_t.compatibility, produto_t.category)
+        .where(produto_t.id == produto_id)
+    ).first()
+    if atual is None:
+        return None
+
+    gravadas = {
+        linha.id: linha._mapping
+        for linha in db.execute(
+            select(cv.id, cv.color_name, cv.full_sku, cv.variation_price, cv.cost_price,
+                   cv.available_stock, cv.min_stock_alert)
+            .where(cv.product_id == produto_id)
+            .order_by(cv.id)
+            .with_for_update()
+        )
+    }
+
+    # Produto: só as colunas alteradas
+    mudancas_produto = _mudancas(atual._mapping, {"name": produto.name, **valores_produto(produto, somente_informados=False)})
+    if mudancas_produto:
+        db.execute(update(produto_t).where(produto_t.id == produto_id).values(**mudancas_produto))
+
+    alteracoes_dashboard = []
+
+    # 1. Excluídas (antes das novas: o SKU liberado pode ser reaproveitado)
+    ids_enviados = {cor.id for cor in produto.colors if cor.id in gravadas}
+    excluidas = [var_id for var_id in gravadas if var_id not in ids_enviados]
+    if excluidas:
+        db.execute(delete(cv).where(cv.id.in_(excluidas)))
+        alteracoes_dashboard.extend((estado_variacao(SimpleNamespace(**gravadas[var_id])), None) for var_id in excluidas)
+
+    # 2. Existentes: UPDATE em lote, uma linha por variação que mudou
+    atualizar = []
+    atualizadas = []
+    for cor in produto.colors:
+        if cor.id not in gravadas:
+            continue
+        gravada = gravadas[cor.id]
+        valores = valores_cor(cor, somente_informados=False)
+        if cor.full_sku:
+            valores["full_sku"] = cor.full_sku
+        mudancas = _mudancas(gravada, valores)
+        if not mudancas:
+            continue
+        atualizar.append({"id": cor.id, **mudancas})
+        atualizadas.append({"id": cor.id, "campos": sorted(mudancas)})
+        alteracoes_dashboard.append((
+            estado_variacao(SimpleNamespace(**gravada)),
+            estado_variacao(SimpleNamespace(**{**gravada, **mudancas})),
+        ))
+    if atualizar:
+        # Linhas com as mesmas colunas alteradas vão no mesmo executemany
+        db.execute(update(cv), atualizar)
+
+    # 3. Novas: SKUs gerados de uma vez e um INSERT de várias linhas
+    novas = [cor for cor in produto.colors if cor.id not in gravadas]
+    gerados = iter(alocar_skus(
+        db,
+        [sku_base(produto.category, produto.name, cor.color_name) for cor in novas if not cor.full_sku],
+        reservados=[cor.full_sku for cor in produto.colors],
+    ))
+    inserir = [
+        {"product_id": produto_id, "full_sku": cor.full_sku or next(gerados), **valores_cor(cor, somente_informados=False)}
+        for cor in novas
+    ]
+    criadas = []
+    if inserir:
+        for linha in db.execute(
+            insert(cv).returning(cv.id, cv.full_sku, cv.color_name, sort_by_parameter_order=True),
+            inserir,
+        ):
+            criadas.append({"id": linha.id, "sku": linha.full_sku, "color_name": linha.color_name})
+        alteracoes_dashboard.extend((None, estado_variacao(SimpleNamespace(**valores))) for valores in inserir)
+
+    if alteracoes_dashboard:
+        registrar_alteracoes(db, alteracoes_dashboard)
+    if mudancas_produto or alteracoes_dashboard:
+        publicar(db, [evento_catalogo()])
+
+    return {
+        "produto": sorted(mudancas_produto),
+        "variacoes_criadas": criadas,
+        "variacoes_atualizadas": atualizadas,
+        "variacoes_excluidas": excluidas,
+    }
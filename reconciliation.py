@@ -0,0 +1,228 @@
+"""
+Conciliação do saldo das variações com o histórico de movimentações.
+
+O available_stock pode ser editado direto pela tela de produtos (sem gerar
+movimentação), então saldo e histórico podem divergir. Este comando confere,
+para cada variação com movimentações:
+
+- quebra_cadeia: previous_stock diferente do new_stock da movimentação anterior
+- conta_errada: previous_stock +/- quantity diferente de new_stock
+- saldo_negativo: new_stock < 0
+- saldo_divergente: new_stock da última movimentação diferente do saldo atual
+- soma_divergente: previous_stock da primeira + soma das quantidades
+  diferente do saldo atual
+
+O espaço de ids das variações é dividido em faixas, verificadas em paralelo
+por um pool de processos (cada um com sua conexão). As verificações são
+feitas no banco, com funções de janela e agregações por faixa, e só as
+divergências voltam para o Python. Nenhuma linha é travada: cada faixa é lida
+em um snapshot (REPEATABLE READ no Postgres), então a loja continua vendendo
+durante a conciliação.
+
+    python reconciliation.py
+    python reconciliation.py --processos 8 --saida divergencias.csv
+
+Sai com código 1 se houver divergências (útil no cron noturno).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import NullPool
+
+import models
+from ledger import delta_movimento
+
+# Engine próprio de cada processo do pool (criado no inicializador)
+_engine_processo = None
+
+
+def _inicializar_processo(url):
+    global _engine_processo
+    _engine_processo = create_engine(url, poolclass=NullPool)
+
+
+def dividir_faixas(menor_id, maior_id, quantidade):
+    """Divide [menor_id, maior_id] em até `quantidade` faixas contíguas"""
+    total = maior_id - menor_id + 1
+    tamanho = max(1, -(-total // quantidade))
+    return [
+        (inicio, min(inicio + tamanho - 1, maior_id))
+        for inicio in range(menor_id, maior_id + 1, tamanho)
+    ]
+
+
+def verificar_faixa(conexao, inicio, fim):
+    """Confere as variações com id entre inicio e fim; retorna (resumo, divergências)"""
+    sm = models.StockMovement
+    cv = models.ColorVariation
+    delta = delta_movimento()
+    divergencias = []
+
+    # Cadeia: compara cada movimentação com a anterior da mesma variação
+    janela = select(
+        sm.id,
+        sm.variation_id,
+        sm.previous_stock,
+        sm.new_stock,
+        delta.label("delta"),
+        func.lag(sm.new_stock).over(partition_by=sm.variation_id, order_by=sm.id).label("anterior"),
+    ).where(sm.variation_id.between(inicio, fim)).subquery()
+    quebras = conexao.execute(
+        select(janela, cv.full_sku)
+        .join(cv, cv.id == janela.c.variation_id)
+        .where(
+            (janela.c.anterior.isnot(None) & janela.c.previous_stock.is_distinct_from(janela.c.anterior))
+            | (janela.c.previous_stock + janela.c.delta).is_distinct_from(janela.c.new_stock)
+            | (janela.c.new_stock < 0)
+        )
+        .order_by(janela.c.variation_id, janela.c.id)
+    )
+    for linha in quebras:
+        base = {"variation_id": linha.variation_id, "full_sku": linha.full_sku, "movimento_id": linha.id}
+        if linha.anterior is not None and linha.previous_stock != linha.anterior:
+            divergencias.append({**base, "tipo": "quebra_cadeia", "esperado": linha.anterior, "encontrado": linha.previous_stock})
+        if linha.previous_stock is None or linha.new_stock is None or linha.previous_stock + linha.delta != linha.new_stock:
+            esperado = None if linha.previous_stock is None else linha.previous_stock + linha.delta
+            divergencias.append({**base, "tipo": "conta_errada", "esperado": esperado, "encontrado": linha.new_stock})
+        if linha.new_stock is not None and linha.new_stock < 0:
+            divergencias.append({**base, "tipo": "saldo_negativo", "esperado": 0, "encontrado": linha.new_stock})
+
+    # Saldo: compara o saldo atual com a última movimentação e com a soma
+    agregado = select(
+        sm.variation_id,
+        func.count(sm.id).label("quantidade"),
+        func.sum(delta).label("soma"),
+        func.min(sm.id).label("primeiro_id"),
+        func.max(sm.id).label("ultimo_id"),
+    ).where(sm.variation_id.between(inicio, fim)).group_by(sm.variation_id).subquery()
+    primeiro = models.StockMovement.__table__.alias("primeiro")
+    ultimo = models.StockMovement.__table__.alias("ultimo")
+    saldos = conexao.execute(
+        select(
+            cv.id, cv.full_sku, cv.available_stock,
+            agregado.c.quantidade, agregado.c.soma,
+            primeiro.c.previous_stock.label("inicial"),
+            ultimo.c.new_stock.label("final"),
+        )
+        .join(agregado, agregado.c.variation_id == cv.id)
+        .join(primeiro, primeiro.c.id == agregado.c.primeiro_id)
+        .join(ultimo, ultimo.c.id == agregado.c.ultimo_id)
+        .where(cv.id.between(inicio, fim))
+        .order_by(cv.id)
+    ).all()
+
+    movimentos = 0
+    for linha in saldos:
+        movimentos += linha.quantidade
+        saldo = linha.available_stock or 0
+        base = {"variation_id": linha.id, "full_sku": linha.full_sku, "movimento_id": None}
+        if linha.final != saldo:
+            divergencias.append({**base, "tipo": "saldo_divergente", "esperado": linha.final, "encontrado": saldo})
+        if (linha.inicial or 0) + linha.soma != saldo:
+            divergencias.append({**base, "tipo": "soma_divergente", "esperado": (linha.inicial or 0) + linha.soma, "encontrado": saldo})
+
+    return {"variacoes": len(saldos), "movimentos": movimentos}, divergencias
+
+
+def _tarefa_faixa(faixa):
+    """Executada em um processo do pool"""
+    inicio, fim = faixa
+    with _engine_processo.connect() as conexao:
+        if conexao.dialect.name == "postgresql":
+            conexao = conexao.execution_options(isolation_level="REPEATABLE READ")
+        with conexao.begin():
+            return verificar_faixa(conexao, inicio, fim)
+
+
+def conciliar(url, processos=None, faixas=None):
+    """
+    Roda a conciliação inteira. Retorna (resumo, divergências).
+    processos: tamanho do pool (padrão: número de CPUs, até 8)
+    faixas: quantas faixas de ids (padrão: 4 por processo, para equilibrar)
+    """
+    processos = processos or min(8, os.cpu_count() or 1)
+    faixas = faixas or processos * 4
+
+    engine = create_engine(url, poolclass=NullPool)
+    with engine.connect() as conexao:
+        menor_id, maior_id = conexao.execute(
+            select(func.min(models.ColorVariation.id), func.max(models.ColorVariation.id))
+        ).one()
+    engine.dispose()
+
+    resumo = {"variacoes": 0, "movimentos": 0, "faixas": 0, "processos": processos}
+    divergencias = []
+    if menor_id is None:
+        return resumo, divergencias
+
+    lista_faixas = dividir_faixas(menor_id, maior_id, faixas)
+    resumo["faixas"] = len(lista_faixas)
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo, initargs=(url,)) as executor:
+        for parcial, encontradas in executor.map(_tarefa_faixa, lista_faixas):
+            resumo["variacoes"] += parcial["variacoes"]
+            resumo["movimentos"] += parcial["movimentos"]
+            divergencias.extend(encontradas)
+
+    return resumo, divergencias
+
+
+def salvar_relatorio(caminho, divergencias):
+    """Grava as divergências em CSV ou JSON (pela extensão do arquivo)"""
+    if caminho.lower().endswith(".json"):
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump(divergencias, arquivo, ensure_ascii=False, indent=2)
+        return
+    campos = ["variation_id", "full_sku", "tipo", "movimento_id", "esperado", "encontrado"]
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=campos)
+        escritor.writeheader()
+        escritor.writerows(divergencias)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processos", type=int, default=None, help="tamanho do pool de processos")
+    parser.add_argument("--faixas", type=int, default=None, help="quantidade de faixas de ids")
+    parser.add_argument("--saida", help="arquivo do relatório (.csv ou .json)")
+    parser.add_argument("--mostrar", type=int, default=20, help="divergências exibidas no terminal")
+    args = parser.parse_args()
+
+    import database
+    if not database.DATABASE_AVAILABLE or not database.SQLALCHEMY_DATABASE_URL:
+        print("[ERRO] Banco de dados nao configurado")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    resumo, divergencias = conciliar(database.SQLALCHEMY_DATABASE_URL, args.processos, args.faixas)
+    duracao = time.perf_counter() - inicio
+
+    print(f"Conciliacao: {resumo['variacoes']} variacoes com movimentacoes, {resumo['movimentos']} movimentacoes, "
+          f"{resumo['faixas']} faixas em {resumo['processos']} processos, {duracao:.2f}s")
+
+    por_tipo = {}
+    for divergencia in divergencias:
+        por_tipo[divergencia["tipo"]] = por_tipo.get(divergencia["tipo"], 0) + 1
+    for tipo, total in sorted(por_tipo.items()):
+        print(f"  {tipo}: {total}")
+    for divergencia in divergencias[:args.mostrar]:
+        print(f"  [{divergencia['tipo']}] {divergencia['full_sku']} (variacao {divergencia['variation_id']}, "
+              f"movimentacao {divergencia['movimento_id'] or '-'}): esperado {divergencia['esperado']}, encontrado {divergencia['encontrado']}")
+
+    if args.saida:
+        salvar_relatorio(args.saida, divergencias)
+        print(f"Relatorio salvo em {args.saida}")
+
+    if divergencias:
+        print(f"\n[AVISO] {len(divergencias)} divergencias encontradas")
+        sys.exit(1)
+    print("\n[OK] Saldos e historico conferem")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from typing_extensions import TypedDict
 from datetime import datetime
 
 # =========================================
@@ -179,4 +180,62 @@ class PurchaseUpdate(BaseModel):
     supplier_name: Optional[str] = None
     shipping_cost: Optional[float] = None
     items: Optional[List[PurchaseItemCreate]] = None
-    notes: Optional[str] = None
\ No newline at end of file
+    notes: Optional[str] = None
+
+# =========================================
+# 9. RESPOSTAS DAS LISTAGENS (serializadas por api_json.py)
+# Campos float aceitam Decimal direto do banco; datas saem em ISO 8601
+# =========================================
+
+class PecaDaOrdem(TypedDict):
+    id: int
+    device_model: Optional[str]
+    part_name: str
+    price: float
+    quantity: int
+
+class ServicoDaOrdem(TypedDict):
+    id: int
+    name: Optional[str]
+    description: Optional[str]
+    price: float
+    quantity: int
+
+class OrdemServicoResumo(TypedDict):
+    id: int
+    order_number: Optional[str]
+    client_name: Optional[str]
+    client_phone: Optional[str]
+    client_email: Optional[str]
+    device_model: Optional[str]
+    service_description: Optional[str]
+    status: Optional[str]
+    total_value: float
+    notes: Optional[str]
+    created_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    parts: List[PecaDaOrdem]
+    services: List[ServicoDaOrdem]
+
+class PecaDaCompra(TypedDict):
+    id: Optional[int]
+    device_model: Optional[str]
+    part_name: str
+
+class ItemCompraResumo(TypedDict):
+    id: int
+    repair_part_id: Optional[int]
+    repair_part: PecaDaCompra
+    quantity: Optional[int]
+    unit_cost: float
+    total_cost: float
+
+class CompraResumo(TypedDict):
+    id: int
+    purchase_number: Optional[str]
+    supplier_name: Optional[str]
+    shipping_cost: float
+    total_value: float
+    notes: Optional[str]
+    created_at: Optional[datetime]
+    items: List[ItemCompraResumo]
@@ -0,0 +1,84 @@
+"""
+Geração de SKUs das variações (formato CAT-PRO-COR).
+
+Quando o SKU base já existe, a variação recebe o primeiro sufixo livre
+(CAP-CAP-PRE-1, CAP-CAP-PRE-2, ...). Em vez de testar um candidato por
+consulta, alocar_skus() lê de uma vez, para todos os prefixos pedidos, os
+SKUs já usados (o base e os "base-N") e escolhe os sufixos em memória,
+reservando também os que acabaram de ser alocados para as outras cores do
+mesmo produto.
+
+A coluna full_sku é única: se outra requisição gravar o mesmo SKU entre a
+leitura e o commit, o commit falha em vez de duplicar.
+"""
+from sqlalchemy import or_, select
+
+import models
+
+
+def sku_base(categoria, nome_produto, nome_cor):
+    """CAT-PRO-COR com as 3 primeiras letras de cada parte (ex: CAP-SIL-PRE)"""
+    categoria_abrev = categoria[:3].upper() if categoria else "CAP"
+    produto_abrev = nome_produto[:3].upper() if len(nome_produto) >= 3 else nome_produto.upper()
+    cor_abrev = nome_cor[:3].upper() if len(nome_cor) >= 3 else nome_cor.upper()
+    return f"{categoria_abrev}-{produto_abrev}-{cor_abrev}".replace(" ", "-")
+
+
+def escapar_like(texto):
+    """Texto literal dentro de um padrão LIKE (usar com escape="\\\\")"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def skus_em_uso(db, bases):
+    """Uma consulta: para cada base, os sufixos já usados (0 = o próprio base)"""
+    cv = models.ColorVariation
+    bases = sorted(set(bases))
+    usados = {base: set() for base in bases}
+    if not bases:
+        return usados
+
+    linhas = db.execute(
+        select(cv.full_sku).where(or_(
+            cv.full_sku.in_(bases),
+            *(cv.full_sku.like(f"{escapar_like(base)}-%", escape="\\") for base in bases),
+        ))
+    ).scalars()
+    for sku in linhas:
+        _marcar(usados, sku)
+    return usados
+
+
+def _marcar(usados, sku):
+    """Registra o sku como sufixo usado da base correspondente (se houver)"""
+    if sku in usados:
+        usados[sku].add(0)
+        return
+    base, _, sufixo = sku.rpartition("-")
+    if base in usados and sufixo.isdigit():
+        usados[base].add(int(sufixo))
+
+
+def alocar_skus(db, bases, reservados=()):
+    """
+    Retorna um SKU livre para cada base, na mesma ordem (bases repetidas
+    recebem sufixos diferentes). reservados: SKUs informados manualmente na
+    mesma operação, que também não podem ser usados.
+    """
+    usados = skus_em_uso(db, bases)
+    for sku in reservados:
+        if sku:
+            _marcar(usados, sku)
+
+    # Próximo candidato de cada base: os sufixos abaixo dele já estão ocupados,
+    # então uma base popular é percorrida uma vez por chamada, não uma vez por SKU
+    proximo = {}
+    alocados = []
+    for base in bases:
+        ocupados = usados[base]
+        sufixo = proximo.get(base, 0)
+        while sufixo in ocupados:
+            sufixo += 1
+        ocupados.add(sufixo)
+        proximo[base] = sufixo + 1
+        alocados.append(base if sufixo == 0 else f"{base}-{sufixo}")
+    return alocados
@@ -0,0 +1,222 @@
+"""
+Índice de SKUs em memória.
+
+A busca de produtos na tela de movimentações e a leitura de código de barras
+consultam este índice em vez do banco:
+
+- dicionário full_sku -> variação (GET /api/sku/{sku})
+- árvore de prefixos (trie) sobre as partes do SKU (separadas por "-"), as
+  palavras do nome do produto e as da cor
+  (GET /api/sku/autocomplete?q=)
+
+O índice é montado com uma consulta só (no startup ou na primeira busca) e
+fica por processo. Criar, editar ou excluir produto invalida o índice; ele é
+remontado na próxima busca. Os outros workers são avisados pelo evento
+"catalogo" (events.py). O estoque de cada variação é mantido pelos eventos de
+estoque, sem remontar.
+
+Cada nó da trie guarda a lista completa dos itens abaixo dele (em ordem de
+SKU). Numa busca com várias palavras, a lista da palavra mais seletiva (a
+menor) é percorrida inteira e as outras palavras filtram os candidatos, o
+que dá a interseção das listas; só o resultado final é cortado no limite.
+"""
+import threading
+import unicodedata
+
+from sqlalchemy import select
+
+import models
+from events import barramento_estoque
+
+EVENTO_CATALOGO = "catalogo"
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos ("Câmera" -> "camera")"""
+    if not texto or texto.isascii():
+        return (texto or "").lower()
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def palavras(texto):
+    return [p for p in normalizar(texto).replace("-", " ").split() if p]
+
+
+def evento_catalogo():
+    """Evento publicado nas alterações de produto (invalida o índice em todos os workers)"""
+    return {"tipo": EVENTO_CATALOGO}
+
+
+class _No:
+    __slots__ = ("filhos", "itens")
+
+    def __init__(self):
+        self.filhos = {}
+        self.itens = []
+
+
+class IndiceSku:
+    """Mapa de SKUs + trie de prefixos, trocados por inteiro a cada remontagem"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = 0
+        self._versao_montada = None
+        self._itens = []
+        self._por_sku = {}
+        self._por_variacao = {}
+        self._raiz = _No()
+
+    # ---------------------------------------------------------
+    # Montagem e invalidação
+    # ---------------------------------------------------------
+    def valido(self):
+        return self._versao_montada == self._versao
+
+    def invalidar(self):
+        with self._lock:
+            self._versao += 1
+
+    @property
+    def versao(self):
+        return self._versao
+
+    def construir(self, db):
+        """Lê as variações e troca o índice (Session síncrona). Retorna o total de SKUs."""
+        versao = self._versao
+        return self.montar(self.ler(db), versao)
+
+    @staticmethod
+    def ler(db):
+        """Uma consulta com todas as variações e o nome/categoria do produto"""
+        cv = models.ColorVariation
+        produto = models.Product
+        return db.execute(
+            select(
+                cv.id, cv.product_id, cv.full_sku, cv.color_name, cv.variation_price,
+                cv.available_stock, cv.min_stock_alert,
+                produto.name, produto.category,
+            )
+            .join(produto, produto.id == cv.product_id)
+            .where(cv.full_sku.isnot(None))
+            .order_by(cv.full_sku)
+        ).all()
+
+    def montar(self, linhas, versao):
+        """
+        Monta o índice a partir das linhas de ler() (só CPU; pode rodar em
+        outra thread). versao: valor de self.versao antes da leitura.
+        """
+        itens = []
+        por_sku = {}
+        por_variacao = {}
+        raiz = _No()
+        for linha in linhas:
+            item = {
+                "variation_id": linha.id,
+                "product_id": linha.product_id,
+                "full_sku": linha.full_sku,
+                "product_name": linha.name,
+                "category": linha.category,
+                "color_name": linha.color_name,
+                "variation_price": float(linha.variation_price) if linha.variation_price is not None else 0.0,
+                "available_stock": linha.available_stock or 0,
+                "min_stock_alert": linha.min_stock_alert,
+            }
+            posicao = len(itens)
+            itens.append((item, frozenset(self._termos(item))))
+            por_sku[linha.full_sku.upper()] = posicao
+            por_variacao[linha.id] = posicao
+            for termo in itens[posicao][1]:
+                self._inserir(raiz, termo, posicao)
+
+        with self._lock:
+            self._itens, self._por_sku, self._por_variacao, self._raiz = itens, por_sku, por_variacao, raiz
+            # Uma invalidação durante a leitura deixa o índice para remontar de novo
+            self._versao_montada = versao
+        return len(itens)
+
+    @staticmethod
+    def _termos(item):
+        # O SKU entra por partes: a busca também separa "CAP-SIL-AZU" em "cap sil azu"
+        return {*palavras(item["full_sku"]), *palavras(item["product_name"]), *palavras(item["color_name"])}
+
+    @staticmethod
+    def _inserir(raiz, termo, posicao):
+        no = raiz
+        for letra in termo:
+            filho = no.filhos.get(letra)
+            if filho is None:
+                filho = no.filhos[letra] = _No()
+            no = filho
+            # Termos do mesmo item com prefixo comum (ex: "azul" e "azulado"):
+            # as posições chegam em ordem, então a repetida é sempre a última
+            if not no.itens or no.itens[-1] != posicao:
+                no.itens.append(posicao)
+
+    # ---------------------------------------------------------
+    # Consultas (sem banco)
+    # ---------------------------------------------------------
+    def _estado(self):
+        with self._lock:
+            return self._itens, self._por_sku, self._raiz
+
+    def buscar_sku(self, sku):
+        itens, por_sku, _ = self._estado()
+        posicao = por_sku.get((sku or "").strip().upper())
+        return None if posicao is None else dict(itens[posicao][0])
+
+    @staticmethod
+    def _no(raiz, prefixo):
+        no = raiz
+        for letra in prefixo:
+            no = no.filhos.get(letra)
+            if no is None:
+                return None
+        return no
+
+    def autocompletar(self, consulta, limite=10):
+        termos = palavras(consulta)
+        if not termos:
+            return []
+        itens, _, raiz = self._estado()
+        nos = []
+        for termo in termos:
+            no = self._no(raiz, termo)
+            if no is None:
+                return []
+            nos.append((len(no.itens), termo, no))
+        nos.sort(key=lambda n: n[0])
+        _, _, mais_seletivo = nos[0]
+        outros = [termo for _, termo, _ in nos[1:]]
+
+        resultado = []
+        for posicao in mais_seletivo.itens:
+            item, termos_item = itens[posicao]
+            if all(any(t.startswith(termo) for t in termos_item) for termo in outros):
+                resultado.append(dict(item))
+                if len(resultado) >= limite:
+                    break
+        return resultado
+
+    def status(self):
+        return {"valido": self.valido(), "skus": len(self._itens)}
+
+    # ---------------------------------------------------------
+    # Eventos (events.Barramento)
+    # ---------------------------------------------------------
+    def aplicar_eventos(self, eventos):
+        for evento in eventos:
+            tipo = evento.get("tipo")
+            if tipo == EVENTO_CATALOGO:
+                self.invalidar()
+            elif tipo == "variacao":
+                posicao = self._por_variacao.get(evento.get("variation_id"))
+                if posicao is not None:
+                    self._itens[posicao][0]["available_stock"] = evento["novo_estoque"]
+
+
+# Instância única usada pela aplicação; acompanha os eventos de estoque e de catálogo
+indice_sku = IndiceSku()
+barramento_estoque.registrar(indice_sku.aplicar_eventos)
@@ -0,0 +1,285 @@
+"""
+Movimentação de estoque atômica.
+
+O saldo é alterado por um UPDATE condicional no próprio banco
+(available_stock = available_stock + delta; em saídas e ajustes, só se o
+resultado não ficar negativo), e não lido, calculado em Python e gravado de
+volta. Entradas são sempre aceitas, também sobre um saldo negativo. Duas vendas
+simultâneas do mesmo SKU não perdem atualização nem deixam o estoque
+negativo: a segunda espera a trava da linha e reavalia a condição sobre o
+saldo já atualizado.
+
+No Postgres o UPDATE ... RETURNING e o INSERT do histórico vão em uma única
+instrução (CTE com DML), ou seja, uma ida e volta ao banco. Nos outros
+dialetos são duas instruções na mesma transação (UPDATE ... RETURNING e
+INSERT).
+"""
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import Integer, String, DateTime, case, func, insert, literal, select, true, update
+
+import models
+from dashboard import EstadoVariacao, registrar_alteracoes
+from catalog_version import marcar
+from events import evento_variacao, publicar
+
+TIPOS_MOVIMENTACAO = ("entrada", "saida", "ajuste")
+
+ResultadoMovimento = namedtuple(
+    "ResultadoMovimento", ["variation_id", "estoque_anterior", "novo_estoque", "movimento_id"]
+)
+
+
+class ErroMovimentacao(Exception):
+    """Movimentação recusada; status_code e mensagem vão direto para a resposta"""
+
+    def __init__(self, mensagem, status_code=400):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status_code = status_code
+
+
+def validar_movimento(tipo, quantidade):
+    """Valida tipo e quantidade; levanta ErroMovimentacao se inválidos"""
+    if quantidade is None or quantidade <= 0:
+        raise ErroMovimentacao("Quantidade deve ser maior que zero")
+    if tipo not in TIPOS_MOVIMENTACAO:
+        raise ErroMovimentacao("Tipo de movimentação inválido. Use: 'entrada', 'saida' ou 'ajuste'")
+
+
+def delta_estoque(tipo, quantidade):
+    """Variação do saldo: entrada soma; saída e ajuste (perda/quebra) subtraem"""
+    return quantidade if tipo == "entrada" else -quantidade
+
+
+def mensagem_estoque_insuficiente(tipo):
+    return "Estoque insuficiente para ajuste" if tipo == "ajuste" else "Estoque insuficiente"
+
+
+def _update_condicional(sku, delta, estoque_nulo=False):
+    """
+    UPDATE ... RETURNING do saldo; saídas e ajustes só se ele não ficar negativo.
+    O RETURNING só vê o saldo novo, então cada instrução atinge só variações
+    com saldo (estoque_nulo=False) ou só as com available_stock NULL
+    (estoque_nulo=True, tratado como 0): quem chama sabe qual era o caso.
+    """
+    cv = models.ColorVariation.__table__
+    estoque = func.coalesce(cv.c.available_stock, 0)
+    filtro = [cv.c.full_sku == sku, cv.c.available_stock.is_(None) if estoque_nulo else cv.c.available_stock.isnot(None)]
+    if delta < 0:
+        filtro.append(estoque + delta >= 0)
+    return (
+        update(cv)
+        .where(*filtro)
+        .values(available_stock=estoque + delta)
+        .returning(
+            cv.c.id,
+            cv.c.product_id,
+            (cv.c.available_stock - delta).label("estoque_anterior"),
+            cv.c.available_stock.label("novo_estoque"),
+            cv.c.variation_price,
+            cv.c.cost_price,
+            cv.c.min_stock_alert,
+        )
+    )
+
+
+def _motivo_recusa(db, sku, tipo):
+    """Chamado só quando o UPDATE não alterou nada: SKU inexistente ou saldo insuficiente"""
+    cv = models.ColorVariation.__table__
+    existe = db.execute(select(cv.c.id).where(cv.c.full_sku == sku)).first()
+    if existe is None:
+        return ErroMovimentacao("SKU não encontrado", status_code=404)
+    return ErroMovimentacao(mensagem_estoque_insuficiente(tipo))
+
+
+def movimentar_estoque(db, sku, tipo, quantidade, motivo=None):
+    """
+    Aplica a movimentação e grava o histórico (StockMovement), sem commit.
+    Também aplica o delta no snapshot do dashboard e registra o evento de
+    estoque (enviado às páginas abertas depois do commit).
+    Levanta ErroMovimentacao se o SKU não existir ou o estoque for insuficiente.
+    """
+    validar_movimento(tipo, quantidade)
+    delta = delta_estoque(tipo, quantidade)
+    agora = datetime.datetime.utcnow()
+
+    linha, movimento_id = _aplicar(db, sku, tipo, quantidade, motivo, delta, agora)
+    estoque_nulo = False
+    if linha is None and delta > 0:
+        # Só uma entrada pode alterar um saldo NULL (saída e ajuste sobre 0 são recusados)
+        linha, movimento_id = _aplicar(db, sku, tipo, quantidade, motivo, delta, agora, estoque_nulo=True)
+        estoque_nulo = True
+    if linha is None:
+        raise _motivo_recusa(db, sku, tipo)
+
+    # Preço, custo e mínimo não mudam; só o estoque. Um saldo NULL não conta
+    # como zerado no dashboard (consulta_metricas), então o estado anterior é None
+    anterior = None if estoque_nulo else linha.estoque_anterior
+    antes = EstadoVariacao(linha.variation_price, linha.cost_price, anterior, linha.min_stock_alert)
+    depois = EstadoVariacao(linha.variation_price, linha.cost_price, linha.novo_estoque, linha.min_stock_alert)
+    registrar_alteracoes(db, [(antes, depois)])
+    publicar(db, [evento_variacao(linha.id, linha.product_id, sku, antes, depois)])
+
+    return ResultadoMovimento(linha.id, linha.estoque_anterior, linha.novo_estoque, movimento_id)
+
+
+def _aplicar(db, sku, tipo, quantidade, motivo, delta, agora, estoque_nulo=False):
+    """UPDATE condicional + INSERT do histórico; (linha, movimento_id) ou (None, None) se nada mudou"""
+    sm = models.StockMovement.__table__
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Uma instrução: UPDATE condicional + INSERT do histórico com os valores retornados
+        atualizado = _update_condicional(sku, delta, estoque_nulo).cte("atualizado")
+        movimento = (
+            insert(sm)
+            .from_select(
+                ["variation_id", "movement_type", "quantity", "previous_stock", "new_stock", "reason", "created_at"],
+                select(
+                    atualizado.c.id,
+                    literal(tipo, String),
+                    literal(quantidade, Integer),
+                    atualizado.c.estoque_anterior,
+                    atualizado.c.novo_estoque,
+                    literal(motivo, String),
+                    literal(agora, DateTime),
+                ),
+            )
+            .returning(sm.c.id)
+            .cte("movimento")
+        )
+        linha = db.execute(
+            select(atualizado, movimento.c.id.label("movimento_id"))
+            .select_from(atualizado.outerjoin(movimento, true()))
+        ).first()
+        # O UPDATE vai dentro de um SELECT: avisa a versão do catálogo (catalog_version.py)
+        marcar(db, "color_variations")
+        if linha is None:
+            return None, None
+        return linha, linha.movimento_id
+
+    linha = db.execute(_update_condicional(sku, delta, estoque_nulo)).first()
+    if linha is None:
+        return None, None
+    movimento_id = db.execute(
+        insert(sm).values(
+            variation_id=linha.id,
+            movement_type=tipo,
+            quantity=quantidade,
+            previous_stock=linha.estoque_anterior,
+            new_stock=linha.novo_estoque,
+            reason=motivo,
+            created_at=agora,
+        ).returning(sm.c.id)
+    ).scalar()
+    return linha, movimento_id
+
+
+# =========================================
+# LOTE (sessão de leitura de código de barras)
+# =========================================
+
+LIMITE_LOTE = 1000
+
+
+def movimentar_lote(db, itens):
+    """
+    Aplica uma lista de movimentações (objetos com sku, movement_type,
+    quantity e reason) em uma transação, sem commit.
+
+    - todos os SKUs são resolvidos em um único SELECT ... IN, travando as
+      linhas em ordem de id (ordem determinística: lotes simultâneos não
+      entram em deadlock)
+    - as linhas são aplicadas na ordem recebida sobre os saldos travados;
+      uma linha recusada não impede as outras
+    - o histórico é gravado com um único INSERT de várias linhas e os saldos
+      com um único UPDATE
+
+    Retorna uma lista de resultados, um por linha, na ordem recebida.
+    """
+    cv = models.ColorVariation.__table__
+    sm = models.StockMovement.__table__
+    agora = datetime.datetime.utcnow()
+
+    skus = sorted({item.sku for item in itens})
+    linhas = db.execute(
+        select(
+            cv.c.id, cv.c.product_id, cv.c.full_sku, cv.c.available_stock,
+            cv.c.variation_price, cv.c.cost_price, cv.c.min_stock_alert,
+        )
+        .where(cv.c.full_sku.in_(skus))
+        .order_by(cv.c.id)
+        .with_for_update()
+    ).all() if skus else []
+    variacoes = {linha.full_sku: linha for linha in linhas}
+
+    estoque_inicial = {linha.id: linha.available_stock or 0 for linha in linhas}
+    estoque_atual = dict(estoque_inicial)
+    # Saldos NULL movimentados passam a 0 ou mais, como no movimento individual
+    nulos_movimentados = set()
+    resultados = []
+    historico = []
+
+    for indice, item in enumerate(itens):
+        resultado = {"linha": indice, "sku": item.sku}
+        try:
+            validar_movimento(item.movement_type, item.quantity)
+            variacao = variacoes.get(item.sku)
+            if variacao is None:
+                raise ErroMovimentacao("SKU não encontrado", status_code=404)
+
+            anterior = estoque_atual[variacao.id]
+            delta = delta_estoque(item.movement_type, item.quantity)
+            novo = anterior + delta
+            # Mesma regra do movimento individual: entrada é aceita mesmo sobre saldo negativo
+            if delta < 0 and novo < 0:
+                raise ErroMovimentacao(mensagem_estoque_insuficiente(item.movement_type))
+        except ErroMovimentacao as e:
+            resultado.update({"status": "erro", "status_code": e.status_code, "message": e.mensagem})
+            resultados.append(resultado)
+            continue
+
+        estoque_atual[variacao.id] = novo
+        if variacao.available_stock is None:
+            nulos_movimentados.add(variacao.id)
+        historico.append({
+            "variation_id": variacao.id,
+            "movement_type": item.movement_type,
+            "quantity": item.quantity,
+            "previous_stock": anterior,
+            "new_stock": novo,
+            "reason": item.reason,
+            "created_at": agora,
+        })
+        resultado.update({"status": "sucesso", "estoque_anterior": anterior, "novo_estoque": novo})
+        resultados.append(resultado)
+
+    alterados = {
+        id_: estoque for id_, estoque in estoque_atual.items()
+        if estoque != estoque_inicial[id_] or id_ in nulos_movimentados
+    }
+    if historico:
+        db.execute(insert(sm), historico)
+    if alterados:
+        db.execute(
+            update(cv)
+            .where(cv.c.id.in_(list(alterados)))
+            .values(available_stock=case(alterados, value=cv.c.id))
+        )
+        alteracoes = [
+            (
+                linha,
+                # NULL (não 0) no estado anterior: consulta_metricas não conta saldo NULL como zerado
+                EstadoVariacao(linha.variation_price, linha.cost_price, linha.available_stock, linha.min_stock_alert),
+                EstadoVariacao(linha.variation_price, linha.cost_price, alterados[linha.id], linha.min_stock_alert),
+            )
+            for linha in linhas if linha.id in alterados
+        ]
+        registrar_alteracoes(db, [(antes, depois) for _, antes, depois in alteracoes])
+        publicar(db, [
+            evento_variacao(linha.id, linha.product_id, linha.full_sku, antes, depois)
+            for linha, antes, depois in alteracoes
+        ])
+
+    return resultados